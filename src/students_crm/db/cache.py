@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+MISSING = object()
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class VersionedLRUCache:
+    """Bounded LRU cache whose entries are tagged with the version of the group they belong to.
+
+    A tag is whatever a change is reported for: a template id for homework content, a student
+    id for rendered pages. `bump(tag)` makes every entry of that tag stale at once; stale
+    entries are dropped lazily on the next `get`. `put` is skipped when any bump happened after the caller
+    captured `generation`, so a read racing with an admin edit never caches the old value.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.generation = 0
+        self._entries: OrderedDict[Hashable, tuple[Hashable, int, Any]] = OrderedDict()
+        self._versions: dict[Hashable, int] = {}
+        self._prune_at = max(maxsize, 1)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def version(self, tag: Hashable) -> int:
+        return self._versions.get(tag, 0)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for `key`, or `MISSING` if absent or stale."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            tag, version, value = entry
+            if version == self.version(tag):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+            del self._entries[key]
+        self._misses += 1
+        return MISSING
+
+    def put(self, key: Hashable, tag: Hashable, value: Any, generation: int | None = None) -> None:
+        if self.maxsize <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[key] = (tag, self.version(tag), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def bump(self, tag: Hashable) -> None:
+        """Invalidate everything cached under `tag`."""
+        self._versions[tag] = self.version(tag) + 1
+        self.generation += 1
+        self._invalidations += 1
+        if len(self._versions) > self._prune_at:
+            self._prune_versions()
+
+    def _prune_versions(self) -> None:
+        # A tag without entries needs no version: whatever is cached under it later starts from 0 again.
+        # Racing `put`s are still refused, since `generation` keeps moving.
+        live = {tag for tag, _, _ in self._entries.values()}
+        self._versions = {tag: version for tag, version in self._versions.items() if tag in live}
+        self._prune_at = max(self.maxsize, 1, 2 * len(self._versions))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+        self.generation += 1
+        self._invalidations += 1
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._entries),
+            maxsize=self.maxsize,
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            invalidations=self._invalidations,
+        )
+
+    def reset_stats(self) -> None:
+        self._hits = self._misses = self._evictions = self._invalidations = 0
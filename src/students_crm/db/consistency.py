@@ -0,0 +1,171 @@
+"""Consistency checks for the denormalized read models kept next to the source tables.
+
+    python -m students_crm.db.consistency [--repair]
+"""
+
+import argparse
+import asyncio
+import sys
+from dataclasses import dataclass, field
+
+import aiosqlite as sql
+
+from students_crm.db.pool import open_connection
+from students_crm.utils.constants import DB_PATH
+
+LATEST_ATTEMPT_COLUMNS = (
+    'assignment_id, student_tg_id, question_id, attempt_id, attempt_index, attempt_count, '
+    'answer_text, is_correct, score'
+)
+
+# Latest attempt (highest attempt_index, newest row on ties) and attempt count
+# per (assignment, student, question), computed from homework_assignment_attempts.
+EXPECTED_LATEST_ATTEMPTS = f"""
+    SELECT {LATEST_ATTEMPT_COLUMNS}
+    FROM (
+        SELECT assignment_id,
+               student_tg_id,
+               question_id,
+               id AS attempt_id,
+               attempt_index,
+               COUNT(*) OVER attempts AS attempt_count,
+               answer_text,
+               is_correct,
+               score,
+               ROW_NUMBER() OVER (attempts ORDER BY attempt_index DESC, id DESC) AS position
+        FROM homework_assignment_attempts
+        WINDOW attempts AS (PARTITION BY assignment_id, student_tg_id, question_id)
+    )
+    WHERE position = 1
+"""
+
+
+ASSIGNMENT_COUNTER_COLUMNS = ('question_total', 'answered_count', 'max_attempt_index', 'total_score')
+
+# Counter values of one homework_assignments row, evaluated as a correlated subquery.
+EXPECTED_ASSIGNMENT_COUNTERS = """
+    SELECT (SELECT COUNT(*) FROM homework_questions q WHERE q.assignment_id = homework_assignments.template_id),
+           COUNT(la.question_id),
+           COALESCE(MAX(la.attempt_index), 0),
+           COALESCE(SUM(la.score), 0)
+    FROM homework_latest_attempts la
+    WHERE la.assignment_id = homework_assignments.id
+"""
+
+REFRESH_ASSIGNMENT_COUNTERS = (
+    f'UPDATE homework_assignments SET ({", ".join(ASSIGNMENT_COUNTER_COLUMNS)}) = ({EXPECTED_ASSIGNMENT_COUNTERS})'
+)
+
+# The same counters for all assignments at once, keyed by assignment id.
+EXPECTED_ASSIGNMENT_COUNTER_ROWS = """
+    SELECT a.id,
+           (SELECT COUNT(*) FROM homework_questions q WHERE q.assignment_id = a.template_id),
+           COUNT(la.question_id),
+           COALESCE(MAX(la.attempt_index), 0),
+           COALESCE(SUM(la.score), 0)
+    FROM homework_assignments a
+    LEFT JOIN homework_latest_attempts la ON la.assignment_id = a.id
+    GROUP BY a.id
+"""
+
+
+@dataclass
+class ConsistencyReport:
+    table: str
+    missing: list[tuple] = field(default_factory=list)
+    stale: list[tuple] = field(default_factory=list)
+    orphaned: list[tuple] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.stale or self.orphaned)
+
+    def __str__(self) -> str:
+        if self.ok:
+            return f'{self.table}: consistent'
+        return (
+            f'{self.table}: {len(self.missing)} missing, {len(self.stale)} stale, {len(self.orphaned)} orphaned rows'
+        )
+
+
+async def rebuild_latest_attempts(db: sql.Connection) -> None:
+    """Recompute `homework_latest_attempts` from the attempts table. Does not commit."""
+    await db.execute('DELETE FROM homework_latest_attempts')
+    await db.execute(
+        f'INSERT INTO homework_latest_attempts ({LATEST_ATTEMPT_COLUMNS}) {EXPECTED_LATEST_ATTEMPTS}',
+    )
+
+
+async def refresh_assignment_counters(db: sql.Connection, where: str = '1', params: tuple = ()) -> None:
+    """Recompute the stored progress counters of the assignments matching `where`. Does not commit."""
+    await db.execute(f'{REFRESH_ASSIGNMENT_COUNTERS} WHERE {where}', params)
+
+
+async def check_latest_attempts(db: sql.Connection) -> ConsistencyReport:
+    """Compare `homework_latest_attempts` with what the attempts table implies.
+
+    Returns:
+        ConsistencyReport: Keys of rows that are missing, differ or have no attempts behind them.
+    """
+    expected = {tuple(row[:3]): tuple(row) for row in await db.execute_fetchall(EXPECTED_LATEST_ATTEMPTS)}
+    actual = {
+        tuple(row[:3]): tuple(row)
+        for row in await db.execute_fetchall(f'SELECT {LATEST_ATTEMPT_COLUMNS} FROM homework_latest_attempts')
+    }
+    report = ConsistencyReport('homework_latest_attempts')
+    for key, row in expected.items():
+        if key not in actual:
+            report.missing.append(key)
+        elif actual[key] != row:
+            report.stale.append(key)
+    report.orphaned.extend(key for key in actual if key not in expected)
+    return report
+
+
+async def check_assignment_counters(db: sql.Connection) -> ConsistencyReport:
+    """Compare the stored progress counters of every assignment with the latest-attempt read model.
+
+    Returns:
+        ConsistencyReport: Ids of assignments whose counters differ, listed as stale.
+    """
+    expected = {row[0]: tuple(row[1:]) for row in await db.execute_fetchall(EXPECTED_ASSIGNMENT_COUNTER_ROWS)}
+    actual = await db.execute_fetchall(f'SELECT id, {", ".join(ASSIGNMENT_COUNTER_COLUMNS)} FROM homework_assignments')
+    report = ConsistencyReport('homework_assignments counters')
+    for row in actual:
+        stored, computed = tuple(row[1:]), expected[row[0]]
+        if any(abs(left - right) > 1e-9 for left, right in zip(stored, computed)):
+            report.stale.append((row[0],))
+    return report
+
+
+async def run_checks(db_path: str = DB_PATH, *, repair: bool = False) -> list[ConsistencyReport]:
+    """Check every denormalized read model and optionally rebuild the inconsistent ones.
+
+    Returns:
+        list[ConsistencyReport]: Reports taken before any repair.
+    """
+    db = await open_connection(db_path)
+    try:
+        reports = [await check_latest_attempts(db), await check_assignment_counters(db)]
+        if repair and not all(report.ok for report in reports):
+            await rebuild_latest_attempts(db)
+            await refresh_assignment_counters(db)
+            await db.commit()
+        return reports
+    finally:
+        await db.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Check denormalized homework tables against their sources.')
+    parser.add_argument('--repair', action='store_true', help='rebuild read models that are inconsistent')
+    args = parser.parse_args(argv)
+    reports = asyncio.run(run_checks(repair=args.repair))
+    for report in reports:
+        print(report)
+    if not args.repair and not all(report.ok for report in reports):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Before/after benchmark of the homework hot-path index migration.
+
+Seeds a fully migrated database with the hot-path indexes rolled back to
+their pre-migration state, times the student-facing routines, re-applies the
+index migration and times them again. Timings come from the routine
+instrumentation, so they cover SQL execution only.
+
+    python -m students_crm.db.index_benchmark [--students 10000] [--templates 50] [--samples 200]
+"""
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite as sql
+
+import students_crm.db.routines as r
+from students_crm.db.cache import VersionedLRUCache
+from students_crm.db.migrate import HOT_PATH_INDEXES, MIGRATIONS, run_migrations
+from students_crm.db.query_plan import SEED_STUDENT_TG_ID, question_id, seed_database
+
+INDEX_MIGRATION = 9
+
+
+async def _drop_hot_path_indexes(db: sql.Connection) -> None:
+    for indexes in HOT_PATH_INDEXES.values():
+        for name, _ in indexes:
+            await db.execute(f'DROP INDEX IF EXISTS {name}')
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_attempts_assignment_student '
+        'ON homework_assignment_attempts(assignment_id, student_tg_id)',
+    )
+    await db.commit()
+
+
+async def _workload(samples: int, students: int, templates: int, questions: int, attempts: int) -> None:
+    rng = random.Random(samples)
+    for _ in range(samples):
+        student = rng.randrange(students)
+        template = rng.randint(1, templates)
+        assignment = student * templates + template
+        student_tg_id = SEED_STUDENT_TG_ID + student
+        question = question_id(template, rng.randrange(questions))
+        attempt = rng.randint(1, attempts)
+        await r.list_homework_questions(template)
+        await r.list_homework_question_options(question_id(template, 0))
+        await r.list_homework_question_attachments(question)
+        await r.list_assignment_question_progress(assignment, student_tg_id)
+        await r.get_next_unanswered_question(assignment, student_tg_id)
+        await r.get_attempt_count(assignment, question, student_tg_id)
+        await r.get_latest_attempt_for_question(assignment, question, student_tg_id)
+        await r.get_assignment_question_counts(assignment, student_tg_id)
+        await r.list_attempt_attachments(attempt)
+        await r.list_attempt_option_texts(attempt)
+
+
+async def _measure(db_path: str, *args) -> dict[str, float]:
+    # A cache that stores nothing: every call reaches the database, in both runs alike.
+    cache, r._CACHE = r._CACHE, VersionedLRUCache(maxsize=0)
+    await r.open_db(db_path=db_path)
+    try:
+        r.reset_db_stats()
+        await _workload(*args)
+        return {name: stats.avg_exec_time for name, stats in r.get_db_stats().routines.items()}
+    finally:
+        await r.close_db()
+        r._CACHE = cache
+
+
+async def run(students: int, templates: int, questions: int, samples: int, db_path: str) -> None:
+    async with sql.connect(db_path) as db:
+        await run_migrations(db)
+        await _drop_hot_path_indexes(db)
+    started = time.perf_counter()
+    seed_database(db_path, students, templates, questions)
+    attempts = students * templates * (questions // 2)
+    print(f'Seeded {students} students x {templates} assignments ({attempts} attempts) '
+          f'in {time.perf_counter() - started:.1f} s')  # fmt: skip
+    args = (samples, students, templates, questions, attempts)
+
+    before = await _measure(db_path, *args)
+    started = time.perf_counter()
+    async with sql.connect(db_path) as db:
+        await next(m for m in MIGRATIONS if m.version == INDEX_MIGRATION).apply(db)
+        await db.commit()
+    print(f'Applied index migration in {time.perf_counter() - started:.1f} s')
+    after = await _measure(db_path, *args)
+
+    print(f'{"routine":<36} {"before ms":>10} {"after ms":>10} {"speedup":>9}')
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name] * 1000, after[name] * 1000
+        print(f'{name:<36} {old:>10.3f} {new:>10.3f} {old / new if new else float("inf"):>8.1f}x')
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=10_000)
+    parser.add_argument('--templates', type=int, default=50)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args.students, args.templates, args.questions, args.samples, str(Path(tmp) / 'bench.db')))
+
+
+if __name__ == '__main__':
+    main()
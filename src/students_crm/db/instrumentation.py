@@ -0,0 +1,228 @@
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator
+
+import aiosqlite as sql
+
+
+@dataclass
+class RoutineStats:
+    calls: int = 0
+    errors: int = 0
+    statements: int = 0
+    rows: int = 0
+    acquire_time: float = 0.0
+    exec_time: float = 0.0
+    max_exec_time: float = 0.0
+
+    @property
+    def avg_acquire_time(self) -> float:
+        return self.acquire_time / self.calls if self.calls else 0.0
+
+    @property
+    def avg_exec_time(self) -> float:
+        return self.exec_time / self.calls if self.calls else 0.0
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    routine: str
+    sql: str
+    params: str
+    duration: float
+    at: float
+
+
+@dataclass(frozen=True)
+class InstrumentationSnapshot:
+    routines: dict[str, RoutineStats]
+    slow_queries: list[SlowQuery]
+    slow_query_threshold: float
+
+
+@dataclass
+class _RoutineCall:
+    name: str
+    started: float
+    acquired: float | None = None
+    statements: int = 0
+    rows: int = 0
+    exec_time: float = 0.0
+
+
+def param_shape(params: Any) -> str:
+    """Describe bound parameters by type only, so slow-query logs never carry user data.
+
+    Examples: `(int, str)`, `{id: int}`, `12×(int, str)` for `executemany` batches.
+    """
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    if isinstance(params, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+    return type(params).__name__
+
+
+def _batch_shape(seq: Iterable[Any]) -> tuple[list[Any], str]:
+    rows = list(seq)
+    if not rows:
+        return rows, '0×()'
+    return rows, f'{len(rows)}×{param_shape(rows[0])}'
+
+
+class QueryInstrumentation:
+    """Per-routine call, timing and row counters plus a bounded slow-query log.
+
+    `_with_db` opens a routine call with `routine()`, marks when a connection
+    was obtained with `acquired()` and hands the routine an `InstrumentedConnection`
+    that reports every statement of that call back here.
+    """
+
+    def __init__(self, slow_query_threshold: float = 0.1, slow_query_log_size: int = 100) -> None:
+        self.slow_query_threshold = slow_query_threshold
+        self._routines: dict[str, RoutineStats] = {}
+        self._slow: deque[SlowQuery] = deque(maxlen=slow_query_log_size)
+        self._listeners: list[Callable[[str, str, Any], None]] = []
+
+    @contextmanager
+    def routine(self, name: str) -> Iterator[_RoutineCall]:
+        call = _RoutineCall(name=name, started=time.perf_counter())
+        failed = False
+        try:
+            yield call
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._finish(call, failed)
+
+    def acquired(self, call: _RoutineCall) -> None:
+        if call.acquired is None:
+            call.acquired = time.perf_counter()
+
+    def _finish(self, call: _RoutineCall, failed: bool) -> None:
+        stats = self._routines.setdefault(call.name, RoutineStats())
+        stats.calls += 1
+        stats.errors += failed
+        stats.statements += call.statements
+        stats.rows += call.rows
+        acquired = call.acquired if call.acquired is not None else time.perf_counter()
+        stats.acquire_time += acquired - call.started
+        stats.exec_time += call.exec_time
+        stats.max_exec_time = max(stats.max_exec_time, call.exec_time)
+
+    def record(
+        self,
+        call: _RoutineCall,
+        sql_text: str,
+        params: str,
+        duration: float,
+        rows: int,
+        raw_params: Any = None,
+    ) -> None:
+        routine = call.name
+        call.statements += 1
+        call.rows += rows
+        call.exec_time += duration
+        if self.slow_query_threshold and duration >= self.slow_query_threshold:
+            compact = ' '.join(sql_text.split())
+            self._slow.append(SlowQuery(routine, compact, params, duration, time.time()))
+            logging.log(
+                level=logging.WARNING,
+                msg=f'Slow query in {routine} ({duration * 1000:.1f} ms, params {params}): {compact}',
+            )
+        for listener in self._listeners:
+            listener(routine, sql_text, raw_params)
+
+    def add_listener(self, listener: Callable[[str, str, Any], None]) -> None:
+        """Call `listener(routine, sql, params)` for every statement executed by a routine."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, str, Any], None]) -> None:
+        self._listeners.remove(listener)
+
+    def snapshot(self) -> InstrumentationSnapshot:
+        return InstrumentationSnapshot(
+            routines={name: RoutineStats(**vars(stats)) for name, stats in self._routines.items()},
+            slow_queries=list(self._slow),
+            slow_query_threshold=self.slow_query_threshold,
+        )
+
+    def reset(self) -> None:
+        self._routines.clear()
+        self._slow.clear()
+
+
+class _InstrumentedCursor:
+    """Cursor proxy counting the rows a routine actually fetches."""
+
+    __slots__ = ('_cursor', '_call')
+
+    def __init__(self, cursor: sql.Cursor, call: _RoutineCall) -> None:
+        self._cursor = cursor
+        self._call = call
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def _count(self, rows: int) -> None:
+        self._call.rows += rows
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        self._count(row is not None)
+        return row
+
+    async def fetchmany(self, size: int | None = None):
+        rows = await self._cursor.fetchmany(size) if size is not None else await self._cursor.fetchmany()
+        self._count(len(rows))
+        return rows
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+
+class InstrumentedConnection:
+    """Connection proxy timing `execute`, `executemany` and `execute_fetchall`."""
+
+    __slots__ = ('_db', '_metrics', '_call')
+
+    def __init__(self, db: Any, metrics: QueryInstrumentation, call: _RoutineCall) -> None:
+        object.__setattr__(self, '_db', db)
+        object.__setattr__(self, '_metrics', metrics)
+        object.__setattr__(self, '_call', call)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._db, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._db, name, value)
+
+    async def execute(self, sql_text: str, parameters: Any = None) -> _InstrumentedCursor:
+        started = time.perf_counter()
+        cursor = await self._db.execute(sql_text, parameters)
+        duration = time.perf_counter() - started
+        self._metrics.record(self._call, sql_text, param_shape(parameters), duration, 0, parameters)
+        return _InstrumentedCursor(cursor, self._call)
+
+    async def executemany(self, sql_text: str, parameters: Iterable[Any]) -> Any:
+        rows, shape = _batch_shape(parameters)
+        started = time.perf_counter()
+        cursor = await self._db.executemany(sql_text, rows)
+        self._metrics.record(self._call, sql_text, shape, time.perf_counter() - started, 0, rows[0] if rows else None)
+        return cursor
+
+    async def execute_fetchall(self, sql_text: str, parameters: Any = None) -> Iterable[Any]:
+        started = time.perf_counter()
+        rows = await self._db.execute_fetchall(sql_text, parameters)
+        rows = list(rows)
+        self._metrics.record(
+            self._call, sql_text, param_shape(parameters), time.perf_counter() - started, len(rows), parameters
+        )
+        return rows
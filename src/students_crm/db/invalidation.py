@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable
+
+import aiosqlite as sql
+
+from students_crm.db.pool import READ_ONLY_PRAGMAS, open_connection
+
+ALL_NAMESPACES = '*'
+CHANGE_LOG_RETENTION = '-1 day'
+
+
+@dataclass(frozen=True)
+class InvalidationStats:
+    polls: int
+    changes_seen: int
+    last_change_id: int
+
+
+async def prune_change_log(db: sql.Connection) -> None:
+    """Drop rows older than `CHANGE_LOG_RETENTION`; a process that was away that long starts with an empty cache anyway.
+
+    Meant to run once per writing transaction that logs changes.
+    """
+    await db.execute("DELETE FROM cache_change_log WHERE created_at < datetime('now', ?)", (CHANGE_LOG_RETENTION,))
+
+
+async def log_change(db: sql.Connection, namespace: str, key: int | None = None) -> None:
+    """Record that cached data under `namespace`/`key` changed. Meant to run inside the writing transaction."""
+    await db.execute('INSERT INTO cache_change_log (namespace, key) VALUES (?, ?)', (namespace, key))
+
+
+class InvalidationBus:
+    """Deliver cache invalidations written by any process sharing the database file.
+
+    Writers append to `cache_change_log` in the same transaction as the change.
+    `poll()` runs at most once per `interval`: it asks a dedicated read-only connection
+    for `PRAGMA data_version`, which only moves when another connection committed,
+    and reads new log rows only then. Handlers subscribed to a row's namespace get
+    its key; `*` rows reach every handler with key `None`.
+    """
+
+    def __init__(self, db_path: str, *, interval: float = 1.0) -> None:
+        self.db_path = db_path
+        self.interval = interval
+        self._db: sql.Connection | None = None
+        self._handlers: dict[str, list[Callable[[int | None], None]]] = defaultdict(list)
+        self._data_version: int | None = None
+        self._last_id = 0
+        self._last_poll = 0.0
+        self._polls = 0
+        self._changes = 0
+
+    def subscribe(self, namespace: str, handler: Callable[[int | None], None]) -> None:
+        self._handlers[namespace].append(handler)
+
+    async def start(self) -> None:
+        """Open the bus connection; the database must already be migrated."""
+        if self._db is not None:
+            return
+        self._db = await open_connection(self.db_path, pragmas=READ_ONLY_PRAGMAS)
+        self._data_version = await self._read_data_version()
+        try:
+            rows = await self._db.execute_fetchall('SELECT COALESCE(MAX(id), 0) FROM cache_change_log')
+        except sql.OperationalError as exc:
+            logging.log(level=logging.ERROR, msg=exc)
+            await self.stop()
+            raise RuntimeError('cache_change_log is missing: run the migrations before starting the bus') from exc
+        self._last_id = rows[0][0]
+        self._last_poll = time.monotonic()
+
+    async def stop(self) -> None:
+        db, self._db = self._db, None
+        if db is not None:
+            await db.close()
+
+    async def _read_data_version(self) -> int:
+        rows = await self._db.execute_fetchall('PRAGMA data_version')
+        return rows[0][0]
+
+    async def poll(self, *, force: bool = False) -> int:
+        """Apply invalidations committed since the last poll.
+
+        Returns:
+            int: Number of change log rows delivered.
+        """
+        if self._db is None:
+            return 0
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.interval:
+            return 0
+        self._last_poll = now
+        self._polls += 1
+        try:
+            data_version = await self._read_data_version()
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+            rows = await self._db.execute_fetchall(
+                'SELECT id, namespace, key FROM cache_change_log WHERE id > ? ORDER BY id',
+                (self._last_id,),
+            )
+        except Exception as exc:
+            logging.log(level=logging.ERROR, msg=exc)
+            return 0
+        for change_id, namespace, key in rows:
+            self._last_id = change_id
+            self._dispatch(namespace, key)
+        self._changes += len(rows)
+        return len(rows)
+
+    def _dispatch(self, namespace: str, key: int | None) -> None:
+        if namespace == ALL_NAMESPACES:
+            handlers = [handler for group in self._handlers.values() for handler in group]
+            key = None
+        else:
+            handlers = self._handlers.get(namespace, [])
+        for handler in handlers:
+            handler(key)
+
+    def stats(self) -> InvalidationStats:
+        return InvalidationStats(polls=self._polls, changes_seen=self._changes, last_change_id=self._last_id)
@@ -5,6 +5,7 @@ from typing import Awaitable, Callable
 
 import aiosqlite as sql
 
+from students_crm.db.consistency import rebuild_latest_attempts, refresh_assignment_counters
 from students_crm.db.schemas import db_schemas
 from students_crm.utils.constants import DB_PATH
 
@@ -188,6 +189,116 @@ async def _account_provisioning_table(db: sql.Connection) -> None:
     await db.execute(db_schemas['account_provisioning'])
 
 
+HOT_PATH_INDEXES = {
+    'homework_questions': (
+        ('idx_questions_template_order', '(assignment_id, order_index)'),
+    ),
+    'homework_question_options': (
+        ('idx_question_options_question', '(question_id, position)'),
+    ),
+    'homework_question_attachments': (
+        ('idx_question_attachments_question', '(question_id, position)'),
+    ),
+    'homework_assignments': (
+        ('idx_assignments_template', '(template_id)'),
+        # Status after created_at: lists filtered by several statuses are still read in order, no sort.
+        ('idx_assignments_student_created', '(student_tg_id, created_at, status)'),
+    ),
+    'homework_assignment_attempts': (
+        ('idx_attempts_student_question', '(assignment_id, student_tg_id, question_id, attempt_index)'),
+    ),
+    'homework_attempt_attachments': (
+        ('idx_attempt_attachments_attempt', '(attempt_id, position)'),
+    ),
+    'homework_attempt_options': (
+        ('idx_attempt_options_option', '(option_id)'),
+    ),
+    'homework_assignment_attachments': (
+        ('idx_assignment_attachments_assignment', '(assignment_id, position)'),
+    ),
+    'homework_submissions': (
+        ('idx_submissions_assignment', '(assignment_id)'),
+    ),
+    'homework_submission_attachments': (
+        ('idx_submission_attachments_submission', '(submission_id, position)'),
+    ),
+    'registration_tokens': (
+        ('idx_registration_tokens_expires', '(expires_at)'),
+    ),
+}  # fmt: skip
+
+
+async def _homework_hot_path_indexes(db: sql.Connection) -> None:
+    for table, indexes in HOT_PATH_INDEXES.items():
+        if not await _table_exists(db, table):
+            continue
+        for name, columns in indexes:
+            await db.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table}{columns}')
+    # Superseded by idx_attempts_student_question and idx_assignments_student_created,
+    # which cover the same lookups.
+    await db.execute('DROP INDEX IF EXISTS idx_attempts_assignment_student')
+    await db.execute('DROP INDEX IF EXISTS idx_assignments_student_status')
+
+
+async def _homework_latest_attempts(db: sql.Connection) -> None:
+    await db.execute(db_schemas['homework_latest_attempts'])
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_latest_attempts_attempt ON homework_latest_attempts(attempt_id)',
+    )
+    await rebuild_latest_attempts(db)
+
+
+ASSIGNMENT_COUNTER_COLUMNS = {
+    'question_total': 'INTEGER NOT NULL DEFAULT 0',
+    'answered_count': 'INTEGER NOT NULL DEFAULT 0',
+    'max_attempt_index': 'INTEGER NOT NULL DEFAULT 0',
+    'total_score': 'REAL NOT NULL DEFAULT 0',
+}
+
+
+async def _homework_assignment_counters(db: sql.Connection) -> None:
+    if not await _table_exists(db, 'homework_assignments'):
+        return
+    for column, definition in ASSIGNMENT_COUNTER_COLUMNS.items():
+        if not await _column_exists(db, 'homework_assignments', column):
+            await db.execute(f'ALTER TABLE homework_assignments ADD COLUMN {column} {definition}')
+    await refresh_assignment_counters(db)
+
+
+async def _homework_template_soft_delete(db: sql.Connection) -> None:
+    if not await _table_exists(db, 'homework_templates'):
+        return
+    if not await _column_exists(db, 'homework_templates', 'deleted_at'):
+        await db.execute('ALTER TABLE homework_templates ADD COLUMN deleted_at TEXT')
+    await db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_templates_deleted ON homework_templates(deleted_at) '
+        'WHERE deleted_at IS NOT NULL',
+    )
+    # ON DELETE CASCADE from homework_questions looks the children up by question_id; without these
+    # every purged question scans all attempts.
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_attempts_question ON homework_assignment_attempts(question_id)')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_latest_attempts_question ON homework_latest_attempts(question_id)')
+
+
+async def _cache_change_log(db: sql.Connection) -> None:
+    await db.execute(db_schemas['cache_change_log'])
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_cache_change_log_created ON cache_change_log(created_at)')
+
+
+async def _fsm_storage(db: sql.Connection) -> None:
+    await db.execute(db_schemas['fsm_storage'])
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage(updated_at)')
+
+
+async def _tracked_messages(db: sql.Connection) -> None:
+    await db.execute(db_schemas['tracked_messages'])
+
+
+async def _broadcasts(db: sql.Connection) -> None:
+    await db.execute(db_schemas['broadcast_jobs'])
+    await db.execute(db_schemas['broadcast_recipients'])
+
+
 MIGRATIONS = [
     Migration(1, 'bootstrap_schema', _bootstrap_schema),
     Migration(2, 'homework_status_russian', _homework_status_russian),
@@ -197,10 +308,20 @@ MIGRATIONS = [
     Migration(6, 'homework_question_points', _homework_question_points),
     Migration(7, 'assignment_indexes', _assignment_indexes),
     Migration(8, 'account_provisioning_table', _account_provisioning_table),
+    Migration(9, 'homework_hot_path_indexes', _homework_hot_path_indexes),
+    Migration(10, 'homework_latest_attempts', _homework_latest_attempts),
+    Migration(11, 'homework_assignment_counters', _homework_assignment_counters),
+    Migration(12, 'homework_template_soft_delete', _homework_template_soft_delete),
+    Migration(13, 'cache_change_log', _cache_change_log),
+    Migration(14, 'fsm_storage', _fsm_storage),
+    Migration(15, 'tracked_messages', _tracked_messages),
+    Migration(16, 'broadcasts', _broadcasts),
+    # Adds idx_assignments_student_created to databases that already ran migration 9.
+    Migration(17, 'assignment_list_order_index', _homework_hot_path_indexes),
 ]
 
 
-async def run_migrations(db: sql.Connection) -> list[int]:
+async def run_migrations(db: sql.Connection, target_version: int | None = None) -> list[int]:
     await _ensure_migrations_table(db)
     rows = await db.execute_fetchall('SELECT version FROM schema_migrations')
     applied = {row[0] for row in rows}
@@ -208,6 +329,8 @@ async def run_migrations(db: sql.Connection) -> list[int]:
     for migration in MIGRATIONS:
         if migration.version in applied:
             continue
+        if target_version is not None and migration.version > target_version:
+            break
         await migration.apply(db)
         await db.execute(
             'INSERT INTO schema_migrations (version, name) VALUES (?, ?)',
@@ -41,12 +41,36 @@ HomeworkAssignmentView = namedtuple(
         'template_id',
         'answering_mode',
         'max_attempts',
+        'question_total',
+        'answered_count',
+        'max_attempt_index',
+        'total_score',
     ],
 )
 HomeworkQuestionProgress = namedtuple(
     'HomeworkQuestionProgress',
     ['question_id', 'order_index', 'question_type', 'points', 'attempted', 'is_correct', 'score'],
 )
+AssignmentScreen = namedtuple(
+    'AssignmentScreen',
+    ['assignment', 'question', 'options', 'attachments', 'attempt_count'],
+)
+TemplatePurgeProgress = namedtuple(
+    'TemplatePurgeProgress',
+    ['template_id', 'stage', 'deleted', 'done'],
+)
+FsmRecord = namedtuple(
+    'FsmRecord',
+    ['key', 'state', 'data'],
+)
+BroadcastJob = namedtuple(
+    'BroadcastJob',
+    ['id', 'kind', 'text', 'report_chat_id', 'total', 'cursor', 'delivered', 'failed', 'finished_at'],
+)
+BroadcastRecipient = namedtuple(
+    'BroadcastRecipient',
+    ['position', 'chat_id', 'text'],
+)
 ProvisioningStatus = namedtuple(
     'ProvisioningStatus',
     ['username', 'status', 'error', 'created_at', 'updated_at'],
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import aiosqlite as sql
+
+
+CONNECTION_PRAGMAS = (
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA busy_timeout = 5000',
+)
+
+READ_ONLY_PRAGMAS = ('PRAGMA query_only = ON',)
+
+
+async def configure_connection(db: sql.Connection) -> None:
+    """Apply the per-connection PRAGMAs every routine expects."""
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+
+
+async def open_connection(
+    db_path: str,
+    *,
+    timeout: float = 10,
+    pragmas: tuple[str, ...] = (),
+) -> sql.Connection:
+    """Open and configure a standalone SQLite connection.
+
+    Args:
+        db_path (str): Path to the SQLite database file.
+        timeout (float, optional): sqlite3 lock timeout in seconds. Defaults to 10.
+        pragmas (tuple[str, ...], optional): Extra PRAGMAs applied after `CONNECTION_PRAGMAS`.
+
+    Returns:
+        sql.Connection: Connection with `CONNECTION_PRAGMAS` applied.
+    """
+    db = await sql.connect(db_path, timeout=timeout)
+    try:
+        await configure_connection(db)
+        for pragma in pragmas:
+            await db.execute(pragma)
+    except Exception:
+        await db.close()
+        raise
+    return db
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    size: int
+    idle: int
+    in_use: int
+    acquisitions: int
+    waits: int
+    total_wait: float
+    max_wait: float
+    health_checks: int
+    replaced: int
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.acquisitions if self.acquisitions else 0.0
+
+
+class _PooledConnection:
+    __slots__ = ('db', 'last_used')
+
+    def __init__(self, db: sql.Connection) -> None:
+        self.db = db
+        self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived, pre-configured aiosqlite connections.
+
+    Connections are opened once by `open()` and handed out by `connection()`.
+    Idle connections are health-checked before reuse and transparently replaced
+    when the check fails. The pool is bound to the event loop it was opened on.
+    Pass `READ_ONLY_PRAGMAS` as `pragmas` to build a read lane whose connections
+    refuse writes.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 4,
+        *,
+        health_check_interval: float = 30.0,
+        acquire_timeout: float = 10.0,
+        pragmas: tuple[str, ...] = (),
+    ) -> None:
+        if size < 1:
+            raise ValueError('pool size must be at least 1')
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self._health_check_interval = health_check_interval
+        self._acquire_timeout = acquire_timeout
+        self._idle: asyncio.Queue[_PooledConnection] | None = None
+        self._all: list[_PooledConnection] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._closed = True
+        self._acquisitions = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._health_checks = 0
+        self._replaced = 0
+
+    async def _connect(self) -> sql.Connection:
+        return await open_connection(self.db_path, pragmas=self.pragmas)
+
+    async def open(self) -> None:
+        if not self._closed:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._idle = asyncio.Queue()
+        try:
+            for _ in range(self.size):
+                pooled = _PooledConnection(await self._connect())
+                self._all.append(pooled)
+                self._idle.put_nowait(pooled)
+        except Exception:
+            self._closed = False
+            await self.close()
+            raise
+        self._closed = False
+
+    async def close(self) -> None:
+        """Close idle connections; borrowed ones are closed when they are returned."""
+        if self._closed:
+            return
+        self._closed = True
+        idle, self._idle = self._idle, None
+        while idle is not None and not idle.empty():
+            await self._discard(idle.get_nowait())
+
+    async def _discard(self, pooled: _PooledConnection) -> None:
+        if pooled in self._all:
+            self._all.remove(pooled)
+        try:
+            await pooled.db.close()
+        except Exception as exc:
+            logging.log(level=logging.WARNING, msg=f'Failed to close pooled connection: {exc}')
+
+    def is_usable(self) -> bool:
+        """Return True when the pool is open and bound to the running event loop."""
+        if self._closed:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _acquire(self) -> _PooledConnection:
+        if self._closed or self._idle is None:
+            raise RuntimeError('connection pool is closed')
+        started = time.monotonic()
+        try:
+            pooled = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            self._waits += 1
+            pooled = await asyncio.wait_for(self._idle.get(), timeout=self._acquire_timeout)
+        waited = time.monotonic() - started
+        self._acquisitions += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        if time.monotonic() - pooled.last_used >= self._health_check_interval:
+            pooled = await self._check_health(pooled)
+        return pooled
+
+    async def _check_health(self, pooled: _PooledConnection) -> _PooledConnection:
+        self._health_checks += 1
+        try:
+            await pooled.db.execute_fetchall('SELECT 1')
+            return pooled
+        except Exception as exc:
+            logging.log(level=logging.WARNING, msg=f'Replacing unhealthy pooled connection: {exc}')
+        return await self._replace(pooled)
+
+    async def _replace(self, pooled: _PooledConnection) -> _PooledConnection:
+        try:
+            await pooled.db.close()
+        except Exception:
+            pass
+        try:
+            fresh = _PooledConnection(await self._connect())
+        except Exception:
+            self._all.remove(pooled)
+            raise
+        self._all[self._all.index(pooled)] = fresh
+        self._replaced += 1
+        return fresh
+
+    async def _release(self, pooled: _PooledConnection) -> None:
+        try:
+            if pooled.db.in_transaction:
+                await pooled.db.rollback()
+            pooled.db.row_factory = None
+        except Exception as exc:
+            logging.log(level=logging.WARNING, msg=f'Resetting pooled connection failed: {exc}')
+            try:
+                pooled = await self._replace(pooled)
+            except Exception:
+                return
+        pooled.last_used = time.monotonic()
+        if self._closed or self._idle is None:
+            await self._discard(pooled)
+            return
+        self._idle.put_nowait(pooled)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[sql.Connection]:
+        """Borrow a connection for the duration of the `async with` block."""
+        pooled = await self._acquire()
+        try:
+            yield pooled.db
+        finally:
+            await self._release(pooled)
+
+    def stats(self) -> PoolStats:
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return PoolStats(
+            size=self.size,
+            idle=idle,
+            in_use=len(self._all) - idle,
+            acquisitions=self._acquisitions,
+            waits=self._waits,
+            total_wait=self._total_wait,
+            max_wait=self._max_wait,
+            health_checks=self._health_checks,
+            replaced=self._replaced,
+        )
@@ -0,0 +1,108 @@
+"""Benchmark of deleting a large homework template in one transaction versus in batches.
+
+Seeds a database where one template is assigned to every student, then purges it
+while a concurrent task keeps recording attempts on another template, as bot
+handlers would. Reports the longest single purge transaction and how long the
+concurrent writes had to wait.
+
+    python -m students_crm.db.purge_benchmark [--students 5000] [--questions 20] [--batch-size 500]
+"""
+
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import aiosqlite as sql
+
+import students_crm.db.routines as r
+from students_crm.db.migrate import run_migrations
+from students_crm.db.query_plan import SEED_STUDENT_TG_ID, question_id, seed_database
+
+PURGED_TEMPLATE = 1
+OTHER_TEMPLATE = 2
+SINGLE_TRANSACTION = 1 << 62
+
+
+async def _concurrent_writes(stop: asyncio.Event, students: int, latencies: list[float]) -> None:
+    attempt_index = 1
+    while not stop.is_set():
+        student = attempt_index % students
+        assignment = student * 2 + OTHER_TEMPLATE
+        started = time.perf_counter()
+        await r.record_assignment_attempt(
+            assignment,
+            question_id(OTHER_TEMPLATE, 0),
+            SEED_STUDENT_TG_ID + student,
+            attempt_index + 1,
+            '42',
+            1,
+            1.0,
+        )
+        latencies.append(time.perf_counter() - started)
+        attempt_index += 1
+
+
+async def _measure(db_path: str, students: int, batch_size: int) -> dict[str, float]:
+    await r.open_db(db_path=db_path)
+    try:
+        r.reset_db_stats()
+        latencies: list[float] = []
+        stop = asyncio.Event()
+        writes = asyncio.create_task(_concurrent_writes(stop, students, latencies))
+        started = time.perf_counter()
+        await r.delete_homework_template(PURGED_TEMPLATE)
+        result = await r.purge_homework_template(PURGED_TEMPLATE, batch_size=batch_size)
+        total = time.perf_counter() - started
+        stop.set()
+        await writes
+        batches = r.get_db_stats().routines['purge_homework_template_batch']
+    finally:
+        await r.close_db()
+    if not result:
+        raise RuntimeError(result.message)
+    return {
+        'total s': total,
+        'batches': batches.calls,
+        'longest batch ms': batches.max_exec_time * 1000,
+        'writes': len(latencies),
+        'write p50 ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'write max ms': max(latencies, default=0.0) * 1000,
+    }
+
+
+async def run(students: int, questions: int, batch_size: int, tmp: Path) -> None:
+    seeded = str(tmp / 'seed.db')
+    async with sql.connect(seeded) as db:
+        await run_migrations(db)
+    started = time.perf_counter()
+    seed_database(seeded, students, 2, questions)
+    print(f'Seeded template #{PURGED_TEMPLATE}: {students} assignments, '
+          f'{students * (questions // 2)} attempts in {time.perf_counter() - started:.1f} s')  # fmt: skip
+
+    results = {}
+    for label, size in (('one transaction', SINGLE_TRANSACTION), (f'batches of {batch_size}', batch_size)):
+        db_path = str(tmp / f'{size}.db')
+        shutil.copyfile(seeded, db_path)
+        results[label] = await _measure(db_path, students, size)
+
+    print(f'{"":<18}' + ''.join(f'{label:>20}' for label in results))
+    for metric in next(iter(results.values())):
+        print(f'{metric:<18}' + ''.join(f'{values[metric]:>20.1f}' for values in results.values()))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5_000)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=r.DB_PURGE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args.students, args.questions, args.batch_size, Path(tmp)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""Query-plan regression check for every SQL statement issued by `db.routines`.
+
+Seeds a throwaway database, exercises the routines against it, captures each
+distinct statement through the routine instrumentation and runs
+`EXPLAIN QUERY PLAN` for it. Full table scans and temp B-trees are reported;
+the command exits with status 1 when a statement of a hot routine scans a table.
+
+    python -m students_crm.db.query_plan [--students N] [--templates N] [--questions N]
+"""
+
+import argparse
+import asyncio
+import re
+import sqlite3
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import aiosqlite as sql
+
+import students_crm.db.routines as r
+from students_crm.db.consistency import EXPECTED_LATEST_ATTEMPTS, LATEST_ATTEMPT_COLUMNS, REFRESH_ASSIGNMENT_COUNTERS
+from students_crm.db.migrate import run_migrations
+
+HOT_ROUTINES = frozenset(
+    {
+        'get_assignment_max_attempt_index',
+        'get_assignment_question_counts',
+        'get_assignment_screen',
+        'get_assignment_view',
+        'get_attempt_count',
+        'get_homework_question',
+        'get_latest_attempt_for_question',
+        'get_next_unanswered_question',
+        'list_assignment_max_attempts',
+        'list_assignment_question_progress',
+        'list_attempt_attachments',
+        'list_attempt_option_texts',
+        'list_homework_question_attachments',
+        'list_homework_question_options',
+        'list_homework_questions',
+        'list_student_assignments_by_status',
+        'list_student_assignments_by_statuses',
+        'purge_homework_template_batch',
+        'record_assignment_attempt',
+        'set_assignment_status',
+        'validate_token',
+    }
+)
+
+_ALIAS = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIASES = {
+    'where', 'join', 'left', 'inner', 'cross', 'on', 'order', 'group', 'limit', 'set', 'values', 'select',
+    'using', 'natural', 'outer', 'having', 'union', 'returning', 'default', 'as',
+}  # fmt: skip
+
+
+@dataclass
+class StatementPlan:
+    routine: str
+    sql: str
+    params: Any
+    plan: list[str] = field(default_factory=list)
+    scans: list[str] = field(default_factory=list)
+    temp_btrees: list[str] = field(default_factory=list)
+
+    @property
+    def hot(self) -> bool:
+        return self.routine in HOT_ROUTINES
+
+
+def _aliases(sql_text: str, tables: set[str]) -> dict[str, str]:
+    aliases = {table: table for table in tables}
+    for table, alias in _ALIAS.findall(sql_text):
+        if table in tables and alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def explain(db: sqlite3.Connection, routine: str, sql_text: str, params: Any, tables: set[str]) -> StatementPlan:
+    """Run `EXPLAIN QUERY PLAN` for one statement and classify its plan steps."""
+    result = StatementPlan(routine, ' '.join(sql_text.split()), params)
+    aliases = _aliases(sql_text, tables)
+    for row in db.execute(f'EXPLAIN QUERY PLAN {sql_text}', params if params is not None else ()):
+        detail = row[3]
+        result.plan.append(detail)
+        if detail.startswith('USE TEMP B-TREE'):
+            result.temp_btrees.append(detail)
+            continue
+        words = detail.split()
+        if len(words) == 2 and words[0] == 'SCAN' and aliases.get(words[1]) in tables:
+            result.scans.append(aliases[words[1]])
+    return result
+
+
+SEED_STUDENT_TG_ID = 10_000
+
+
+def question_id(template: int, index: int) -> int:
+    """Question id `seed_database` gives the `index`-th question of `template`."""
+    return template * 1000 + index
+
+
+def seed_database(db_path: str, students: int, templates: int, questions: int) -> None:
+    """Fill a migrated, empty database with a realistic homework workload.
+
+    Every student is assigned every published template and has answered the
+    first half of each assignment's questions. Every third question is an MCQ
+    with four options, every question has an attachment and every fourth
+    attempt carries one too. Ids are deterministic: assignment
+    `student * templates + template`, question `question_id(template, index)`.
+    """
+    attempts = [
+        (student * templates + tpl, question_id(tpl, idx), SEED_STUDENT_TG_ID + student)
+        for student in range(students)
+        for tpl in range(1, templates + 1)
+        for idx in range(questions // 2)
+    ]
+    with sqlite3.connect(db_path) as db:
+        db.executemany(
+            'INSERT INTO users (username, tg_id, tg_username, password_hash) VALUES (?, ?, ?, ?)',
+            ((f'student{idx}', SEED_STUDENT_TG_ID + idx, f'tg_student{idx}', 'x') for idx in range(students)),
+        )
+        db.executemany(
+            'INSERT INTO whitelist (tg_username, invite_code, used) VALUES (?, ?, 1)',
+            ((f'tg_student{idx}', f'CODE{idx}') for idx in range(students)),
+        )
+        db.executemany(
+            'INSERT INTO homework_templates (id, title, is_published) VALUES (?, ?, 1)',
+            ((tpl, f'Template {tpl}') for tpl in range(1, templates + 1)),
+        )
+        db.executemany(
+            'INSERT INTO homework_questions (id, assignment_id, question_type, text, correct_answer, order_index) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                (question_id(tpl, idx), tpl, 'mcq' if idx % 3 == 0 else 'short', f'Q{idx}', '42', idx)
+                for tpl in range(1, templates + 1)
+                for idx in range(questions)
+            ),
+        )
+        db.executemany(
+            'INSERT INTO homework_question_options (question_id, option_text, is_correct, position) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                (question_id(tpl, idx), f'Option {pos}', int(pos == 0), pos)
+                for tpl in range(1, templates + 1)
+                for idx in range(0, questions, 3)
+                for pos in range(4)
+            ),
+        )
+        db.executemany(
+            'INSERT INTO homework_question_attachments (question_id, file_id, file_type, position) '
+            "VALUES (?, 'file', 'photo', 0)",
+            ((question_id(tpl, idx),) for tpl in range(1, templates + 1) for idx in range(questions)),
+        )
+        first_options = dict(
+            db.execute('SELECT question_id, MIN(id) FROM homework_question_options GROUP BY question_id').fetchall()
+        )
+        db.executemany(
+            'INSERT INTO homework_assignments '
+            '(id, template_id, student_tg_id, title, text, soft_deadline, hard_deadline) '
+            "VALUES (?, ?, ?, ?, '', '2030-01-01', '2030-01-02')",
+            (
+                (student * templates + tpl, tpl, SEED_STUDENT_TG_ID + student, f'Template {tpl}')
+                for student in range(students)
+                for tpl in range(1, templates + 1)
+            ),
+        )
+        db.executemany(
+            'INSERT INTO homework_assignment_attempts '
+            '(assignment_id, question_id, student_tg_id, attempt_index, answer_text, is_correct, score) '
+            "VALUES (?, ?, ?, 1, '42', 1, 1)",
+            attempts,
+        )
+        db.executemany(
+            'INSERT INTO homework_attempt_attachments (attempt_id, file_id, file_type, position) '
+            "VALUES (?, 'file', 'photo', 0)",
+            ((attempt_id,) for attempt_id in range(4, len(attempts) + 1, 4)),
+        )
+        db.executemany(
+            'INSERT INTO homework_attempt_options (attempt_id, option_id) VALUES (?, ?)',
+            (
+                (attempt_id, first_options[attempt[1]])
+                for attempt_id, attempt in enumerate(attempts, start=1)
+                if attempt[1] in first_options
+            ),
+        )
+        db.execute(f'INSERT INTO homework_latest_attempts ({LATEST_ATTEMPT_COLUMNS}) {EXPECTED_LATEST_ATTEMPTS}')
+        db.execute(REFRESH_ASSIGNMENT_COUNTERS)
+        db.commit()
+
+
+async def _exercise(templates: int) -> None:
+    student, assignment, template = SEED_STUDENT_TG_ID, 1, 1
+    question, mcq_question = question_id(template, 1), question_id(template, 0)
+    await r.get_invited_users()
+    await r.get_registered_students()
+    await r.list_homework_templates()
+    await r.list_homework_templates(published_only=False, created_by_tg_id=student)
+    await r.get_homework_template(template)
+    await r.get_latest_draft_template(student)
+    await r.list_homework_questions(template)
+    await r.get_homework_question(question)
+    await r.list_homework_question_attachments(question)
+    await r.list_homework_question_options(mcq_question)
+    await r.list_student_assignments_by_status(student, 'Не решено')
+    await r.list_student_assignments_by_statuses(student, ['Не решено', 'На проверке'], 10, 0)
+    await r.get_assignment_view(assignment, student)
+    await r.list_assignment_question_progress(assignment, student)
+    await r.get_next_unanswered_question(assignment, student)
+    await r.get_attempt_count(assignment, question, student)
+    await r.get_latest_attempt_for_question(assignment, question, student)
+    await r.get_assignment_max_attempt_index(assignment, student)
+    await r.list_assignment_max_attempts(student, list(range(1, templates + 1)))
+    await r.get_assignment_question_counts(assignment, student)
+    await r.get_assignment_screen(assignment, student)
+    await r.get_assignment_screen(assignment, student, mcq_question)
+    options = await r.list_homework_question_options(mcq_question)
+    attempt = await r.record_assignment_attempt(
+        assignment,
+        mcq_question,
+        student,
+        2,
+        None,
+        1,
+        1.0,
+        attachments=[('file', 'photo')],
+        selected_option_ids=[options[0].id],
+    )
+    await r.list_attempt_attachments(attempt.data)
+    await r.list_attempt_option_texts(attempt.data)
+    await r.set_assignment_status(assignment, 'На проверке')
+    await r.save_homework_submission(assignment, student, [('file', 'document')], 'answer')
+    await r.save_homework(student, 'Essay', 'text', '2030-01-01', '2030-01-02', [('file', 'photo')])
+
+    created = await r.create_homework_template('Draft', 'description', 'FREE', 3, None)
+    draft = created.data
+    await r.update_homework_template_fields(draft, title='Draft 2', max_attempts=2)
+    added = await r.add_homework_question(draft, 'mcq', 'Question', None, 2.0)
+    await r.update_homework_question_text(added.data, 'Question 2')
+    await r.update_homework_question_answer(added.data, 'answer')
+    await r.update_homework_question_points(added.data, 3.0)
+    await r.replace_homework_question_attachments(added.data, [('file', 'photo')])
+    await r.replace_homework_question_options(added.data, ['a', 'b'])
+    draft_options = await r.list_homework_question_options(added.data)
+    await r.set_homework_question_correct_options(added.data, [draft_options[0].id])
+    await r.publish_homework_template(draft)
+    await r.assign_template_to_student(draft, student, 'Draft 2', '2030-01-01', '2030-01-02')
+    await r.delete_homework_question(added.data)
+    await r.delete_homework_template(draft)
+    await r.purge_homework_template(draft, batch_size=1)
+
+    await r.add_to_whitelist('plan_user', 'PLAN')
+    await r.validate_token_request('plan_user', 'PLAN')
+    await r.insert_registration_token('plan_user', 99, 'plan-token')
+    await r.validate_token('plan-token')
+    await r.register_user('plan_user', 'hash', 'plan-token')
+    await r.get_tg_user_id_by_tg_username('plan_user')
+    await r.get_tg_user_id_by_username('plan_user')
+    await r.upsert_account_provisioning('plan_user', 'queued')
+    await r.get_account_provisioning('plan_user')
+
+    broadcast = await r.create_broadcast_job('announcement', 'text', student, [(student, None), (student + 1, 'own')])
+    await r.get_broadcast_job(broadcast.data)
+    await r.list_broadcast_recipients(broadcast.data, 0, 30)
+    await r.advance_broadcast_job(broadcast.data, 1, 1, 0)
+    await r.list_unfinished_broadcast_jobs()
+    await r.advance_broadcast_job(broadcast.data, 2, 1, 0, finished=True)
+
+
+async def collect_plans(
+    db_path: str,
+    *,
+    students: int = 500,
+    templates: int = 20,
+    questions: int = 10,
+) -> list[StatementPlan]:
+    """Seed `db_path`, exercise the routines against it and explain every captured statement."""
+    captured: dict[tuple[str, str], Any] = {}
+
+    def listener(routine: str, sql_text: str, params: Any) -> None:
+        captured.setdefault((routine, sql_text), params)
+
+    # Migrate before `open_db()`: the invalidation bus it starts reads `cache_change_log`.
+    async with sql.connect(db_path) as db:
+        await run_migrations(db)
+    await r.open_db(db_path=db_path)
+    try:
+        seed_database(db_path, students, templates, questions)
+        r._METRICS.add_listener(listener)
+        try:
+            await _exercise(templates)
+        finally:
+            r._METRICS.remove_listener(listener)
+    finally:
+        await r.close_db()
+
+    with sqlite3.connect(db_path) as db:
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return [explain(db, routine, sql_text, params, tables) for (routine, sql_text), params in captured.items()]
+
+
+def report(plans: list[StatementPlan]) -> int:
+    """Print plans with scans or temp B-trees and return the number of hot-query regressions."""
+    regressions = 0
+    for plan in sorted(plans, key=lambda item: (not item.hot, item.routine)):
+        if not plan.scans and not plan.temp_btrees:
+            continue
+        failing = plan.hot and bool(plan.scans)
+        regressions += failing
+        marker = 'FAIL' if failing else 'warn'
+        print(f'[{marker}] {plan.routine}{" (hot)" if plan.hot else ""}: {plan.sql}')
+        for step in plan.plan:
+            print(f'         {step}')
+    clean = sum(1 for plan in plans if not plan.scans and not plan.temp_btrees)
+    print(f'{len(plans)} statements checked, {clean} clean, {regressions} hot-query scan(s).')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--templates', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=10)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        plans = asyncio.run(
+            collect_plans(
+                str(Path(tmp) / 'query_plan.db'),
+                students=args.students,
+                templates=args.templates,
+                questions=args.questions,
+            )
+        )
+    sys.exit(1 if report(plans) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,19 @@
 import aiosqlite as sql
+import asyncio
+import functools
 import logging
 import sqlite3
+from typing import Any, Awaitable, Callable
+from students_crm.db.cache import MISSING, CacheStats, VersionedLRUCache
+from students_crm.db.consistency import refresh_assignment_counters
+from students_crm.db.instrumentation import InstrumentationSnapshot, InstrumentedConnection, QueryInstrumentation
+from students_crm.db.invalidation import InvalidationBus, InvalidationStats, log_change, prune_change_log
 from students_crm.db.migrate import run_migrations
 from students_crm.db.models import (
+    AssignmentScreen,
+    BroadcastJob,
+    BroadcastRecipient,
+    FsmRecord,
     HomeworkAssignmentView,
     HomeworkAttempt,
     HomeworkAttemptAttachment,
@@ -15,16 +26,343 @@ from students_crm.db.models import (
     ProvisioningStatus,
     Result,
     Student,
+    TemplatePurgeProgress,
 )
-from students_crm.utils.constants import DB_PATH
+from students_crm.db.pool import READ_ONLY_PRAGMAS, ConnectionPool, PoolStats, configure_connection
+from students_crm.db.writer import WriteQueue, WriteQueueStats
+from students_crm.utils.constants import (
+    DB_CACHE_POLL_MS,
+    DB_CACHE_SIZE,
+    DB_PATH,
+    DB_POOL_HEALTH_CHECK_INTERVAL,
+    DB_POOL_SIZE,
+    DB_PURGE_BATCH_SIZE,
+    DB_READ_POOL_SIZE,
+    DB_SLOW_QUERY_MS,
+    DB_WRITE_BATCH_SIZE,
+    DB_WRITE_QUEUE_SIZE,
+)
+
+_POOL: ConnectionPool | None = None
+_READ_POOL: ConnectionPool | None = None
+_WRITER: WriteQueue | None = None
+_BUS: InvalidationBus | None = None
+_METRICS = QueryInstrumentation(slow_query_threshold=DB_SLOW_QUERY_MS / 1000)
+_CACHE = VersionedLRUCache(maxsize=DB_CACHE_SIZE)
+_SUBSCRIBERS: list[tuple[str, Callable[[int | None], None]]] = []
+
+
+def _writes(fn):
+    """Declare a routine helper as a write so `_with_db` routes it through the writer."""
+    fn.db_intent = 'write'
+    return fn
+
+
+def _reads(fn):
+    """Declare a routine helper as read-only so `_with_db` routes it to the read lane."""
+    fn.db_intent = 'read'
+    return fn
 
 
 async def _with_db(fn, *args, **kwargs):
-    async with sql.connect(DB_PATH, timeout=10) as db:
-        await db.execute('PRAGMA foreign_keys = ON')
-        await db.execute('PRAGMA journal_mode = WAL')
-        await db.execute('PRAGMA busy_timeout = 5000')
-        return await fn(db, *args, **kwargs)
+    with _METRICS.routine(fn.__name__.lstrip('_')) as call:
+
+        async def run(db, *run_args, **run_kwargs):
+            _METRICS.acquired(call)
+            return await fn(InstrumentedConnection(db, _METRICS, call), *run_args, **run_kwargs)
+
+        intent = getattr(fn, 'db_intent', None)
+        if intent == 'write':
+            writer = _WRITER
+            if writer is not None and writer.is_usable():
+                return await writer.submit(run, *args, **kwargs)
+        pool = _POOL
+        if intent == 'read' and _READ_POOL is not None and _READ_POOL.is_usable():
+            pool = _READ_POOL
+        if pool is not None and pool.is_usable():
+            async with pool.connection() as db:
+                return await run(db, *args, **kwargs)
+        async with sql.connect(DB_PATH, timeout=10) as db:
+            await configure_connection(db)
+            return await run(db, *args, **kwargs)
+
+
+async def _cached(key: tuple, template_of: Callable[[Any], int], fn, *args):
+    """Serve a homework content read from `_CACHE`, loading and storing it on a miss.
+
+    `template_of(value)` names the template whose version the entry is tagged with.
+    Missing rows (`None`) are not cached.
+    """
+    await poll_cache_invalidation()
+    value = _CACHE.get(key)
+    if value is not MISSING:
+        return value
+    generation = _CACHE.generation
+    value = await _with_db(fn, *args)
+    if value is not None:
+        _CACHE.put(key, template_of(value), value, generation)
+    return value
+
+
+def subscribe_cache_invalidation(namespace: str, handler: Callable[[int | None], None]) -> None:
+    """Call `handler(key)` whenever data under `namespace` changes, in this process or another one.
+
+    Namespaces are `template` (key: template id) and `student` (key: student Telegram id).
+    A key of `None` means everything in the namespace changed.
+    """
+    _SUBSCRIBERS.append((namespace, handler))
+    if _BUS is not None:
+        _BUS.subscribe(namespace, handler)
+
+
+def _notify(namespace: str, key: int | None) -> None:
+    for subscribed, handler in _SUBSCRIBERS:
+        if subscribed == namespace:
+            handler(key)
+
+
+async def poll_cache_invalidation() -> None:
+    """Apply changes other processes logged since the last poll; throttled by the bus interval."""
+    if _BUS is not None:
+        await _BUS.poll()
+
+
+async def _changing(changes: list[tuple[str, int]], fn, *args, **kwargs):
+    """Run a mutating routine and, if it succeeded, notify subscribers of `changes` afterwards.
+
+    The changes are also appended to `cache_change_log` in the routine's transaction, so
+    other processes drop their copies on their next `_BUS` poll. A routine that raises or
+    returns a failed `Result` wrote nothing, so nothing is logged or notified.
+    """
+    if not changes:
+        return await _with_db(fn, *args, **kwargs)
+
+    @functools.wraps(fn)
+    async def logged(db: sql.Connection, *fn_args, **fn_kwargs):
+        result = await fn(db, *fn_args, **fn_kwargs)
+        if isinstance(result, Result) and not result.ok:
+            return result
+        await prune_change_log(db)
+        for namespace, key in changes:
+            await log_change(db, namespace, key)
+        await db.commit()
+        return result
+
+    result = await _with_db(logged, *args, **kwargs)
+    if not isinstance(result, Result) or result.ok:
+        for namespace, key in changes:
+            _notify(namespace, key)
+    return result
+
+
+async def _invalidating(template_id: int | None, fn, *args, **kwargs) -> Result:
+    """Run a mutating routine and drop everything cached for its template afterwards."""
+    return await _changing([('template', template_id)] if template_id is not None else [], fn, *args, **kwargs)
+
+
+def _invalidate_template(template_id: int | None) -> None:
+    if template_id is None:
+        _CACHE.clear()
+    else:
+        _CACHE.bump(template_id)
+
+
+subscribe_cache_invalidation('template', _invalidate_template)
+
+
+async def _question_template_id(question_id: int) -> int | None:
+    question = await get_homework_question(question_id)
+    return question.assignment_id if question else None
+
+
+def get_db_cache_stats() -> CacheStats:
+    """Return size and hit/miss counters of the homework content cache."""
+    return _CACHE.stats()
+
+
+async def open_db_pool(size: int = DB_POOL_SIZE, db_path: str | None = None) -> ConnectionPool:
+    """Open the shared connection pool used by every routine in this module.
+
+    Until the pool is opened (and from event loops other than the one that
+    opened it) routines fall back to a short-lived connection per call.
+
+    Args:
+        size (int, optional): Number of pooled connections. Defaults to `DB_POOL_SIZE`.
+        db_path (str | None, optional): Database file. Defaults to `DB_PATH`.
+
+    Returns:
+        ConnectionPool: The opened pool.
+    """
+    global _POOL
+    if _POOL is not None:
+        return _POOL
+    pool = ConnectionPool(
+        db_path or DB_PATH,
+        size,
+        health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+    )
+    await pool.open()
+    _POOL = pool
+    return pool
+
+
+async def close_db_pool() -> None:
+    """Close the shared connection pool if it is open."""
+    global _POOL
+    pool, _POOL = _POOL, None
+    if pool is not None:
+        await pool.close()
+
+
+def get_db_pool_stats() -> PoolStats | None:
+    """Return acquisition and wait-time counters of the shared pool, if open."""
+    return _POOL.stats() if _POOL is not None else None
+
+
+async def open_db_read_pool(size: int = DB_READ_POOL_SIZE, db_path: str | None = None) -> ConnectionPool:
+    """Open the read lane: `query_only` connections serving routines marked with `_reads`.
+
+    Each read runs on its own WAL snapshot, so readers neither wait for the
+    writer nor for each other.
+
+    Args:
+        size (int, optional): Number of reader connections. Defaults to `DB_READ_POOL_SIZE`.
+        db_path (str | None, optional): Database file. Defaults to `DB_PATH`.
+
+    Returns:
+        ConnectionPool: The opened read pool.
+    """
+    global _READ_POOL
+    if _READ_POOL is not None:
+        return _READ_POOL
+    pool = ConnectionPool(
+        db_path or DB_PATH,
+        size,
+        health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+        pragmas=READ_ONLY_PRAGMAS,
+    )
+    await pool.open()
+    _READ_POOL = pool
+    return pool
+
+
+async def close_db_read_pool() -> None:
+    """Close the read lane if it is open."""
+    global _READ_POOL
+    pool, _READ_POOL = _READ_POOL, None
+    if pool is not None:
+        await pool.close()
+
+
+def get_db_read_pool_stats() -> PoolStats | None:
+    """Return acquisition and wait-time counters of the read lane, if open."""
+    return _READ_POOL.stats() if _READ_POOL is not None else None
+
+
+async def start_db_writer(
+    capacity: int = DB_WRITE_QUEUE_SIZE,
+    max_batch: int = DB_WRITE_BATCH_SIZE,
+    db_path: str | None = None,
+) -> WriteQueue:
+    """Start the single writer task that group-commits routines marked with `_writes`.
+
+    Args:
+        capacity (int, optional): Queued writes before callers are back-pressured.
+        max_batch (int, optional): Most writes committed in one transaction.
+        db_path (str | None, optional): Database file. Defaults to `DB_PATH`.
+
+    Returns:
+        WriteQueue: The running writer.
+    """
+    global _WRITER
+    if _WRITER is not None:
+        return _WRITER
+    writer = WriteQueue(db_path or DB_PATH, capacity=capacity, max_batch=max_batch)
+    await writer.start()
+    _WRITER = writer
+    return writer
+
+
+async def stop_db_writer() -> None:
+    """Flush queued writes and stop the writer task if it is running."""
+    global _WRITER
+    writer, _WRITER = _WRITER, None
+    if writer is not None:
+        await writer.stop()
+
+
+def get_db_writer_stats() -> WriteQueueStats | None:
+    """Return queue depth, batch size and backpressure counters of the writer, if running."""
+    return _WRITER.stats() if _WRITER is not None else None
+
+
+async def start_cache_invalidation(
+    interval: float = DB_CACHE_POLL_MS / 1000,
+    db_path: str | None = None,
+) -> InvalidationBus:
+    """Start following `cache_change_log` so writes from other processes reach the subscribed caches.
+
+    Args:
+        interval (float, optional): Least time in seconds between two polls.
+        db_path (str | None, optional): Database file. Defaults to `DB_PATH`.
+
+    Returns:
+        InvalidationBus: The running bus.
+    """
+    global _BUS
+    if _BUS is not None:
+        return _BUS
+    bus = InvalidationBus(db_path or DB_PATH, interval=interval)
+    for namespace, handler in _SUBSCRIBERS:
+        bus.subscribe(namespace, handler)
+    await bus.start()
+    _BUS = bus
+    return bus
+
+
+async def stop_cache_invalidation() -> None:
+    global _BUS
+    bus, _BUS = _BUS, None
+    if bus is not None:
+        await bus.stop()
+
+
+def get_cache_invalidation_stats() -> InvalidationStats | None:
+    return _BUS.stats() if _BUS is not None else None
+
+
+async def open_db(db_path: str | None = None) -> None:
+    """Open the connection pool, the read lane, the writer and the cache invalidation bus for this process.
+
+    The database must be migrated first (`init_db()`); otherwise nothing is left open and `RuntimeError` is raised.
+    """
+    try:
+        await open_db_pool(db_path=db_path)
+        await open_db_read_pool(db_path=db_path)
+        await start_db_writer(db_path=db_path)
+        await start_cache_invalidation(db_path=db_path)
+    except Exception:
+        await close_db()
+        raise
+
+
+def get_db_stats() -> InstrumentationSnapshot:
+    """Return per-routine call, acquire, execution and row counters plus recent slow queries."""
+    return _METRICS.snapshot()
+
+
+def reset_db_stats() -> None:
+    """Forget all routine counters, slow queries and cache hit/miss counters collected so far."""
+    _METRICS.reset()
+    _CACHE.reset_stats()
+
+
+async def close_db() -> None:
+    """Stop the invalidation bus and the writer and close the read lane and the connection pool."""
+    await stop_cache_invalidation()
+    await stop_db_writer()
+    await close_db_read_pool()
+    await close_db_pool()
 
 
 async def _init_db(db: sql.Connection):
@@ -44,6 +382,7 @@ async def init_db():
     return await _with_db(_init_db)
 
 
+@_reads
 async def _get_invited_users(db: sql.Connection) -> list[Invite]:
     rows = await db.execute_fetchall('SELECT tg_username, invite_code FROM whitelist WHERE used = 0')
     return [Invite(tg_username=row[0], invite_code=row[1]) for row in rows]
@@ -68,6 +407,7 @@ async def get_invited_useres() -> list[Invite]:
     return await get_invited_users()
 
 
+@_reads
 async def _get_registered_students(db: sql.Connection) -> list[Student]:
     rows = await db.execute_fetchall(
         'SELECT username, tg_username, tg_id FROM users ORDER BY username',
@@ -80,6 +420,7 @@ async def get_registered_students() -> list[Student]:
     return await _with_db(_get_registered_students)
 
 
+@_writes
 async def _create_homework_template(
     db: sql.Connection,
     title: str,
@@ -121,6 +462,7 @@ async def create_homework_template(
     )
 
 
+@_reads
 async def _get_latest_draft_template(
     db: sql.Connection,
     created_by_tg_id: int,
@@ -129,7 +471,7 @@ async def _get_latest_draft_template(
         """
         SELECT id, title, description, answering_mode, max_attempts, is_published
         FROM homework_templates
-        WHERE created_by_tg_id = ? AND is_published = 0
+        WHERE created_by_tg_id = ? AND is_published = 0 AND deleted_at IS NULL
         ORDER BY created_at DESC
         LIMIT 1
         """,
@@ -145,12 +487,13 @@ async def get_latest_draft_template(created_by_tg_id: int) -> HomeworkTemplate |
     return await _with_db(_get_latest_draft_template, created_by_tg_id)
 
 
+@_reads
 async def _get_homework_template(db: sql.Connection, template_id: int) -> HomeworkTemplate | None:
     rows = await db.execute_fetchall(
         """
         SELECT id, title, description, answering_mode, max_attempts, is_published
         FROM homework_templates
-        WHERE id = ?
+        WHERE id = ? AND deleted_at IS NULL
         """,
         (template_id,),
     )
@@ -160,23 +503,24 @@ async def _get_homework_template(db: sql.Connection, template_id: int) -> Homewo
 
 
 async def get_homework_template(template_id: int) -> HomeworkTemplate | None:
-    return await _with_db(_get_homework_template, template_id)
+    return await _cached(('template', template_id), lambda template: template.id, _get_homework_template, template_id)
 
 
+@_reads
 async def _list_homework_templates(
     db: sql.Connection,
     *,
     published_only: bool = True,
     created_by_tg_id: int | None = None,
 ) -> list[HomeworkTemplate]:
-    conditions = []
+    conditions = ['deleted_at IS NULL']
     params: list[object] = []
     if published_only:
         conditions.append('is_published = 1')
     if created_by_tg_id is not None:
         conditions.append('created_by_tg_id = ?')
         params.append(created_by_tg_id)
-    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    where_clause = f"WHERE {' AND '.join(conditions)}"
     rows = await db.execute_fetchall(
         f"""
         SELECT id, title, description, answering_mode, max_attempts, is_published
@@ -197,6 +541,7 @@ async def list_homework_templates(
     return await _with_db(_list_homework_templates, published_only=published_only, created_by_tg_id=created_by_tg_id)
 
 
+@_reads
 async def _list_assignment_question_progress(
     db: sql.Connection,
     assignment_id: int,
@@ -212,23 +557,12 @@ async def _list_assignment_question_progress(
                a.is_correct,
                a.score
         FROM homework_questions q
-        LEFT JOIN (
-            SELECT ha.question_id, ha.attempt_index, ha.is_correct, ha.score
-            FROM homework_assignment_attempts ha
-            JOIN (
-                SELECT question_id, MAX(attempt_index) AS max_attempt
-                FROM homework_assignment_attempts
-                WHERE assignment_id = ? AND student_tg_id = ?
-                GROUP BY question_id
-            ) latest
-              ON latest.question_id = ha.question_id
-             AND latest.max_attempt = ha.attempt_index
-            WHERE ha.assignment_id = ? AND ha.student_tg_id = ?
-        ) a ON a.question_id = q.id
+        LEFT JOIN homework_latest_attempts a
+          ON a.assignment_id = ? AND a.student_tg_id = ? AND a.question_id = q.id
         WHERE q.assignment_id = (SELECT template_id FROM homework_assignments WHERE id = ?)
         ORDER BY q.order_index
         """,
-        (assignment_id, student_tg_id, assignment_id, student_tg_id, assignment_id),
+        (assignment_id, student_tg_id, assignment_id),
     )
     progress: list[HomeworkQuestionProgress] = []
     for row in rows:
@@ -254,112 +588,133 @@ async def list_assignment_question_progress(
     return await _with_db(_list_assignment_question_progress, assignment_id, student_tg_id)
 
 
+@_writes
 async def _delete_homework_template(db: sql.Connection, template_id: int) -> Result:
     try:
-        await db.execute(
-            """
-            DELETE FROM homework_attempt_options
-            WHERE attempt_id IN (
-                SELECT id FROM homework_assignment_attempts
-                WHERE assignment_id IN (
-                    SELECT id FROM homework_assignments WHERE template_id = ?
-                )
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_attempt_attachments
-            WHERE attempt_id IN (
-                SELECT id FROM homework_assignment_attempts
-                WHERE assignment_id IN (
-                    SELECT id FROM homework_assignments WHERE template_id = ?
-                )
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_assignment_attempts
-            WHERE assignment_id IN (
-                SELECT id FROM homework_assignments WHERE template_id = ?
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_submission_attachments
-            WHERE submission_id IN (
-                SELECT id FROM homework_submissions
-                WHERE assignment_id IN (
-                    SELECT id FROM homework_assignments WHERE template_id = ?
-                )
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_submissions
-            WHERE assignment_id IN (
-                SELECT id FROM homework_assignments WHERE template_id = ?
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_assignment_attachments
-            WHERE assignment_id IN (
-                SELECT id FROM homework_assignments WHERE template_id = ?
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
-            "DELETE FROM homework_assignments WHERE template_id = ?",
-            (template_id,),
-        )
-        await db.execute(
-            """
-            DELETE FROM homework_question_attachments
-            WHERE question_id IN (
-                SELECT id FROM homework_questions WHERE assignment_id = ?
-            )
-            """,
-            (template_id,),
-        )
-        await db.execute(
+        cursor = await db.execute(
             """
-            DELETE FROM homework_question_options
-            WHERE question_id IN (
-                SELECT id FROM homework_questions WHERE assignment_id = ?
-            )
+            UPDATE homework_templates
+            SET deleted_at = datetime('now'), is_published = 0
+            WHERE id = ? AND deleted_at IS NULL
             """,
             (template_id,),
         )
-        await db.execute(
-            "DELETE FROM homework_questions WHERE assignment_id = ?",
-            (template_id,),
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    if not cursor.rowcount:
+        return Result(False, 'Шаблон задания не найден')
+    return Result(True, None)
+
+
+async def delete_homework_template(template_id: int) -> Result:
+    """Hide a template and its assignments at once; `purge_homework_template` removes the rows later."""
+    return await _invalidating(template_id, _delete_homework_template, template_id)
+
+
+# Dependents of a deleted template, removed in this order. Everything hanging off these rows
+# (attempt options and attachments, latest attempts, submissions, question options and attachments)
+# goes with them through ON DELETE CASCADE.
+TEMPLATE_PURGE_STAGES = (
+    (
+        'attempts',
+        """
+        DELETE FROM homework_assignment_attempts
+        WHERE id IN (
+            SELECT at.id
+            FROM homework_assignments a
+            JOIN homework_assignment_attempts at ON at.assignment_id = a.id
+            WHERE a.template_id = ?
+            LIMIT ?
         )
-        await db.execute(
-            "DELETE FROM homework_templates WHERE id = ?",
+        """,
+    ),
+    (
+        'assignments',
+        """
+        DELETE FROM homework_assignments
+        WHERE id IN (SELECT id FROM homework_assignments WHERE template_id = ? LIMIT ?)
+        """,
+    ),
+    (
+        'questions',
+        """
+        DELETE FROM homework_questions
+        WHERE id IN (SELECT id FROM homework_questions WHERE assignment_id = ? LIMIT ?)
+        """,
+    ),
+)
+
+
+@_writes
+async def _purge_homework_template_batch(db: sql.Connection, template_id: int, batch_size: int) -> Result:
+    try:
+        rows = await db.execute_fetchall(
+            'SELECT 1 FROM homework_templates WHERE id = ? AND deleted_at IS NOT NULL',
             (template_id,),
         )
+        if not rows:
+            return Result(False, 'Шаблон не помечен на удаление')
+        for stage, statement in TEMPLATE_PURGE_STAGES:
+            cursor = await db.execute(statement, (template_id, batch_size))
+            if cursor.rowcount:
+                await db.commit()
+                return Result(True, None, TemplatePurgeProgress(template_id, stage, cursor.rowcount, False))
+        await db.execute('DELETE FROM homework_templates WHERE id = ?', (template_id,))
+        await prune_change_log(db)
+        await log_change(db, 'template', template_id)
         await db.commit()
     except Exception as exc:
         logging.log(level=logging.ERROR, msg=exc)
         return Result(False, str(exc))
-    return Result(True, None)
+    return Result(True, None, TemplatePurgeProgress(template_id, 'template', 1, True))
 
 
-async def delete_homework_template(template_id: int) -> Result:
-    return await _with_db(_delete_homework_template, template_id)
+async def purge_homework_template(
+    template_id: int,
+    batch_size: int = DB_PURGE_BATCH_SIZE,
+    on_progress: Callable[[TemplatePurgeProgress], Awaitable[None]] | None = None,
+) -> Result:
+    """Delete the rows of a soft-deleted template in bounded batches.
+
+    Every batch is a separate write, so handlers queued in between are not held up
+    by one long transaction.
+
+    Args:
+        template_id (int): Template previously passed to `delete_homework_template`.
+        batch_size (int, optional): Rows deleted per batch. Defaults to `DB_PURGE_BATCH_SIZE`.
+        on_progress (Callable, optional): Awaited after every batch.
+
+    Returns:
+        Result: `data` maps each stage to the number of rows deleted.
+    """
+    deleted: dict[str, int] = {}
+    while True:
+        result = await _with_db(_purge_homework_template_batch, template_id, batch_size)
+        if not result:
+            return Result(False, result.message, deleted)
+        progress = result.data
+        deleted[progress.stage] = deleted.get(progress.stage, 0) + progress.deleted
+        if on_progress is not None:
+            await on_progress(progress)
+        if progress.done:
+            _notify('template', template_id)
+            return Result(True, None, deleted)
+        await asyncio.sleep(0)
+
+
+@_reads
+async def _list_pending_template_purges(db: sql.Connection) -> list[int]:
+    rows = await db.execute_fetchall('SELECT id FROM homework_templates WHERE deleted_at IS NOT NULL ORDER BY id')
+    return [row[0] for row in rows]
+
+
+async def list_pending_template_purges() -> list[int]:
+    return await _with_db(_list_pending_template_purges)
 
 
+@_writes
 async def _publish_homework_template(db: sql.Connection, template_id: int) -> Result:
     try:
         await db.execute(
@@ -374,9 +729,10 @@ async def _publish_homework_template(db: sql.Connection, template_id: int) -> Re
 
 
 async def publish_homework_template(template_id: int) -> Result:
-    return await _with_db(_publish_homework_template, template_id)
+    return await _invalidating(template_id, _publish_homework_template, template_id)
 
 
+@_writes
 async def _update_homework_template_fields(
     db: sql.Connection,
     template_id: int,
@@ -423,7 +779,8 @@ async def update_homework_template_fields(
     answering_mode: str | None = None,
     max_attempts: int | None = None,
 ) -> Result:
-    return await _with_db(
+    return await _invalidating(
+        template_id,
         _update_homework_template_fields,
         template_id,
         title=title,
@@ -433,6 +790,7 @@ async def update_homework_template_fields(
     )
 
 
+@_writes
 async def _add_homework_question(
     db: sql.Connection,
     template_id: int,
@@ -455,6 +813,10 @@ async def _add_homework_question(
             """,
             (template_id, question_type, text, correct_answer, points, order_index),
         )
+        await db.execute(
+            'UPDATE homework_assignments SET question_total = question_total + 1 WHERE template_id = ?',
+            (template_id,),
+        )
         await db.commit()
     except Exception as exc:
         logging.log(level=logging.ERROR, msg=exc)
@@ -469,9 +831,18 @@ async def add_homework_question(
     correct_answer: str | None = None,
     points: float = 1.0,
 ) -> Result:
-    return await _with_db(_add_homework_question, template_id, question_type, text, correct_answer, points)
+    return await _invalidating(
+        template_id,
+        _add_homework_question,
+        template_id,
+        question_type,
+        text,
+        correct_answer,
+        points,
+    )
 
 
+@_reads
 async def _get_homework_question(db: sql.Connection, question_id: int) -> HomeworkQuestion | None:
     rows = await db.execute_fetchall(
         """
@@ -487,9 +858,15 @@ async def _get_homework_question(db: sql.Connection, question_id: int) -> Homewo
 
 
 async def get_homework_question(question_id: int) -> HomeworkQuestion | None:
-    return await _with_db(_get_homework_question, question_id)
+    return await _cached(
+        ('question', question_id),
+        lambda question: question.assignment_id,
+        _get_homework_question,
+        question_id,
+    )
 
 
+@_reads
 async def _list_homework_questions(db: sql.Connection, template_id: int) -> list[HomeworkQuestion]:
     rows = await db.execute_fetchall(
         """
@@ -504,9 +881,10 @@ async def _list_homework_questions(db: sql.Connection, template_id: int) -> list
 
 
 async def list_homework_questions(template_id: int) -> list[HomeworkQuestion]:
-    return await _with_db(_list_homework_questions, template_id)
+    return list(await _cached(('questions', template_id), lambda _: template_id, _list_homework_questions, template_id))
 
 
+@_writes
 async def _update_homework_question_text(db: sql.Connection, question_id: int, text: str) -> Result:
     try:
         await db.execute(
@@ -521,9 +899,15 @@ async def _update_homework_question_text(db: sql.Connection, question_id: int, t
 
 
 async def update_homework_question_text(question_id: int, text: str) -> Result:
-    return await _with_db(_update_homework_question_text, question_id, text)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _update_homework_question_text,
+        question_id,
+        text,
+    )
 
 
+@_writes
 async def _update_homework_question_answer(db: sql.Connection, question_id: int, correct_answer: str | None) -> Result:
     try:
         await db.execute(
@@ -538,9 +922,15 @@ async def _update_homework_question_answer(db: sql.Connection, question_id: int,
 
 
 async def update_homework_question_answer(question_id: int, correct_answer: str | None) -> Result:
-    return await _with_db(_update_homework_question_answer, question_id, correct_answer)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _update_homework_question_answer,
+        question_id,
+        correct_answer,
+    )
 
 
+@_writes
 async def _update_homework_question_points(db: sql.Connection, question_id: int, points: float) -> Result:
     try:
         await db.execute(
@@ -555,9 +945,15 @@ async def _update_homework_question_points(db: sql.Connection, question_id: int,
 
 
 async def update_homework_question_points(question_id: int, points: float) -> Result:
-    return await _with_db(_update_homework_question_points, question_id, points)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _update_homework_question_points,
+        question_id,
+        points,
+    )
 
 
+@_writes
 async def _delete_homework_question(db: sql.Connection, question_id: int) -> Result:
     try:
         rows = await db.execute_fetchall(
@@ -576,6 +972,7 @@ async def _delete_homework_question(db: sql.Connection, question_id: int) -> Res
             """,
             (assignment_id, order_index),
         )
+        await refresh_assignment_counters(db, 'template_id = ?', (assignment_id,))
         await db.commit()
     except Exception as exc:
         logging.log(level=logging.ERROR, msg=exc)
@@ -584,9 +981,10 @@ async def _delete_homework_question(db: sql.Connection, question_id: int) -> Res
 
 
 async def delete_homework_question(question_id: int) -> Result:
-    return await _with_db(_delete_homework_question, question_id)
+    return await _invalidating(await _question_template_id(question_id), _delete_homework_question, question_id)
 
 
+@_writes
 async def _replace_homework_question_attachments(
     db: sql.Connection,
     question_id: int,
@@ -619,9 +1017,15 @@ async def replace_homework_question_attachments(
     question_id: int,
     attachments: list[tuple[str, str]],
 ) -> Result:
-    return await _with_db(_replace_homework_question_attachments, question_id, attachments)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _replace_homework_question_attachments,
+        question_id,
+        attachments,
+    )
 
 
+@_reads
 async def _list_homework_question_attachments(
     db: sql.Connection,
     question_id: int,
@@ -639,9 +1043,20 @@ async def _list_homework_question_attachments(
 
 
 async def list_homework_question_attachments(question_id: int) -> list[HomeworkQuestionAttachment]:
-    return await _with_db(_list_homework_question_attachments, question_id)
+    template_id = await _question_template_id(question_id)
+    if template_id is None:
+        return []
+    return list(
+        await _cached(
+            ('question_attachments', question_id),
+            lambda _: template_id,
+            _list_homework_question_attachments,
+            question_id,
+        )
+    )
 
 
+@_writes
 async def _replace_homework_question_options(
     db: sql.Connection,
     question_id: int,
@@ -671,9 +1086,15 @@ async def _replace_homework_question_options(
 
 
 async def replace_homework_question_options(question_id: int, options: list[str]) -> Result:
-    return await _with_db(_replace_homework_question_options, question_id, options)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _replace_homework_question_options,
+        question_id,
+        options,
+    )
 
 
+@_writes
 async def _set_homework_question_correct_options(
     db: sql.Connection,
     question_id: int,
@@ -700,9 +1121,15 @@ async def set_homework_question_correct_options(
     question_id: int,
     correct_option_ids: list[int],
 ) -> Result:
-    return await _with_db(_set_homework_question_correct_options, question_id, correct_option_ids)
+    return await _invalidating(
+        await _question_template_id(question_id),
+        _set_homework_question_correct_options,
+        question_id,
+        correct_option_ids,
+    )
 
 
+@_reads
 async def _list_homework_question_options(db: sql.Connection, question_id: int) -> list[HomeworkOption]:
     rows = await db.execute_fetchall(
         """
@@ -717,9 +1144,20 @@ async def _list_homework_question_options(db: sql.Connection, question_id: int)
 
 
 async def list_homework_question_options(question_id: int) -> list[HomeworkOption]:
-    return await _with_db(_list_homework_question_options, question_id)
+    template_id = await _question_template_id(question_id)
+    if template_id is None:
+        return []
+    return list(
+        await _cached(
+            ('question_options', question_id),
+            lambda _: template_id,
+            _list_homework_question_options,
+            question_id,
+        )
+    )
 
 
+@_writes
 async def _register_user(
     db: sql.Connection,
     username: str,
@@ -762,6 +1200,7 @@ async def register_user(username: str, password_hash: str, token: str) -> Result
     return await _with_db(_register_user, username, password_hash, token)
 
 
+@_reads
 async def _validate_token(db: sql.Connection, token: str) -> tuple[str, int] | None:
     db.row_factory = sql.Row
     rows = tuple(
@@ -793,6 +1232,7 @@ async def validate_token(token: str) -> tuple[str, int] | None:
     return await _with_db(_validate_token, token)
 
 
+@_writes
 async def _insert_registration_token(
     db: sql.Connection,
     tg_username: str,
@@ -842,6 +1282,7 @@ async def insert_registrarion_token(tg_username: str, tg_id: int, token: str, gr
     return await insert_registration_token(tg_username, tg_id, token, grace_period)
 
 
+@_reads
 async def _validate_token_request(
     db: sql.Connection,
     tg_username: str,
@@ -875,6 +1316,7 @@ async def validate_token_request(tg_username: str, invite_code: str) -> Result:
     return await _with_db(_validate_token_request, tg_username, invite_code)
 
 
+@_writes
 async def _add_to_whitelist(
     db: sql.Connection,
     tg_username: str,
@@ -898,6 +1340,7 @@ async def add_to_whitelist(tg_username: str, invite_code: str) -> Result:
     return await _with_db(_add_to_whitelist, tg_username, invite_code)
 
 
+@_writes
 async def _assign_template_to_student(
     db: sql.Connection,
     template_id: int,
@@ -908,7 +1351,7 @@ async def _assign_template_to_student(
 ) -> Result:
     try:
         template_rows = await db.execute_fetchall(
-            'SELECT description FROM homework_templates WHERE id = ? AND is_published = 1',
+            'SELECT description FROM homework_templates WHERE id = ? AND is_published = 1 AND deleted_at IS NULL',
             (template_id,),
         )
         if not template_rows:
@@ -917,10 +1360,10 @@ async def _assign_template_to_student(
         cursor = await db.execute(
             """
             INSERT INTO homework_assignments (
-                template_id, student_tg_id, title, text, soft_deadline, hard_deadline, status
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                template_id, student_tg_id, title, text, soft_deadline, hard_deadline, status, question_total
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COUNT(*) FROM homework_questions WHERE assignment_id = ?))
             """,
-            (template_id, student_tg_id, title, description, soft_deadline, hard_deadline, 'Не решено'),
+            (template_id, student_tg_id, title, description, soft_deadline, hard_deadline, 'Не решено', template_id),
         )
         await db.commit()
     except Exception as exc:
@@ -936,7 +1379,8 @@ async def assign_template_to_student(
     soft_deadline: str,
     hard_deadline: str,
 ) -> Result:
-    return await _with_db(
+    return await _changing(
+        [('student', student_tg_id)],
         _assign_template_to_student,
         template_id,
         student_tg_id,
@@ -946,6 +1390,7 @@ async def assign_template_to_student(
     )
 
 
+@_reads
 async def _list_student_assignments_by_status(
     db: sql.Connection,
     student_tg_id: int,
@@ -954,10 +1399,11 @@ async def _list_student_assignments_by_status(
     rows = await db.execute_fetchall(
         """
         SELECT a.id, a.title, a.text, a.soft_deadline, a.hard_deadline, a.status,
-               a.template_id, t.answering_mode, t.max_attempts
+               a.template_id, t.answering_mode, t.max_attempts,
+               a.question_total, a.answered_count, a.max_attempt_index, a.total_score
         FROM homework_assignments a
         LEFT JOIN homework_templates t ON a.template_id = t.id
-        WHERE a.student_tg_id = ? AND a.status = ?
+        WHERE a.student_tg_id = ? AND a.status = ? AND t.deleted_at IS NULL
         ORDER BY a.created_at DESC
         """,
         (student_tg_id, status),
@@ -972,6 +1418,7 @@ async def list_student_assignments_by_status(
     return await _with_db(_list_student_assignments_by_status, student_tg_id, status)
 
 
+@_reads
 async def _list_student_assignments_by_statuses(
     db: sql.Connection,
     student_tg_id: int,
@@ -985,10 +1432,11 @@ async def _list_student_assignments_by_statuses(
     rows = await db.execute_fetchall(
         f"""
         SELECT a.id, a.title, a.text, a.soft_deadline, a.hard_deadline, a.status,
-               a.template_id, t.answering_mode, t.max_attempts
+               a.template_id, t.answering_mode, t.max_attempts,
+               a.question_total, a.answered_count, a.max_attempt_index, a.total_score
         FROM homework_assignments a
         LEFT JOIN homework_templates t ON a.template_id = t.id
-        WHERE a.student_tg_id = ? AND a.status IN ({placeholders})
+        WHERE a.student_tg_id = ? AND a.status IN ({placeholders}) AND t.deleted_at IS NULL
         ORDER BY a.created_at DESC
         LIMIT ? OFFSET ?
         """,
@@ -1012,6 +1460,7 @@ async def list_student_assignments_by_statuses(
     )
 
 
+@_reads
 async def _get_assignment_view(
     db: sql.Connection,
     assignment_id: int,
@@ -1025,10 +1474,11 @@ async def _get_assignment_view(
     rows = await db.execute_fetchall(
         f"""
         SELECT a.id, a.title, a.text, a.soft_deadline, a.hard_deadline, a.status,
-               a.template_id, t.answering_mode, t.max_attempts
+               a.template_id, t.answering_mode, t.max_attempts,
+               a.question_total, a.answered_count, a.max_attempt_index, a.total_score
         FROM homework_assignments a
         LEFT JOIN homework_templates t ON a.template_id = t.id
-        WHERE a.id = ? {condition}
+        WHERE a.id = ? AND t.deleted_at IS NULL {condition}
         """,
         tuple(params),
     )
@@ -1041,6 +1491,55 @@ async def get_assignment_view(assignment_id: int, student_tg_id: int | None = No
     return await _with_db(_get_assignment_view, assignment_id, student_tg_id)
 
 
+@_reads
+async def _get_assignment_screen(
+    db: sql.Connection,
+    assignment_id: int,
+    student_tg_id: int,
+    question_id: int | None = None,
+) -> AssignmentScreen | None:
+    """Load everything a question screen shows from one read transaction.
+
+    Args:
+        db (sql.Connection): Connection to read from.
+        assignment_id (int): Assignment being answered.
+        student_tg_id (int): Student owning the assignment.
+        question_id (int | None, optional): Question to show. Defaults to the next unanswered one.
+
+    Returns:
+        AssignmentScreen | None: None if the assignment is not found. `question` is None when there is
+            no unanswered question left or `question_id` does not belong to the assignment.
+    """
+    await db.execute('BEGIN')
+    try:
+        assignment = await _get_assignment_view(db, assignment_id, student_tg_id)
+        if assignment is None:
+            return None
+        if question_id is None:
+            question = await _get_next_unanswered_question(db, assignment_id, student_tg_id)
+        else:
+            question = await _get_homework_question(db, question_id)
+            if question is not None and question.assignment_id != assignment.template_id:
+                question = None
+        if question is None:
+            return AssignmentScreen(assignment, None, [], [], 0)
+        options = await _list_homework_question_options(db, question.id) if question.question_type == 'mcq' else []
+        attachments = await _list_homework_question_attachments(db, question.id)
+        attempt_count = await _get_attempt_count(db, assignment_id, question.id, student_tg_id)
+        return AssignmentScreen(assignment, question, options, attachments, attempt_count)
+    finally:
+        await db.rollback()
+
+
+async def get_assignment_screen(
+    assignment_id: int,
+    student_tg_id: int,
+    question_id: int | None = None,
+) -> AssignmentScreen | None:
+    return await _with_db(_get_assignment_screen, assignment_id, student_tg_id, question_id)
+
+
+@_reads
 async def _get_next_unanswered_question(
     db: sql.Connection,
     assignment_id: int,
@@ -1050,16 +1549,12 @@ async def _get_next_unanswered_question(
         """
         SELECT q.id, q.assignment_id, q.question_type, q.text, q.correct_answer, q.points, q.order_index
         FROM homework_questions q
-        LEFT JOIN (
-            SELECT question_id, COUNT(*) as cnt
-            FROM homework_assignment_attempts
-            WHERE assignment_id = ? AND student_tg_id = ?
-            GROUP BY question_id
-        ) a ON a.question_id = q.id
+        LEFT JOIN homework_latest_attempts a
+          ON a.assignment_id = ? AND a.student_tg_id = ? AND a.question_id = q.id
         WHERE q.assignment_id = (
             SELECT template_id FROM homework_assignments WHERE id = ?
         )
-          AND (a.cnt IS NULL OR a.cnt = 0)
+          AND a.question_id IS NULL
         ORDER BY q.order_index
         LIMIT 1
         """,
@@ -1074,6 +1569,7 @@ async def get_next_unanswered_question(assignment_id: int, student_tg_id: int) -
     return await _with_db(_get_next_unanswered_question, assignment_id, student_tg_id)
 
 
+@_reads
 async def _get_attempt_count(
     db: sql.Connection,
     assignment_id: int,
@@ -1082,8 +1578,8 @@ async def _get_attempt_count(
 ) -> int:
     rows = await db.execute_fetchall(
         """
-        SELECT COUNT(*)
-        FROM homework_assignment_attempts
+        SELECT attempt_count
+        FROM homework_latest_attempts
         WHERE assignment_id = ? AND question_id = ? AND student_tg_id = ?
         """,
         (assignment_id, question_id, student_tg_id),
@@ -1095,6 +1591,7 @@ async def get_attempt_count(assignment_id: int, question_id: int, student_tg_id:
     return await _with_db(_get_attempt_count, assignment_id, question_id, student_tg_id)
 
 
+@_reads
 async def _get_latest_attempt_for_question(
     db: sql.Connection,
     assignment_id: int,
@@ -1103,11 +1600,9 @@ async def _get_latest_attempt_for_question(
 ) -> HomeworkAttempt | None:
     rows = await db.execute_fetchall(
         """
-        SELECT id, answer_text, is_correct, score, attempt_index
-        FROM homework_assignment_attempts
+        SELECT attempt_id, answer_text, is_correct, score, attempt_index
+        FROM homework_latest_attempts
         WHERE assignment_id = ? AND question_id = ? AND student_tg_id = ?
-        ORDER BY attempt_index DESC
-        LIMIT 1
         """,
         (assignment_id, question_id, student_tg_id),
     )
@@ -1124,6 +1619,7 @@ async def get_latest_attempt_for_question(
     return await _with_db(_get_latest_attempt_for_question, assignment_id, question_id, student_tg_id)
 
 
+@_reads
 async def _list_attempt_attachments(
     db: sql.Connection,
     attempt_id: int,
@@ -1144,6 +1640,7 @@ async def list_attempt_attachments(attempt_id: int) -> list[HomeworkAttemptAttac
     return await _with_db(_list_attempt_attachments, attempt_id)
 
 
+@_reads
 async def _list_attempt_option_texts(
     db: sql.Connection,
     attempt_id: int,
@@ -1165,17 +1662,14 @@ async def list_attempt_option_texts(attempt_id: int) -> list[str]:
     return await _with_db(_list_attempt_option_texts, attempt_id)
 
 
+@_reads
 async def _get_assignment_max_attempt_index(
     db: sql.Connection,
     assignment_id: int,
     student_tg_id: int,
 ) -> int:
     rows = await db.execute_fetchall(
-        """
-        SELECT COALESCE(MAX(attempt_index), 0)
-        FROM homework_assignment_attempts
-        WHERE assignment_id = ? AND student_tg_id = ?
-        """,
+        'SELECT max_attempt_index FROM homework_assignments WHERE id = ? AND student_tg_id = ?',
         (assignment_id, student_tg_id),
     )
     return int(rows[0][0]) if rows else 0
@@ -1185,6 +1679,7 @@ async def get_assignment_max_attempt_index(assignment_id: int, student_tg_id: in
     return await _with_db(_get_assignment_max_attempt_index, assignment_id, student_tg_id)
 
 
+@_reads
 async def _list_assignment_max_attempts(
     db: sql.Connection,
     student_tg_id: int,
@@ -1195,10 +1690,9 @@ async def _list_assignment_max_attempts(
     placeholders = ', '.join('?' for _ in assignment_ids)
     rows = await db.execute_fetchall(
         f"""
-        SELECT assignment_id, COALESCE(MAX(attempt_index), 0)
-        FROM homework_assignment_attempts
-        WHERE student_tg_id = ? AND assignment_id IN ({placeholders})
-        GROUP BY assignment_id
+        SELECT id, max_attempt_index
+        FROM homework_assignments
+        WHERE student_tg_id = ? AND id IN ({placeholders})
         """,
         (student_tg_id, *assignment_ids),
     )
@@ -1212,6 +1706,7 @@ async def list_assignment_max_attempts(
     return await _with_db(_list_assignment_max_attempts, student_tg_id, assignment_ids)
 
 
+@_writes
 async def _record_assignment_attempt(
     db: sql.Connection,
     assignment_id: int,
@@ -1225,6 +1720,14 @@ async def _record_assignment_attempt(
     selected_option_ids: list[int] | None = None,
 ) -> Result:
     try:
+        previous = await db.execute_fetchall(
+            """
+            SELECT attempt_index, score
+            FROM homework_latest_attempts
+            WHERE assignment_id = ? AND student_tg_id = ? AND question_id = ?
+            """,
+            (assignment_id, student_tg_id, question_id),
+        )
         cursor = await db.execute(
             """
             INSERT INTO homework_assignment_attempts (
@@ -1234,6 +1737,42 @@ async def _record_assignment_attempt(
             (assignment_id, question_id, student_tg_id, attempt_index, answer_text, is_correct, score),
         )
         attempt_id = cursor.lastrowid
+        await db.execute(
+            """
+            INSERT INTO homework_latest_attempts (
+                assignment_id, student_tg_id, question_id, attempt_id, attempt_index, attempt_count,
+                answer_text, is_correct, score
+            ) VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (assignment_id, student_tg_id, question_id) DO UPDATE SET
+                attempt_count = attempt_count + 1,
+                attempt_id = CASE WHEN excluded.attempt_index >= attempt_index
+                    THEN excluded.attempt_id ELSE attempt_id END,
+                answer_text = CASE WHEN excluded.attempt_index >= attempt_index
+                    THEN excluded.answer_text ELSE answer_text END,
+                is_correct = CASE WHEN excluded.attempt_index >= attempt_index
+                    THEN excluded.is_correct ELSE is_correct END,
+                score = CASE WHEN excluded.attempt_index >= attempt_index
+                    THEN excluded.score ELSE score END,
+                attempt_index = max(excluded.attempt_index, attempt_index)
+            """,
+            (assignment_id, student_tg_id, question_id, attempt_id, attempt_index, answer_text, is_correct, score),
+        )
+        # Keep the assignment progress counters in step with the latest-attempt row replaced above.
+        answered, score_delta = 1, score or 0
+        if previous:
+            previous_index, previous_score = previous[0]
+            answered = 0
+            score_delta = (score or 0) - (previous_score or 0) if attempt_index >= previous_index else 0
+        await db.execute(
+            """
+            UPDATE homework_assignments
+            SET answered_count = answered_count + ?,
+                max_attempt_index = max(max_attempt_index, ?),
+                total_score = total_score + ?
+            WHERE id = ?
+            """,
+            (answered, attempt_index, score_delta, assignment_id),
+        )
         if attachments:
             await db.executemany(
                 """
@@ -1272,7 +1811,8 @@ async def record_assignment_attempt(
     attachments: list[tuple[str, str]] | None = None,
     selected_option_ids: list[int] | None = None,
 ) -> Result:
-    return await _with_db(
+    return await _changing(
+        [('student', student_tg_id)],
         _record_assignment_attempt,
         assignment_id,
         question_id,
@@ -1286,35 +1826,26 @@ async def record_assignment_attempt(
     )
 
 
+@_reads
 async def _get_assignment_question_counts(
     db: sql.Connection,
     assignment_id: int,
     student_tg_id: int,
 ) -> tuple[int, int]:
     rows = await db.execute_fetchall(
-        """
-        SELECT COUNT(*) FROM homework_questions
-        WHERE assignment_id = (SELECT template_id FROM homework_assignments WHERE id = ?)
-        """,
-        (assignment_id,),
-    )
-    total = int(rows[0][0]) if rows else 0
-    answered_rows = await db.execute_fetchall(
-        """
-        SELECT COUNT(DISTINCT question_id)
-        FROM homework_assignment_attempts
-        WHERE assignment_id = ? AND student_tg_id = ?
-        """,
+        'SELECT question_total, answered_count FROM homework_assignments WHERE id = ? AND student_tg_id = ?',
         (assignment_id, student_tg_id),
     )
-    answered = int(answered_rows[0][0]) if answered_rows else 0
-    return total, answered
+    if not rows:
+        return 0, 0
+    return int(rows[0][0]), int(rows[0][1])
 
 
 async def get_assignment_question_counts(assignment_id: int, student_tg_id: int) -> tuple[int, int]:
     return await _with_db(_get_assignment_question_counts, assignment_id, student_tg_id)
 
 
+@_writes
 async def _set_assignment_status(db: sql.Connection, assignment_id: int, status: str) -> Result:
     try:
         await db.execute(
@@ -1328,10 +1859,22 @@ async def _set_assignment_status(db: sql.Connection, assignment_id: int, status:
     return Result(True, None)
 
 
+@_reads
+async def _get_assignment_student_id(db: sql.Connection, assignment_id: int) -> int | None:
+    rows = await db.execute_fetchall('SELECT student_tg_id FROM homework_assignments WHERE id = ?', (assignment_id,))
+    return rows[0][0] if rows else None
+
+
+async def _assignment_changes(assignment_id: int) -> list[tuple[str, int]]:
+    student_tg_id = await _with_db(_get_assignment_student_id, assignment_id)
+    return [('student', student_tg_id)] if student_tg_id is not None else []
+
+
 async def set_assignment_status(assignment_id: int, status: str) -> Result:
-    return await _with_db(_set_assignment_status, assignment_id, status)
+    return await _changing(await _assignment_changes(assignment_id), _set_assignment_status, assignment_id, status)
 
 
+@_writes
 async def _save_homework(
     db: sql.Connection,
     student_tg_id: int,
@@ -1378,9 +1921,19 @@ async def save_homework(
     hard_deadline: str,
     attachments: list[tuple[str, str]] | None = None,
 ) -> Result:
-    return await _with_db(_save_homework, student_tg_id, title, text, soft_deadline, hard_deadline, attachments)
+    return await _changing(
+        [('student', student_tg_id)],
+        _save_homework,
+        student_tg_id,
+        title,
+        text,
+        soft_deadline,
+        hard_deadline,
+        attachments,
+    )
 
 
+@_writes
 async def _save_homework_submission(
     db: sql.Connection,
     assignment_id: int,
@@ -1425,13 +1978,21 @@ async def save_homework_submission(
     attachments: list[tuple[str, str]],
     text: str | None = None,
 ) -> Result:
-    return await _with_db(_save_homework_submission, assignment_id, student_tg_id, attachments, text)
+    return await _changing(
+        [('student', student_tg_id)],
+        _save_homework_submission,
+        assignment_id,
+        student_tg_id,
+        attachments,
+        text,
+    )
 
 
 async def get_tg_user_id_by_tg_username(tg_username: str) -> Result:
     return await _with_db(_get_tg_user_id_by_tg_username, tg_username)
 
 
+@_reads
 async def _get_tg_user_id_by_tg_username(db: sql.Connection, tg_username: str) -> Result:
     try:
         rows = await db.execute_fetchall(
@@ -1450,6 +2011,7 @@ async def get_tg_user_id_by_username(username: str) -> Result:
     return await _with_db(_get_tg_user_id_by_username, username)
 
 
+@_reads
 async def _get_tg_user_id_by_username(db: sql.Connection, username: str) -> Result:
     try:
         rows = await db.execute_fetchall(
@@ -1464,6 +2026,7 @@ async def _get_tg_user_id_by_username(db: sql.Connection, username: str) -> Resu
         return Result(False, str(exc))
 
 
+@_writes
 async def _upsert_account_provisioning(
     db: sql.Connection,
     username: str,
@@ -1497,6 +2060,7 @@ async def upsert_account_provisioning(
     return await _with_db(_upsert_account_provisioning, username, status, error)
 
 
+@_reads
 async def _get_account_provisioning(db: sql.Connection, username: str) -> ProvisioningStatus | None:
     rows = await db.execute_fetchall(
         """
@@ -1513,3 +2077,256 @@ async def _get_account_provisioning(db: sql.Connection, username: str) -> Provis
 
 async def get_account_provisioning(username: str) -> ProvisioningStatus | None:
     return await _with_db(_get_account_provisioning, username)
+
+
+@_reads
+async def _get_fsm_record(db: sql.Connection, key: str) -> FsmRecord | None:
+    rows = await db.execute_fetchall('SELECT key, state, data FROM fsm_storage WHERE key = ?', (key,))
+    if not rows:
+        return None
+    return FsmRecord(*rows[0])
+
+
+async def get_fsm_record(key: str) -> FsmRecord | None:
+    return await _with_db(_get_fsm_record, key)
+
+
+@_writes
+async def _save_fsm_records(db: sql.Connection, records: list[FsmRecord]) -> Result:
+    cleared = [(record.key,) for record in records if record.state is None and record.data == '{}']
+    kept = [record for record in records if record.state is not None or record.data != '{}']
+    try:
+        if kept:
+            await db.executemany(
+                """
+                INSERT INTO fsm_storage (key, state, data, updated_at)
+                VALUES (?, ?, ?, datetime('now'))
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+                """,
+                kept,
+            )
+        if cleared:
+            await db.executemany('DELETE FROM fsm_storage WHERE key = ?', cleared)
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    return Result(True, None, len(records))
+
+
+async def save_fsm_records(records: list[FsmRecord]) -> Result:
+    """Persist FSM state and JSON data for several keys in one transaction.
+
+    Records with no state and empty data are deleted instead of stored.
+    """
+    return await _with_db(_save_fsm_records, records)
+
+
+@_writes
+async def _delete_stale_fsm_records(db: sql.Connection, max_age_hours: int) -> Result:
+    try:
+        cursor = await db.execute(
+            "DELETE FROM fsm_storage WHERE updated_at < datetime('now', ?)",
+            (f'-{max_age_hours} hours',),
+        )
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    return Result(True, None, cursor.rowcount)
+
+
+async def delete_stale_fsm_records(max_age_hours: int) -> Result:
+    """Delete FSM records not written for `max_age_hours`; `data` is the number of rows removed."""
+    return await _with_db(_delete_stale_fsm_records, max_age_hours)
+
+
+@_reads
+async def _list_tracked_messages(db: sql.Connection, chat_id: int) -> list[int]:
+    rows = await db.execute_fetchall(
+        'SELECT message_id FROM tracked_messages WHERE chat_id = ? ORDER BY message_id',
+        (chat_id,),
+    )
+    return [row[0] for row in rows]
+
+
+async def list_tracked_messages(chat_id: int) -> list[int]:
+    return await _with_db(_list_tracked_messages, chat_id)
+
+
+@_writes
+async def _save_tracked_messages(
+    db: sql.Connection,
+    added: list[tuple[int, int]],
+    cleared: list[int],
+    keep: int,
+) -> Result:
+    try:
+        if cleared:
+            await db.executemany('DELETE FROM tracked_messages WHERE chat_id = ?', [(chat_id,) for chat_id in cleared])
+        if added:
+            await db.executemany('INSERT OR IGNORE INTO tracked_messages (chat_id, message_id) VALUES (?, ?)', added)
+            await db.executemany(
+                """
+                DELETE FROM tracked_messages
+                WHERE chat_id = ? AND message_id < (
+                    SELECT MIN(message_id) FROM (
+                        SELECT message_id FROM tracked_messages WHERE chat_id = ? ORDER BY message_id DESC LIMIT ?
+                    )
+                )
+                """,
+                [(chat_id, chat_id, keep) for chat_id in {chat_id for chat_id, _ in added}],
+            )
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    return Result(True, None)
+
+
+async def save_tracked_messages(added: list[tuple[int, int]], cleared: list[int], keep: int) -> Result:
+    """Forget every message of the `cleared` chats, then record `added` (chat id, message id) pairs.
+
+    Only the newest `keep` messages of each chat with additions are kept.
+    """
+    return await _with_db(_save_tracked_messages, added, cleared, keep)
+
+
+@_writes
+async def _create_broadcast_job(
+    db: sql.Connection,
+    kind: str,
+    text: str | None,
+    report_chat_id: int,
+    recipients: list[tuple[int, str | None]],
+) -> Result:
+    try:
+        cursor = await db.execute(
+            'INSERT INTO broadcast_jobs (kind, text, report_chat_id, total) VALUES (?, ?, ?, ?)',
+            (kind, text, report_chat_id, len(recipients)),
+        )
+        job_id = cursor.lastrowid
+        await db.executemany(
+            'INSERT INTO broadcast_recipients (job_id, position, chat_id, text) VALUES (?, ?, ?, ?)',
+            [
+                (job_id, position, chat_id, recipient_text)
+                for position, (chat_id, recipient_text) in enumerate(recipients, start=1)
+            ],
+        )
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    return Result(True, None, job_id)
+
+
+async def create_broadcast_job(
+    kind: str,
+    text: str | None,
+    report_chat_id: int,
+    recipients: list[tuple[int, str | None]],
+) -> Result:
+    """Store a broadcast and its (chat id, text) recipients in order; `data` is the job id.
+
+    Recipients without a text of their own get the job's `text`.
+    """
+    return await _with_db(_create_broadcast_job, kind, text, report_chat_id, recipients)
+
+
+@_reads
+async def _get_broadcast_job(db: sql.Connection, job_id: int) -> BroadcastJob | None:
+    rows = await db.execute_fetchall(
+        """
+        SELECT id, kind, text, report_chat_id, total, cursor, delivered, failed, finished_at
+        FROM broadcast_jobs
+        WHERE id = ?
+        """,
+        (job_id,),
+    )
+    return BroadcastJob(*rows[0]) if rows else None
+
+
+async def get_broadcast_job(job_id: int) -> BroadcastJob | None:
+    return await _with_db(_get_broadcast_job, job_id)
+
+
+@_reads
+async def _list_broadcast_recipients(
+    db: sql.Connection,
+    job_id: int,
+    after: int,
+    limit: int,
+) -> list[BroadcastRecipient]:
+    rows = await db.execute_fetchall(
+        """
+        SELECT position, chat_id, text
+        FROM broadcast_recipients
+        WHERE job_id = ? AND position > ?
+        ORDER BY position
+        LIMIT ?
+        """,
+        (job_id, after, limit),
+    )
+    return [BroadcastRecipient(*row) for row in rows]
+
+
+async def list_broadcast_recipients(job_id: int, after: int, limit: int) -> list[BroadcastRecipient]:
+    """Return up to `limit` recipients of a broadcast following position `after`."""
+    return await _with_db(_list_broadcast_recipients, job_id, after, limit)
+
+
+@_writes
+async def _advance_broadcast_job(
+    db: sql.Connection,
+    job_id: int,
+    cursor: int,
+    delivered: int,
+    failed: int,
+    finished: bool,
+) -> Result:
+    try:
+        await db.execute(
+            """
+            UPDATE broadcast_jobs
+            SET cursor = ?,
+                delivered = delivered + ?,
+                failed = failed + ?,
+                finished_at = CASE WHEN ? THEN datetime('now') END
+            WHERE id = ?
+            """,
+            (cursor, delivered, failed, finished, job_id),
+        )
+        if finished:
+            await db.execute('DELETE FROM broadcast_recipients WHERE job_id = ?', (job_id,))
+        await db.commit()
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=exc)
+        return Result(False, str(exc))
+    return Result(True, None)
+
+
+async def advance_broadcast_job(
+    job_id: int,
+    cursor: int,
+    delivered: int,
+    failed: int,
+    finished: bool = False,
+) -> Result:
+    """Move a broadcast's cursor past a handled batch and add its delivered/failed counts.
+
+    A finished job drops its recipients; the job row stays as a record of the totals.
+    """
+    return await _with_db(_advance_broadcast_job, job_id, cursor, delivered, failed, finished)
+
+
+@_reads
+async def _list_unfinished_broadcast_jobs(db: sql.Connection) -> list[int]:
+    rows = await db.execute_fetchall('SELECT id FROM broadcast_jobs WHERE finished_at IS NULL ORDER BY id')
+    return [row[0] for row in rows]
+
+
+async def list_unfinished_broadcast_jobs() -> list[int]:
+    return await _with_db(_list_unfinished_broadcast_jobs)
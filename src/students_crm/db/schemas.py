@@ -49,7 +49,8 @@ db_schemas = {
                     max_attempts INTEGER NOT NULL DEFAULT 3,
                     is_published INTEGER NOT NULL DEFAULT 0,
                     created_by_tg_id INTEGER REFERENCES users(tg_id),
-                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                    deleted_at TEXT
                 );
                 """,
     'homework_questions': """
@@ -76,7 +77,11 @@ db_schemas = {
                     hard_deadline TEXT NOT NULL,   -- ISO-8601 datetime
                     status TEXT NOT NULL DEFAULT 'Не решено'
                         CHECK (status IN ('Не решено', 'На проверке', 'Пройдено', 'Провалено')),
-                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                    question_total INTEGER NOT NULL DEFAULT 0,
+                    answered_count INTEGER NOT NULL DEFAULT 0,
+                    max_attempt_index INTEGER NOT NULL DEFAULT 0,
+                    total_score REAL NOT NULL DEFAULT 0
                 );
                 """,
     'homework_question_attachments': """
@@ -110,6 +115,20 @@ db_schemas = {
                     submitted_at TEXT NOT NULL DEFAULT (datetime('now'))
                 );
                 """,
+    'homework_latest_attempts': """
+                CREATE TABLE IF NOT EXISTS homework_latest_attempts (
+                    assignment_id INTEGER NOT NULL REFERENCES homework_assignments(id) ON DELETE CASCADE,
+                    student_tg_id INTEGER NOT NULL,
+                    question_id INTEGER NOT NULL REFERENCES homework_questions(id) ON DELETE CASCADE,
+                    attempt_id INTEGER NOT NULL REFERENCES homework_assignment_attempts(id) ON DELETE CASCADE,
+                    attempt_index INTEGER NOT NULL,
+                    attempt_count INTEGER NOT NULL,
+                    answer_text TEXT,
+                    is_correct INTEGER,
+                    score REAL,
+                    PRIMARY KEY (assignment_id, student_tg_id, question_id)
+                ) WITHOUT ROWID;
+                """,
     'homework_attempt_attachments': """
                 CREATE TABLE IF NOT EXISTS homework_attempt_attachments (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -153,5 +172,50 @@ db_schemas = {
                     position INTEGER NOT NULL -- display order
                 );
                 """,
-
+    'cache_change_log': """
+                CREATE TABLE IF NOT EXISTS cache_change_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    namespace TEXT NOT NULL,
+                    key INTEGER,
+                    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+                );
+                """,
+    'tracked_messages': """
+                CREATE TABLE IF NOT EXISTS tracked_messages (
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    PRIMARY KEY (chat_id, message_id)
+                ) WITHOUT ROWID;
+                """,
+    'fsm_storage': """
+                CREATE TABLE IF NOT EXISTS fsm_storage (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+                );
+                """,
+    'broadcast_jobs': """
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,   -- 'invites', 'announcement'
+                    text TEXT,   -- sent to recipients without a text of their own
+                    report_chat_id INTEGER NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    cursor INTEGER NOT NULL DEFAULT 0,   -- last recipient position handled
+                    delivered INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+                    finished_at TEXT
+                );
+                """,
+    'broadcast_recipients': """
+                CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                    job_id INTEGER NOT NULL REFERENCES broadcast_jobs(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    text TEXT,
+                    PRIMARY KEY (job_id, position)
+                ) WITHOUT ROWID;
+                """,
 }
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import aiosqlite as sql
+
+from students_crm.db.models import Result
+from students_crm.db.pool import open_connection
+
+_SAVEPOINT = 'write_job'
+
+
+@dataclass(frozen=True)
+class WriteQueueStats:
+    capacity: int
+    depth: int
+    max_depth: int
+    submitted: int
+    batches: int
+    max_batch: int
+    rolled_back: int
+    blocked: int
+    total_block_wait: float
+    max_block_wait: float
+
+    @property
+    def avg_batch(self) -> float:
+        return self.submitted / self.batches if self.batches else 0.0
+
+
+class _BatchConnection:
+    """Connection proxy handed to write routines while they run inside a batch.
+
+    `commit()` is a no-op because the writer commits the whole batch at once;
+    `rollback()` only undoes the current routine's savepoint.
+    """
+
+    __slots__ = ('_db',)
+
+    def __init__(self, db: sql.Connection) -> None:
+        object.__setattr__(self, '_db', db)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._db, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._db, name, value)
+
+    async def commit(self) -> None:
+        return None
+
+    async def rollback(self) -> None:
+        await self._db.execute(f'ROLLBACK TO {_SAVEPOINT}')
+
+
+class _WriteJob:
+    __slots__ = ('fn', 'args', 'kwargs', 'future')
+
+    def __init__(self, fn: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict, future: asyncio.Future) -> None:
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+
+
+class WriteQueue:
+    """Serialize a process' writes through one connection with group commit.
+
+    Routines submitted while a batch is being committed are collected into the
+    next batch and committed in a single transaction. Each routine runs inside
+    its own savepoint, so a routine that raises or returns a failed `Result`
+    is rolled back without affecting the rest of the batch.
+    """
+
+    def __init__(self, db_path: str, *, capacity: int = 256, max_batch: int = 32) -> None:
+        if capacity < 1 or max_batch < 1:
+            raise ValueError('capacity and max_batch must be at least 1')
+        self.db_path = db_path
+        self.capacity = capacity
+        self.max_batch = max_batch
+        self._db: sql.Connection | None = None
+        self._queue: asyncio.Queue[_WriteJob | None] | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._accepting = False
+        self._max_depth = 0
+        self._submitted = 0
+        self._batches = 0
+        self._max_batch_seen = 0
+        self._rolled_back = 0
+        self._blocked = 0
+        self._total_block_wait = 0.0
+        self._max_block_wait = 0.0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._db = await open_connection(self.db_path)
+        self._queue = asyncio.Queue(maxsize=self.capacity)
+        self._task = asyncio.create_task(self._run(), name='db-writer')
+        self._accepting = True
+
+    async def stop(self) -> None:
+        """Stop accepting writes, flush everything already queued and close the connection."""
+        if self._task is None:
+            return
+        self._accepting = False
+        await self._queue.put(None)
+        try:
+            await self._task
+        finally:
+            self._task = None
+            self._queue = None
+            db, self._db = self._db, None
+            if db is not None:
+                await db.close()
+
+    def is_usable(self) -> bool:
+        if not self._accepting or self._task is None or self._task.done():
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def submit(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Queue a write routine and wait until its batch is committed.
+
+        Args:
+            fn (Callable[..., Awaitable[Any]]): Routine taking a connection as its first argument.
+
+        Returns:
+            Any: Whatever the routine returned, once its batch is durable.
+        """
+        if not self.is_usable():
+            raise RuntimeError('write queue is not running')
+        future = self._loop.create_future()
+        job = _WriteJob(fn, args, kwargs, future)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._blocked += 1
+            started = time.monotonic()
+            await self._queue.put(job)
+            waited = time.monotonic() - started
+            self._total_block_wait += waited
+            self._max_block_wait = max(self._max_block_wait, waited)
+            if self._task is None or self._task.done():
+                raise RuntimeError('write queue stopped while the write was waiting for room')
+        self._submitted += 1
+        self._max_depth = max(self._max_depth, self._queue.qsize())
+        return await future
+
+    async def _run(self) -> None:
+        queue = self._queue
+        stopping = False
+        try:
+            while not stopping:
+                job = await queue.get()
+                if job is None:
+                    break
+                batch = [job]
+                while len(batch) < self.max_batch:
+                    try:
+                        queued = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        break
+                    if queued is None:
+                        stopping = True
+                        break
+                    batch.append(queued)
+                try:
+                    await self._commit_batch(batch)
+                except Exception as exc:
+                    logging.log(level=logging.ERROR, msg=f'Write batch of {len(batch)} failed: {exc}')
+                    await self._abort_batch(batch, exc)
+        finally:
+            # Whatever is still queued will never run: fail it instead of leaving its caller waiting.
+            self._accepting = False
+            while not queue.empty():
+                job = queue.get_nowait()
+                if job is not None:
+                    self._resolve(job, None, RuntimeError('write queue stopped'))
+
+    async def _abort_batch(self, batch: list[_WriteJob], error: Exception) -> None:
+        for job in batch:
+            self._resolve(job, None, error)
+        try:
+            if self._db.in_transaction:
+                await self._db.rollback()
+        except Exception as exc:
+            logging.log(level=logging.ERROR, msg=exc)
+
+    async def _commit_batch(self, batch: list[_WriteJob]) -> None:
+        db = self._db
+        proxy = _BatchConnection(db)
+        outcomes: list[tuple[_WriteJob, Any, Exception | None]] = []
+        try:
+            await db.execute('BEGIN IMMEDIATE')
+            for job in batch:
+                outcomes.append(await self._run_job(db, proxy, job))
+            await db.commit()
+        except Exception as exc:
+            logging.log(level=logging.ERROR, msg=f'Group commit failed, replaying {len(batch)} writes: {exc}')
+            if db.in_transaction:
+                await db.rollback()
+            await self._replay(batch)
+            return
+        self._batches += 1
+        self._max_batch_seen = max(self._max_batch_seen, len(batch))
+        for job, result, error in outcomes:
+            self._resolve(job, result, error)
+
+    async def _run_job(
+        self,
+        db: sql.Connection,
+        proxy: _BatchConnection,
+        job: _WriteJob,
+    ) -> tuple[_WriteJob, Any, Exception | None]:
+        await db.execute(f'SAVEPOINT {_SAVEPOINT}')
+        try:
+            result = await job.fn(proxy, *job.args, **job.kwargs)
+        except Exception as exc:
+            await self._rollback_job(db)
+            return job, None, exc
+        finally:
+            db.row_factory = None
+        if isinstance(result, Result) and not result.ok:
+            await self._rollback_job(db)
+        else:
+            await db.execute(f'RELEASE {_SAVEPOINT}')
+        return job, result, None
+
+    async def _rollback_job(self, db: sql.Connection) -> None:
+        self._rolled_back += 1
+        await db.execute(f'ROLLBACK TO {_SAVEPOINT}')
+        await db.execute(f'RELEASE {_SAVEPOINT}')
+
+    async def _replay(self, batch: list[_WriteJob]) -> None:
+        """Run each job in its own transaction so every routine reports its own error."""
+        db = self._db
+        for job in batch:
+            result, error = None, None
+            try:
+                result = await job.fn(db, *job.args, **job.kwargs)
+            except Exception as exc:
+                error = exc
+            finally:
+                db.row_factory = None
+                if db.in_transaction:
+                    await db.rollback()
+            self._batches += 1
+            self._resolve(job, result, error)
+
+    @staticmethod
+    def _resolve(job: _WriteJob, result: Any, error: Exception | None) -> None:
+        if job.future.done():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def stats(self) -> WriteQueueStats:
+        return WriteQueueStats(
+            capacity=self.capacity,
+            depth=self._queue.qsize() if self._queue is not None else 0,
+            max_depth=self._max_depth,
+            submitted=self._submitted,
+            batches=self._batches,
+            max_batch=self._max_batch_seen,
+            rolled_back=self._rolled_back,
+            blocked=self._blocked,
+            total_block_wait=self._total_block_wait,
+            max_block_wait=self._max_block_wait,
+        )
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from html import escape
+
+from aiogram import Bot, F, Router
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from students_crm.db.models import BroadcastJob, BroadcastRecipient
+from students_crm.db.routines import (
+    advance_broadcast_job,
+    create_broadcast_job,
+    get_broadcast_job,
+    get_registered_students,
+    list_broadcast_recipients,
+    list_unfinished_broadcast_jobs,
+)
+from students_crm.students_bot.send_scheduler import Priority, send_priority
+from students_crm.utils.constants import ADMIN_ID
+
+router = Router()
+
+# One batch is about a second of the global send rate; the cursor is saved after every batch.
+BROADCAST_BATCH_SIZE = 30
+BROADCAST_CONCURRENCY = 10
+PROGRESS_INTERVAL = 2.0
+KIND_LABELS = {
+    'invites': 'напоминания об инвайтах',
+    'announcement': 'объявление',
+}
+
+_TASKS: dict[int, asyncio.Task] = {}
+
+
+def _format_progress(job: BroadcastJob, delivered: int, failed: int, done: bool) -> str:
+    label = KIND_LABELS.get(job.kind, job.kind)
+    counts = f'доставлено {delivered}, не доставлено {failed} из {job.total}'
+    if done:
+        return f'Рассылка #{job.id} ({label}) завершена: {counts}.'
+    return f'Рассылка #{job.id} ({label}): {counts}…'
+
+
+async def _deliver(bot: Bot, semaphore: asyncio.Semaphore, recipient: BroadcastRecipient, text: str) -> bool:
+    async with semaphore:
+        try:
+            await bot.send_message(recipient.chat_id, text)
+        except TelegramAPIError as exc:
+            # Blocked bot, deleted chat and the like; flood control is retried by the send scheduler.
+            logging.log(level=logging.WARNING, msg=exc)
+            return False
+    return True
+
+
+async def _run_broadcast(bot: Bot, job_id: int) -> None:
+    job = await get_broadcast_job(job_id)
+    if job is None or job.finished_at is not None:
+        return
+    try:
+        await _send_broadcast(bot, job)
+    except Exception as exc:
+        logging.log(level=logging.ERROR, msg=f'Broadcast #{job_id} stopped: {exc}')
+        try:
+            await bot.send_message(
+                job.report_chat_id,
+                f'Рассылка #{job_id} остановлена из-за ошибки: {escape(str(exc))}. '
+                'Она продолжится с места остановки после перезапуска бота.',
+            )
+        except TelegramAPIError as notify_exc:
+            logging.log(level=logging.WARNING, msg=notify_exc)
+
+
+async def _send_broadcast(bot: Bot, job: BroadcastJob) -> None:
+    job_id = job.id
+    cursor, delivered, failed = job.cursor, job.delivered, job.failed
+    status = await bot.send_message(job.report_chat_id, _format_progress(job, delivered, failed, False))
+    last_update = time.monotonic()
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    while True:
+        recipients = await list_broadcast_recipients(job_id, cursor, BROADCAST_BATCH_SIZE)
+        if not recipients:
+            break
+        with send_priority(Priority.BULK):
+            results = await asyncio.gather(
+                *(_deliver(bot, semaphore, recipient, recipient.text or job.text or '') for recipient in recipients)
+            )
+        # A crash before this write resends the batch: delivery is at least once.
+        cursor = recipients[-1].position
+        result = await advance_broadcast_job(job_id, cursor, sum(results), len(results) - sum(results))
+        if not result:
+            await bot.send_message(job.report_chat_id, f'Рассылка #{job_id} прервана: {result.message}')
+            return
+        delivered += sum(results)
+        failed += len(results) - sum(results)
+        if time.monotonic() - last_update >= PROGRESS_INTERVAL:
+            last_update = time.monotonic()
+            try:
+                await bot.edit_message_text(
+                    _format_progress(job, delivered, failed, False),
+                    chat_id=job.report_chat_id,
+                    message_id=status.message_id,
+                )
+            except TelegramAPIError as exc:
+                logging.log(level=logging.WARNING, msg=exc)
+    await advance_broadcast_job(job_id, cursor, 0, 0, finished=True)
+    try:
+        await bot.edit_message_text(
+            _format_progress(job, delivered, failed, True),
+            chat_id=job.report_chat_id,
+            message_id=status.message_id,
+        )
+    except TelegramAPIError as exc:
+        # The job is done; only the report is lost.
+        logging.log(level=logging.WARNING, msg=exc)
+
+
+def start_broadcast(bot: Bot, job_id: int) -> asyncio.Task:
+    """Send a stored broadcast in the background, reporting progress to the job's report chat."""
+    task = _TASKS.get(job_id)
+    if task is not None:
+        return task
+    task = asyncio.create_task(_run_broadcast(bot, job_id), name=f'broadcast-{job_id}')
+    _TASKS[job_id] = task
+    task.add_done_callback(lambda done: _forget_broadcast(job_id, done))
+    return task
+
+
+def _forget_broadcast(job_id: int, task: asyncio.Task) -> None:
+    _TASKS.pop(job_id, None)
+    # Failures while sending are reported by the task itself; this catches the ones before it knows the job.
+    if not task.cancelled() and task.exception() is not None:
+        logging.log(level=logging.ERROR, msg=f'Broadcast #{job_id} failed: {task.exception()}')
+
+
+async def create_broadcast(
+    bot: Bot,
+    kind: str,
+    report_chat_id: int,
+    recipients: list[tuple[int, str | None]],
+    text: str | None = None,
+) -> int | None:
+    """Store a broadcast and start sending it; returns the job id, or None if it could not be stored."""
+    result = await create_broadcast_job(kind, text, report_chat_id, recipients)
+    if not result:
+        return None
+    start_broadcast(bot, result.data)
+    return result.data
+
+
+async def resume_broadcasts(bot: Bot) -> None:
+    """Continue broadcasts interrupted by a restart from their saved cursor."""
+    for job_id in await list_unfinished_broadcast_jobs():
+        start_broadcast(bot, job_id)
+
+
+@router.message(Command('announce'), F.from_user.id == ADMIN_ID)
+async def command_announce_handler(message: Message, command: CommandObject) -> None:
+    """Send an announcement to every registered student."""
+    if not command.args:
+        await message.answer('Использование: /announce текст объявления')
+        return
+    recipients = [(student.tg_id, None) for student in await get_registered_students() if student.tg_id]
+    if not recipients:
+        await message.answer('Нет зарегистрированных студентов.')
+        return
+    job_id = await create_broadcast(message.bot, 'announcement', message.chat.id, recipients, escape(command.args))
+    if job_id is None:
+        await message.answer('Не удалось создать рассылку.')
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+from students_crm.utils.constants import BOT_WORKERS
+
+
+@dataclass
+class _Lane:
+    lock: asyncio.Lock
+    depth: int = 0
+    max_depth: int = 0
+    handled: int = 0
+    total_wait: float = 0.0
+
+
+@dataclass(frozen=True)
+class ChatWorkerStats:
+    depth: int
+    max_depth: int
+    handled: int
+    avg_wait: float
+
+
+class ChatWorkersIsolation(BaseEventIsolation):
+    """Handle updates on `workers` lanes picked by chat id: one update at a time per lane, lanes in parallel.
+
+    Passed to the dispatcher as `events_isolation`, so the FSM middleware takes the lane before it
+    reads the chat's state: updates of one chat run strictly in arrival order and each sees what the
+    previous one wrote, while a slow handler only holds up the chats that share its lane. Each lane
+    is a fair lock, so the waiting updates queue on it in order. Updates without a chat or user run
+    right away.
+    """
+
+    def __init__(self, workers: int = BOT_WORKERS) -> None:
+        self.workers = max(workers, 1)
+        self._lanes: list[_Lane] | None = None
+
+    def _lane(self, key: StorageKey) -> _Lane:
+        if self._lanes is None:
+            # Created on first use so the locks belong to the running loop.
+            self._lanes = [_Lane(asyncio.Lock()) for _ in range(self.workers)]
+        return self._lanes[key.chat_id % self.workers]
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lane = self._lane(key)
+        lane.depth += 1
+        lane.max_depth = max(lane.max_depth, lane.depth)
+        queued = time.monotonic()
+        try:
+            async with lane.lock:
+                lane.total_wait += time.monotonic() - queued
+                lane.handled += 1
+                yield
+        finally:
+            lane.depth -= 1
+
+    @asynccontextmanager
+    async def released(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        """Let other updates of the lane run while the block waits for one of them; take the lane back after."""
+        lane = self._lane(key)
+        lane.lock.release()
+        try:
+            yield
+        finally:
+            await lane.lock.acquire()
+
+    async def close(self) -> None:
+        # Nothing to release, and updates still in flight keep their lanes.
+        pass
+
+    def stats(self) -> list[ChatWorkerStats]:
+        return [
+            ChatWorkerStats(
+                depth=lane.depth,
+                max_depth=lane.max_depth,
+                handled=lane.handled,
+                avg_wait=lane.total_wait / lane.handled if lane.handled else 0.0,
+            )
+            for lane in self._lanes or []
+        ]
+
+
+CHAT_WORKERS = ChatWorkersIsolation()
@@ -0,0 +1,109 @@
+from html import escape
+
+from aiogram import F, Router
+from aiogram.filters import Command
+from aiogram.types import Message
+
+from students_crm.db.routines import (
+    get_cache_invalidation_stats,
+    get_db_cache_stats,
+    get_db_pool_stats,
+    get_db_read_pool_stats,
+    get_db_stats,
+    get_db_writer_stats,
+)
+from students_crm.students_bot.chat_workers import CHAT_WORKERS
+from students_crm.students_bot.homework_pages import get_assignment_page_cache_stats, get_mcq_layout_cache_stats
+from students_crm.students_bot.message_registry import MESSAGE_REGISTRY
+from students_crm.students_bot.screens import get_screen_stats
+from students_crm.students_bot.send_scheduler import SEND_SCHEDULER
+from students_crm.utils.constants import ADMIN_ID
+
+router = Router()
+
+TOP_ROUTINES = 10
+RECENT_SLOW_QUERIES = 3
+MESSAGE_LIMIT = 4000
+
+
+def format_db_stats() -> str:
+    """Render routine counters, connection lanes and recent slow queries for the admin."""
+    snapshot = get_db_stats()
+    lines = ['<b>Статистика БД</b>']
+    routines = sorted(snapshot.routines.items(), key=lambda item: item[1].exec_time, reverse=True)
+    if routines:
+        lines.append('')
+        lines.append('<b>Запросы (по суммарному времени)</b>')
+    for name, stats in routines[:TOP_ROUTINES]:
+        lines.append(
+            f'<code>{escape(name)}</code>: {stats.calls} выз., '
+            f'sql {stats.avg_exec_time * 1000:.1f} мс, '
+            f'ожидание {stats.avg_acquire_time * 1000:.1f} мс, '
+            f'строк {stats.rows}, ошибок {stats.errors}'
+        )
+    for title, pool in (('Пул', get_db_pool_stats()), ('Чтение', get_db_read_pool_stats())):
+        if pool is not None:
+            lines.append(
+                f'{title}: {pool.in_use}/{pool.size} занято, ожиданий {pool.waits}, '
+                f'макс. ожидание {pool.max_wait * 1000:.1f} мс'
+            )
+    writer = get_db_writer_stats()
+    if writer is not None:
+        lines.append(
+            f'Запись: очередь {writer.depth}/{writer.capacity}, пакетов {writer.batches}, '
+            f'средний пакет {writer.avg_batch:.1f}, откатов {writer.rolled_back}, блокировок {writer.blocked}'
+        )
+    caches = (
+        ('Кэш', get_db_cache_stats()),
+        ('Кэш списков', get_assignment_page_cache_stats()),
+        ('Кэш клавиатур', get_mcq_layout_cache_stats()),
+    )
+    for title, cache in caches:
+        lines.append(
+            f'{title}: {cache.size}/{cache.maxsize}, попаданий {cache.hits} ({cache.hit_rate:.0%}), '
+            f'промахов {cache.misses}, вытеснений {cache.evictions}, сбросов {cache.invalidations}'
+        )
+    messages = MESSAGE_REGISTRY.stats()
+    lines.append(
+        f'Сообщения: {messages.tracked_ids} в {messages.chats} чатах, ожидают записи {messages.pending}, '
+        f'вытеснено {messages.evicted_ids} из {messages.evicted_chats} чатов'
+    )
+    screens = get_screen_stats()
+    lines.append(
+        f'Экраны: правок {screens.edits}, без изменений {screens.unchanged}, '
+        f'новых {screens.sends}, неудачных правок {screens.failed_edits}'
+    )
+    sends = SEND_SCHEDULER.stats()
+    lines.append(
+        f'Отправка: очередь {sends.queued} (макс. {sends.max_queued}), отправлено {sends.sent}, '
+        f'ошибок {sends.failed}, '
+        f'задержано {sends.delayed}, среднее ожидание {sends.avg_wait * 1000:.1f} мс, '
+        f'макс. {sends.max_wait * 1000:.1f} мс, повторов после 429 {sends.retries}'
+    )
+    lanes = CHAT_WORKERS.stats()
+    if lanes:
+        lines.append(
+            f'Потоки чатов: очереди {[lane.depth for lane in lanes]}, '
+            f'макс. {max(lane.max_depth for lane in lanes)}, обработано {sum(lane.handled for lane in lanes)}, '
+            f'макс. среднее ожидание {max(lane.avg_wait for lane in lanes) * 1000:.1f} мс'
+        )
+    bus = get_cache_invalidation_stats()
+    if bus is not None:
+        lines.append(f'Инвалидация: опросов {bus.polls}, изменений {bus.changes_seen}, последнее #{bus.last_change_id}')
+    if snapshot.slow_queries:
+        lines.append('')
+        lines.append(f'<b>Медленные запросы (≥ {snapshot.slow_query_threshold * 1000:.0f} мс)</b>')
+    for slow in snapshot.slow_queries[-RECENT_SLOW_QUERIES:]:
+        lines.append(
+            f'<code>{escape(slow.routine)}</code> {slow.duration * 1000:.1f} мс {escape(slow.params)}\n'
+            f'<code>{escape(slow.sql[:300])}</code>'
+        )
+    while len(lines) > 1 and len('\n'.join(lines)) > MESSAGE_LIMIT:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+@router.message(Command('db_stats'), F.from_user.id == ADMIN_ID)
+async def command_db_stats_handler(message: Message) -> None:
+    """Send database instrumentation counters to the admin."""
+    await message.answer(format_db_stats())
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import time
+from copy import copy, deepcopy
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+from students_crm.db.models import FsmRecord
+from students_crm.db.routines import delete_stale_fsm_records, get_fsm_record, save_fsm_records
+from students_crm.utils.constants import FSM_IDLE_SECONDS, FSM_STATE_TTL_HOURS
+
+CLEANUP_INTERVAL = 60.0
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    # `data` as JSON, kept from the load or the last `set_data` so a flush does not serialize it again.
+    dumped: str | None = None
+    dirty: bool = False
+    touched: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True)
+class FsmStorageStats:
+    cached: int
+    dirty: int
+    flushes: int
+    records_written: int
+    evicted: int
+    expired: int
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage persisted in the `fsm_storage` table behind a write-back layer in memory.
+
+    A chat is loaded once and then served from memory. Writes only mark it dirty; `flush()`
+    persists every dirty chat in one write, and `FSMFlushMiddleware` calls it at the end of
+    each update, so the several `update_data` calls of one handler cost a single commit.
+    The cleanup loop started by `start()` flushes leftovers, evicts chats idle for
+    `idle_seconds` from memory and deletes rows nobody wrote for `ttl_hours`.
+    """
+
+    def __init__(
+        self,
+        *,
+        idle_seconds: float = FSM_IDLE_SECONDS,
+        ttl_hours: int = FSM_STATE_TTL_HOURS,
+        cleanup_interval: float = CLEANUP_INTERVAL,
+    ) -> None:
+        self.idle_seconds = idle_seconds
+        self.ttl_hours = ttl_hours
+        self.cleanup_interval = cleanup_interval
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._entries: dict[str, _Entry] = {}
+        self._task: asyncio.Task | None = None
+        self._flushes = 0
+        self._written = 0
+        self._evicted = 0
+        self._expired = 0
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        name = self._key_builder.build(key)
+        entry = self._entries.get(name)
+        if entry is None:
+            record = await get_fsm_record(name)
+            loaded = _Entry() if record is None else _Entry(record.state, json.loads(record.data), record.data)
+            # Another handler may have loaded and changed the same chat while we were waiting.
+            entry = self._entries.setdefault(name, loaded)
+        entry.touched = time.monotonic()
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.dirty = True
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f'Data must be a dict or dict-like object, got {type(data).__name__}')
+        # Refuse what `flush()` could not persist, while the caller can still see the error.
+        try:
+            dumped = json.dumps(data, ensure_ascii=False)
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f'FSM data must be JSON serializable: {exc}') from exc
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        entry.dumped = dumped
+        entry.dirty = True
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Any | None = None) -> Any | None:
+        return copy((await self._entry(storage_key)).data.get(dict_key, default))
+
+    async def flush(self, key: StorageKey | None = None) -> None:
+        """Write dirty chats to the database; only `key` if given, otherwise all of them."""
+        names = [self._key_builder.build(key)] if key is not None else list(self._entries)
+        records: list[FsmRecord] = []
+        for name in names:
+            entry = self._entries.get(name)
+            if entry is None or not entry.dirty:
+                continue
+            if entry.dumped is None:
+                try:
+                    entry.dumped = json.dumps(entry.data, ensure_ascii=False)
+                except (TypeError, ValueError) as exc:
+                    # Left dirty: it stays in memory and is retried instead of silently going stale in the database.
+                    logging.log(level=logging.ERROR, msg=f'FSM data of {name} is not JSON serializable: {exc}')
+                    continue
+            records.append(FsmRecord(name, entry.state, entry.dumped))
+            entry.dirty = False
+        if not records:
+            return
+        result = await save_fsm_records(records)
+        if not result:
+            for record in records:
+                entry = self._entries.get(record.key)
+                if entry is not None:
+                    entry.dirty = True
+            return
+        self._flushes += 1
+        self._written += len(records)
+
+    async def cleanup(self) -> None:
+        """Flush leftovers, evict idle chats from memory and delete expired rows."""
+        await self.flush()
+        deadline = time.monotonic() - self.idle_seconds
+        idle = [name for name, entry in self._entries.items() if not entry.dirty and entry.touched < deadline]
+        for name in idle:
+            del self._entries[name]
+        self._evicted += len(idle)
+        result = await delete_stale_fsm_records(self.ttl_hours)
+        if result:
+            self._expired += result.data
+
+    async def _cleanup_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                await self.cleanup()
+            except Exception as exc:
+                logging.log(level=logging.ERROR, msg=exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._cleanup_loop(), name='fsm-storage-cleanup')
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def stats(self) -> FsmStorageStats:
+        return FsmStorageStats(
+            cached=len(self._entries),
+            dirty=sum(entry.dirty for entry in self._entries.values()),
+            flushes=self._flushes,
+            records_written=self._written,
+            evicted=self._evicted,
+            expired=self._expired,
+        )
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """Flush the chat's FSM changes once the whole update has been handled."""
+
+    def __init__(self, storage: SQLiteStorage) -> None:
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            state = data.get('state')
+            if state is not None:
+                await self.storage.flush(state.key)
+
+
+class SnapshotFSMContext(FSMContext):
+    """FSM context that reads the chat's data once and keeps changes in memory until `commit()`.
+
+    `get_data`, `get_value` and `update_data` work on the snapshot; the state itself still
+    goes straight to the storage.
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey) -> None:
+        super().__init__(storage, key)
+        self._data: dict[str, Any] | None = None
+        self._loaded: dict[str, Any] | None = None
+
+    async def _snapshot(self) -> dict[str, Any]:
+        if self._data is None:
+            self._data = await self.storage.get_data(key=self.key)
+            self._loaded = deepcopy(self._data)
+        return self._data
+
+    async def get_data(self) -> dict[str, Any]:
+        return (await self._snapshot()).copy()
+
+    async def get_value(self, key: str, default: Any | None = None) -> Any | None:
+        return copy((await self._snapshot()).get(key, default))
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f'Data must be a dict or dict-like object, got {type(data).__name__}')
+        await self._snapshot()
+        self._data = data.copy()
+
+    async def update_data(self, data: Mapping[str, Any] | None = None, **kwargs: Any) -> dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        snapshot = await self._snapshot()
+        snapshot.update(kwargs)
+        return snapshot.copy()
+
+    async def commit(self) -> bool:
+        """Write the snapshot back if it differs from what was loaded; returns whether it did."""
+        if self._data is None or self._data == self._loaded:
+            return False
+        await self.storage.set_data(key=self.key, data=self._data)
+        self._loaded = deepcopy(self._data)
+        return True
+
+
+class FSMSnapshotMiddleware(BaseMiddleware):
+    """Hand handlers a `SnapshotFSMContext` and write its data back once the update is handled."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        state = data.get('state')
+        if state is None:
+            return await handler(event, data)
+        snapshot = SnapshotFSMContext(state.storage, state.key)
+        data['state'] = snapshot
+        try:
+            return await handler(event, data)
+        finally:
+            await snapshot.commit()
@@ -11,6 +11,7 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.utils.media_group import MediaGroupBuilder
 
 from students_crm.utils.constants import ADMIN_ID, DEBUG
 from students_crm.students_bot.homework_formatting import (
@@ -28,13 +29,20 @@ from students_crm.students_bot.homework_keyboards import (
     _attachments_keyboard,
     _build_admin_mcq_keyboard,
     _build_back_to_questions_keyboard,
-    _build_mcq_keyboard,
     _build_question_list_keyboard,
     _build_status_filter_keyboard,
     _build_submit_keyboard,
     _done_keyboard,
     _skip_keyboard,
 )
+from students_crm.students_bot.homework_pages import (
+    AssignmentListPage,
+    get_assignment_list_page,
+    get_mcq_keyboard_layout,
+)
+from students_crm.students_bot.message_cleanup import schedule_deletion
+from students_crm.students_bot.message_registry import MESSAGE_REGISTRY
+from students_crm.students_bot.screens import SCREEN_MESSAGE_KEY, show_screen, take_tracked_messages
 from students_crm.students_bot.homework_states import (
     ADMIN_STATES,
     STUDENT_ASSIGNMENT_STATE,
@@ -43,30 +51,28 @@ from students_crm.students_bot.homework_states import (
     AdminCreateStates,
     StudentAnswerStates,
 )
+from students_crm.students_bot.template_purge import start_template_purge
+from students_crm.db.models import AssignmentScreen
 from students_crm.db.routines import (
     add_homework_question,
     assign_template_to_student,
     create_homework_template,
     delete_homework_question,
     delete_homework_template,
-    get_assignment_question_counts,
-    get_assignment_max_attempt_index,
+    get_assignment_screen,
     get_assignment_view,
     get_attempt_count,
     get_homework_question,
     get_homework_template,
     get_latest_attempt_for_question,
     get_latest_draft_template,
-    get_next_unanswered_question,
     get_registered_students,
     list_attempt_attachments,
     list_attempt_option_texts,
-    list_homework_question_attachments,
     list_homework_question_options,
     list_homework_questions,
     list_homework_templates,
     list_assignment_question_progress,
-    list_assignment_max_attempts,
     list_student_assignments_by_statuses,
     publish_homework_template,
     record_assignment_attempt,
@@ -86,9 +92,8 @@ SKIP_WORDS = {'skip', 'пропустить', '-'}
 MAX_QUESTION_ATTACHMENTS = 1
 MAX_STUDENT_ATTACHMENTS = 10
 MAX_OPTIONS = 10
+MEDIA_GROUP_SIZE = 10
 ASSIGNMENTS_PAGE_SIZE = 10
-UI_MESSAGE_IDS: dict[int, list[int]] = {}
-MAX_TRACKED_MESSAGES = 200
 
 
 def _is_skip_message(text: str | None) -> bool:
@@ -100,34 +105,21 @@ def _is_skip_message(text: str | None) -> bool:
 async def _track_message(state: FSMContext, message: Message | None) -> None:
     if not message:
         return
-    data = await state.get_data()
-    tracked = data.get('ui_message_ids', [])
-    chat_id = message.chat.id
-    if message.message_id not in tracked:
-        tracked.append(message.message_id)
-    await state.update_data(ui_message_ids=tracked)
-    chat_tracked = UI_MESSAGE_IDS.setdefault(chat_id, [])
-    if message.message_id not in chat_tracked:
-        chat_tracked.append(message.message_id)
-        if len(chat_tracked) > MAX_TRACKED_MESSAGES:
-            del chat_tracked[:-MAX_TRACKED_MESSAGES]
+    _track_messages([message])
+
+
+def _track_messages(messages: list[Message]) -> None:
+    for message in messages:
+        MESSAGE_REGISTRY.track(message.chat.id, message.message_id)
 
 
 async def _clear_tracked_messages(message: Message | None, state: FSMContext) -> None:
     if not message:
         return
     data = await state.get_data()
-    chat_id = message.chat.id
-    tracked = list(dict.fromkeys(data.get('ui_message_ids', []) + UI_MESSAGE_IDS.get(chat_id, [])))
-    if not tracked:
-        return
-    for message_id in tracked:
-        try:
-            await message.bot.delete_message(chat_id, message_id)
-        except Exception:
-            continue
-    await state.update_data(ui_message_ids=[])
-    UI_MESSAGE_IDS[chat_id] = []
+    schedule_deletion(message.bot, message.chat.id, await take_tracked_messages(message.chat.id, data))
+    data[SCREEN_MESSAGE_KEY] = None
+    await state.set_data(data)
 
 
 async def _send_tracked(message: Message, state: FSMContext, *args, **kwargs) -> Message:
@@ -157,6 +149,11 @@ def _extract_attachments(message: Message, limit: int = MAX_STUDENT_ATTACHMENTS)
     return attachments[:limit]
 
 
+def _extract_album_attachments(messages: list[Message], limit: int = MAX_STUDENT_ATTACHMENTS) -> list[tuple[str, str]]:
+    attachments = [attachment for item in messages for attachment in _extract_attachments(item, limit)]
+    return attachments[:limit]
+
+
 async def _send_free_order_question_list(
     message: Message,
     assignment_id: int,
@@ -168,15 +165,11 @@ async def _send_free_order_question_list(
     progress = await list_assignment_question_progress(assignment_id, student_tg_id)
     if not progress:
         if state is not None:
-            if clear_previous:
-                await _clear_tracked_messages(message, state)
-            await _send_tracked(message, state, 'В задании нет вопросов.')
+            await show_screen(message, state, 'В задании нет вопросов.', replace=clear_previous)
         else:
             await message.answer('В задании нет вопросов.')
         return
     if state is not None:
-        if clear_previous:
-            await _clear_tracked_messages(message, state)
         await state.update_data(active_assignment_id=assignment_id)
         await state.set_state(StudentAnswerStates.in_assignment)
     legend = '🟦 - нет ответа\n🟩 - есть ответ'
@@ -185,7 +178,7 @@ async def _send_free_order_question_list(
         text = f'{text}\n{note}'
     keyboard = _build_question_list_keyboard(assignment_id, progress)
     if state is not None:
-        await _send_tracked(message, state, text, reply_markup=keyboard.as_markup())
+        await show_screen(message, state, text, keyboard.as_markup(), replace=clear_previous)
     else:
         await message.answer(text, reply_markup=keyboard.as_markup())
 
@@ -277,21 +270,15 @@ async def _is_admin_busy(state: FSMContext) -> bool:
 async def _get_remaining_attempts(
     assignment,
     student_tg_id: int,
-    *,
-    max_used: int | None = None,
 ) -> int | None:
     if assignment.max_attempts is None:
         return None
-    if max_used is None:
-        max_used = await get_assignment_max_attempt_index(assignment.id, student_tg_id)
-    return max(0, assignment.max_attempts - max_used)
+    return max(0, assignment.max_attempts - assignment.max_attempt_index)
 
 
 async def _assignment_attempts_line(
     assignment,
     student_tg_id: int,
-    *,
-    max_used: int | None = None,
 ) -> str:
     if assignment.max_attempts is None:
         if assignment.status == STATUS_OPTIONS['not_solved']:
@@ -299,21 +286,11 @@ async def _assignment_attempts_line(
         return 'Осталось попыток: не ограничено'
     if assignment.status == STATUS_OPTIONS['not_solved']:
         return f'Попытки: {assignment.max_attempts}'
-    remaining = await _get_remaining_attempts(
-        assignment,
-        student_tg_id,
-        max_used=max_used,
-    )
+    remaining = await _get_remaining_attempts(assignment, student_tg_id)
     return f'Осталось попыток: {remaining}'
 
 
-async def _send_assignment_list(
-    message: Message,
-    student_tg_id: int,
-    statuses: list[str],
-    page: int = 0,
-    state: FSMContext | None = None,
-) -> None:
+async def _render_assignment_list(student_tg_id: int, statuses: list[str], page: int) -> AssignmentListPage:
     page_size = ASSIGNMENTS_PAGE_SIZE
     offset = page * page_size
     assignments = await list_student_assignments_by_statuses(
@@ -323,34 +300,16 @@ async def _send_assignment_list(
         offset=offset,
     )
     if not assignments:
-        empty_message = 'Больше заданий нет.' if page > 0 else 'Нет заданий с выбранным статусом.'
-        if state is not None:
-            await _clear_tracked_messages(message, state)
-            await _send_tracked(message, state, empty_message)
-        else:
-            await message.answer(empty_message)
-        return
+        return AssignmentListPage('Больше заданий нет.' if page > 0 else 'Нет заданий с выбранным статусом.')
     has_next = len(assignments) > page_size
     page_items = assignments[:page_size]
     if not page_items:
-        if state is not None:
-            await _clear_tracked_messages(message, state)
-            await _send_tracked(message, state, 'Больше заданий нет.')
-        else:
-            await message.answer('Больше заданий нет.')
-        return
+        return AssignmentListPage('Больше заданий нет.')
 
-    assignment_ids = [assignment.id for assignment in page_items]
-    max_attempts_by_assignment = await list_assignment_max_attempts(student_tg_id, assignment_ids)
     lines: list[str] = []
     builder = InlineKeyboardBuilder()
     for idx, assignment in enumerate(page_items, start=1):
-        max_used = max_attempts_by_assignment.get(assignment.id, 0)
-        attempts_line = await _assignment_attempts_line(
-            assignment,
-            student_tg_id,
-            max_used=max_used,
-        )
+        attempts_line = await _assignment_attempts_line(assignment, student_tg_id)
         description = assignment.text or '—'
         soft_deadline = _format_deadline(assignment.soft_deadline)
         hard_deadline = _format_deadline(assignment.hard_deadline)
@@ -378,18 +337,21 @@ async def _send_assignment_list(
                 callback_data=f'hw_assignments_page:{page + 1}',
             )
         )
+    return AssignmentListPage('\n\n'.join(lines), builder.as_markup())
 
+
+async def _send_assignment_list(
+    message: Message,
+    student_tg_id: int,
+    statuses: list[str],
+    page: int = 0,
+    state: FSMContext | None = None,
+) -> None:
+    rendered = await get_assignment_list_page(student_tg_id, statuses, page, _render_assignment_list)
     if state is not None:
-        await _clear_tracked_messages(message, state)
-        await _send_tracked(
-            message,
-            state,
-            '\n\n'.join(lines),
-            reply_markup=builder.as_markup(),
-            parse_mode='HTML',
-        )
+        await show_screen(message, state, rendered.text, rendered.reply_markup, parse_mode='HTML')
     else:
-        await message.answer('\n\n'.join(lines), reply_markup=builder.as_markup(), parse_mode='HTML')
+        await message.answer(rendered.text, reply_markup=rendered.reply_markup, parse_mode='HTML')
 
 
 async def _submit_assignment(
@@ -424,37 +386,25 @@ async def _send_assignment_report(
     progress = await list_assignment_question_progress(assignment.id, student_tg_id)
     if not progress:
         if state is not None:
-            await _clear_tracked_messages(message, state)
-            await _send_tracked(message, state, 'В задании нет вопросов.')
+            await show_screen(message, state, 'В задании нет вопросов.')
         else:
             await message.answer('В задании нет вопросов.')
         return
     lines = [f'Вопрос {item.order_index}: {_result_label(item)}' for item in progress]
-    if state is not None:
-        await _clear_tracked_messages(message, state)
-        await _send_tracked(message, state, 'Результаты по вопросам:\n' + '\n'.join(lines))
-    else:
-        await message.answer('Результаты по вопросам:\n' + '\n'.join(lines))
     attempts_line = await _assignment_attempts_line(assignment, student_tg_id)
     remaining = await _get_remaining_attempts(assignment, student_tg_id)
+    text = 'Результаты по вопросам:\n' + '\n'.join(lines) + f'\n\n{attempts_line}'
+    reply_markup = None
     if remaining is None or remaining > 0:
+        text = f'{text}\nХотите попробовать снова?'
         builder = InlineKeyboardBuilder()
         builder.button(text='Новая попытка', callback_data=f'hw_retry:{assignment.id}')
         builder.adjust(1)
-        if state is not None:
-            await _send_tracked(
-                message,
-                state,
-                f'{attempts_line}\nХотите попробовать снова?',
-                reply_markup=builder.as_markup(),
-            )
-        else:
-            await message.answer(f'{attempts_line}\nХотите попробовать снова?', reply_markup=builder.as_markup())
-        return
+        reply_markup = builder.as_markup()
     if state is not None:
-        await _send_tracked(message, state, attempts_line)
+        await show_screen(message, state, text, reply_markup)
     else:
-        await message.answer(attempts_line)
+        await message.answer(text, reply_markup=reply_markup)
 
 
 async def _send_assignment_retry_prompt(
@@ -490,31 +440,39 @@ async def _send_assignment_retry_prompt(
 
 
 async def _send_attachments(message: Message, attachments, state: FSMContext | None = None) -> None:
-    for attachment in attachments:
-        if attachment.file_type == 'photo':
-            if state:
-                await _send_tracked_photo(message, state, attachment.file_id)
+    # Telegram does not mix photos and documents in one album, so each kind goes out on its own.
+    photos = [attachment.file_id for attachment in attachments if attachment.file_type == 'photo']
+    documents = [attachment.file_id for attachment in attachments if attachment.file_type != 'photo']
+    for file_ids, is_photo in ((photos, True), (documents, False)):
+        for start in range(0, len(file_ids), MEDIA_GROUP_SIZE):
+            chunk = file_ids[start : start + MEDIA_GROUP_SIZE]
+            if len(chunk) == 1:
+                # An album needs at least two items.
+                send = message.answer_photo if is_photo else message.answer_document
+                sent = [await send(chunk[0])]
             else:
-                await message.answer_photo(attachment.file_id)
-        else:
+                album = MediaGroupBuilder()
+                for file_id in chunk:
+                    if is_photo:
+                        album.add_photo(media=file_id)
+                    else:
+                        album.add_document(media=file_id)
+                sent = await message.answer_media_group(album.build())
             if state:
-                await _send_tracked_document(message, state, attachment.file_id)
-            else:
-                await message.answer_document(attachment.file_id)
+                _track_messages(sent)
 
 
 async def _send_control_panel(message: Message, state: FSMContext, note: str | None = None) -> None:
-    await _clear_tracked_messages(message, state)
     data = await state.get_data()
     draft_id = data.get('draft_id')
     current_question_id = data.get('current_question_id')
     if not draft_id:
-        await _send_tracked(message, state, 'Черновик не найден. Используйте /assignments.')
+        await show_screen(message, state, 'Черновик не найден. Используйте /assignments.')
         return
 
     template = await get_homework_template(draft_id)
     if not template:
-        await _send_tracked(message, state, 'Черновик не найден. Используйте /assignments.')
+        await show_screen(message, state, 'Черновик не найден. Используйте /assignments.')
         return
 
     questions = await list_homework_questions(draft_id)
@@ -551,7 +509,7 @@ async def _send_control_panel(message: Message, state: FSMContext, note: str | N
     builder.button(text=publish_label, callback_data='draft:publish')
     builder.button(text='❌ Выйти', callback_data='draft:exit')
     builder.adjust(2)
-    await _send_tracked(message, state, '\n'.join(summary), reply_markup=builder.as_markup())
+    await show_screen(message, state, '\n'.join(summary), builder.as_markup())
 
 
 @router.message(Command('assignments'))
@@ -730,7 +688,8 @@ async def admin_delete_template_confirm(callback: CallbackQuery, state: FSMConte
         return
     await state.clear()
     await _clear_tracked_messages(callback.message, state)
-    await _send_tracked(callback.message, state, 'Задание удалено.')
+    await _send_tracked(callback.message, state, 'Задание удалено. Связанные данные очищаются в фоне.')
+    start_template_purge(callback.bot, int(template_id), callback.message.chat.id)
     await callback.answer()
 
 
@@ -978,9 +937,13 @@ async def admin_question_text_handler(message: Message, state: FSMContext) -> No
     )
 
 
-@router.message(AdminCreateStates.waiting_for_question_attachments, F.from_user.id == ADMIN_ID)
-async def admin_question_attachments_handler(message: Message, state: FSMContext) -> None:
-    await _track_message(state, message)
+@router.message(AdminCreateStates.waiting_for_question_attachments, F.from_user.id == ADMIN_ID, flags={'album': True})
+async def admin_question_attachments_handler(
+    message: Message,
+    state: FSMContext,
+    album: list[Message] | None = None,
+) -> None:
+    _track_messages(album or [message])
     data = await state.get_data()
     question_id = data.get('question_id')
     question_type = data.get('question_type')
@@ -1443,9 +1406,13 @@ async def admin_edit_question_points_handler(message: Message, state: FSMContext
     await _send_control_panel(message, state, note='Баллы обновлены.')
 
 
-@router.message(AdminCreateStates.waiting_for_edit_attachments, F.from_user.id == ADMIN_ID)
-async def admin_edit_question_attachments_handler(message: Message, state: FSMContext) -> None:
-    await _track_message(state, message)
+@router.message(AdminCreateStates.waiting_for_edit_attachments, F.from_user.id == ADMIN_ID, flags={'album': True})
+async def admin_edit_question_attachments_handler(
+    message: Message,
+    state: FSMContext,
+    album: list[Message] | None = None,
+) -> None:
+    _track_messages(album or [message])
     data = await state.get_data()
     question_id = data.get('edit_question_id')
     attachments = data.get('pending_attachments', [])
@@ -1823,13 +1790,13 @@ async def homework_assignment_selected(callback: CallbackQuery, state: FSMContex
     await state.update_data(active_assignment_id=assignment_id)
     await state.set_state(StudentAnswerStates.in_assignment)
     if assignment.answering_mode == 'FIXED':
-        question = await get_next_unanswered_question(assignment_id, callback.from_user.id)
-        if not question:
+        screen = await get_assignment_screen(assignment_id, callback.from_user.id)
+        if not screen or not screen.question:
             await _clear_tracked_messages(callback.message, state)
             await _send_tracked(callback.message, state, 'Все вопросы уже отвечены.')
             await callback.answer()
             return
-        await _present_question(callback.message, state, assignment, question, callback.from_user.id)
+        await _present_question(callback.message, state, screen, callback.from_user.id)
         await callback.answer()
         return
 
@@ -1855,7 +1822,7 @@ async def homework_submit_prompt(callback: CallbackQuery, state: FSMContext) ->
         await _send_tracked(callback.message, state, 'Задание не найдено.')
         await callback.answer()
         return
-    total, answered = await get_assignment_question_counts(assignment_id, callback.from_user.id)
+    total, answered = assignment.question_total, assignment.answered_count
     if answered < total:
         builder = InlineKeyboardBuilder()
         builder.button(text='Сдать', callback_data=f'hw_submit_confirm:{assignment_id}')
@@ -1999,23 +1966,23 @@ async def homework_question_selected(callback: CallbackQuery, state: FSMContext)
         await _notify_student_busy(callback.message, state)
         await callback.answer()
         return
-    assignment = await get_assignment_view(int(assignment_id), callback.from_user.id)
-    if not assignment:
+    screen = await get_assignment_screen(int(assignment_id), callback.from_user.id, int(question_id))
+    if not screen:
         await _send_tracked(callback.message, state, 'Задание не найдено.')
         await callback.answer()
         return
-    question = await get_homework_question(int(question_id))
-    if not question or question.assignment_id != assignment.template_id:
+    assignment, question = screen.assignment, screen.question
+    if not question:
         await _send_tracked(callback.message, state, 'Вопрос не найден.')
         await callback.answer()
         return
-    attempt = await get_latest_attempt_for_question(int(assignment_id), question.id, callback.from_user.id)
-    if attempt:
+    if screen.attempt_count:
+        attempt = await get_latest_attempt_for_question(int(assignment_id), question.id, callback.from_user.id)
         show_result = assignment.status != STATUS_OPTIONS['not_solved']
         await _send_attempt_preview(callback.message, state, assignment, question, attempt, show_result=show_result)
         await callback.answer()
         return
-    await _present_question(callback.message, state, assignment, question, callback.from_user.id)
+    await _present_question(callback.message, state, screen, callback.from_user.id)
     await callback.answer()
 
 
@@ -2040,18 +2007,17 @@ async def homework_question_edit(callback: CallbackQuery, state: FSMContext) ->
         await _notify_student_busy(callback.message, state)
         await callback.answer()
         return
-    assignment = await get_assignment_view(int(assignment_id), callback.from_user.id)
-    if not assignment:
+    screen = await get_assignment_screen(int(assignment_id), callback.from_user.id, int(question_id))
+    if not screen:
         await _send_tracked(callback.message, state, 'Задание не найдено.')
         await callback.answer()
         return
-    question = await get_homework_question(int(question_id))
-    if not question or question.assignment_id != assignment.template_id:
+    if not screen.question:
         await _send_tracked(callback.message, state, 'Вопрос не найден.')
         await callback.answer()
         return
     await state.update_data(active_assignment_id=int(assignment_id))
-    await _present_question(callback.message, state, assignment, question, callback.from_user.id)
+    await _present_question(callback.message, state, screen, callback.from_user.id)
     await callback.answer()
 
 
@@ -2123,14 +2089,13 @@ async def homework_question_back(callback: CallbackQuery, state: FSMContext) ->
 async def _present_question(
     message: Message,
     state: FSMContext,
-    assignment,
-    question,
+    screen: AssignmentScreen,
     user_id: int,
 ) -> None:
+    assignment, question = screen.assignment, screen.question
     await _clear_tracked_messages(message, state)
     prompt = f'Вопрос #{question.order_index}:\n{question.text}'
     if question.question_type == 'mcq':
-        options = await list_homework_question_options(question.id)
         await state.update_data(
             mcq_selected=[],
             mcq_question_id=question.id,
@@ -2139,33 +2104,32 @@ async def _present_question(
             mcq_answering_mode=assignment.answering_mode,
         )
         await state.set_state(StudentAnswerStates.waiting_for_mcq_selection)
-        keyboard = _build_mcq_keyboard(
+        layout = await get_mcq_keyboard_layout(
             assignment.id,
             question.id,
-            options,
-            set(),
             include_back=assignment.answering_mode == 'FREE',
+            options=screen.options,
         )
-        attachments = await list_homework_question_attachments(question.id)
-        if attachments:
+        keyboard = layout.markup()
+        if screen.attachments:
             await _send_tracked(message, state, prompt)
-            attachment = attachments[0]
+            attachment = screen.attachments[0]
             if attachment.file_type == 'photo':
                 await _send_tracked_photo(
                     message,
                     state,
                     attachment.file_id,
-                    reply_markup=keyboard.as_markup(),
+                    reply_markup=keyboard,
                 )
             else:
                 await _send_tracked_document(
                     message,
                     state,
                     attachment.file_id,
-                    reply_markup=keyboard.as_markup(),
+                    reply_markup=keyboard,
                 )
         else:
-            await _send_tracked(message, state, prompt, reply_markup=keyboard.as_markup())
+            await _send_tracked(message, state, prompt, reply_markup=keyboard)
         return
 
     await state.update_data(
@@ -2175,9 +2139,8 @@ async def _present_question(
         answer_answering_mode=assignment.answering_mode,
     )
     await _send_tracked(message, state, prompt)
-    attachments = await list_homework_question_attachments(question.id)
-    if attachments:
-        await _send_attachments(message, attachments, state=state)
+    if screen.attachments:
+        await _send_attachments(message, screen.attachments, state=state)
     if question.question_type == 'short':
         await state.set_state(StudentAnswerStates.waiting_for_text_answer)
         if assignment.answering_mode == 'FREE':
@@ -2226,15 +2189,12 @@ async def homework_mcq_toggle(callback: CallbackQuery, state: FSMContext) -> Non
     else:
         selected.add(option_id)
     await state.update_data(mcq_selected=list(selected))
-    options = await list_homework_question_options(int(question_id))
-    keyboard = _build_mcq_keyboard(
+    layout = await get_mcq_keyboard_layout(
         int(assignment_id),
         int(question_id),
-        options,
-        selected,
         include_back=data.get('mcq_answering_mode') == 'FREE',
     )
-    await callback.message.edit_reply_markup(reply_markup=keyboard.as_markup())
+    await callback.message.edit_reply_markup(reply_markup=layout.markup(layout.mask(selected)))
     await callback.answer()
 
 
@@ -2252,12 +2212,12 @@ async def homework_mcq_submit(callback: CallbackQuery, state: FSMContext) -> Non
         await callback.answer('Выберите хотя бы один вариант.', show_alert=True)
         return
 
-    assignment = await get_assignment_view(assignment_id, callback.from_user.id)
-    if not assignment:
+    screen = await get_assignment_screen(assignment_id, callback.from_user.id, question_id)
+    if not screen:
         await _send_tracked(callback.message, state, 'Задание не найдено.')
         await callback.answer()
         return
-    attempt_count = await get_attempt_count(assignment_id, question_id, callback.from_user.id)
+    assignment, attempt_count = screen.assignment, screen.attempt_count
     if assignment.max_attempts is not None and attempt_count >= assignment.max_attempts:
         await _clear_tracked_messages(callback.message, state)
         await _send_tracked(callback.message, state, 'Лимит попыток исчерпан.')
@@ -2273,10 +2233,8 @@ async def homework_mcq_submit(callback: CallbackQuery, state: FSMContext) -> Non
         await callback.answer()
         return
 
-    question = await get_homework_question(question_id)
-    points = question.points if question else 1.0
-    options = await list_homework_question_options(question_id)
-    correct_ids = {opt.id for opt in options if opt.is_correct}
+    points = screen.question.points if screen.question else 1.0
+    correct_ids = {opt.id for opt in screen.options if opt.is_correct}
     score = _calculate_mcq_score(selected, correct_ids, points)
     is_correct = 1 if score >= points and points > 0 else 0
     await record_assignment_attempt(
@@ -2346,11 +2304,16 @@ async def _finalize_open_answer(
     )
 
 
-@router.message(StudentAnswerStates.waiting_for_open_text)
-async def homework_open_text_answer(message: Message, state: FSMContext) -> None:
+@router.message(StudentAnswerStates.waiting_for_open_text, flags={'album': True})
+async def homework_open_text_answer(
+    message: Message,
+    state: FSMContext,
+    album: list[Message] | None = None,
+) -> None:
     if not message.from_user:
         return
-    await _track_message(state, message)
+    messages = album or [message]
+    _track_messages(messages)
     data = await state.get_data()
     assignment_id = data.get('answer_assignment_id')
     question_id = data.get('answer_question_id')
@@ -2388,10 +2351,11 @@ async def homework_open_text_answer(message: Message, state: FSMContext) -> None
         )
         return
 
-    raw_text = message.text or message.caption or ''
+    # Only one item of an album carries the caption.
+    raw_text = next((item.text or item.caption for item in messages if item.text or item.caption), '')
     text = raw_text.strip()
     skip_requested = _is_skip_message(raw_text)
-    attachments = _extract_attachments(message, MAX_STUDENT_ATTACHMENTS)
+    attachments = _extract_album_attachments(messages, MAX_STUDENT_ATTACHMENTS)
 
     if not text and not attachments and not skip_requested:
         await _send_tracked(
@@ -2433,10 +2397,11 @@ async def homework_open_text_answer(message: Message, state: FSMContext) -> None
                 attempt_index=attempt_count + 1,
             )
             return
+        added = 'Вложения добавлены' if len(attachments) > 1 else 'Вложение добавлено'
         await _send_tracked(
             message,
             state,
-            'Вложение добавлено. Можно отправить еще или нажмите "Готово".',
+            f'{added}. Можно отправить еще или нажмите "Готово".',
             reply_markup=_attachments_keyboard('open', attachments),
         )
         return
@@ -2449,11 +2414,16 @@ async def homework_open_text_answer(message: Message, state: FSMContext) -> None
     )
 
 
-@router.message(StudentAnswerStates.waiting_for_open_attachments)
-async def homework_open_attachments(message: Message, state: FSMContext) -> None:
+@router.message(StudentAnswerStates.waiting_for_open_attachments, flags={'album': True})
+async def homework_open_attachments(
+    message: Message,
+    state: FSMContext,
+    album: list[Message] | None = None,
+) -> None:
     if not message.from_user:
         return
-    await _track_message(state, message)
+    messages = album or [message]
+    _track_messages(messages)
     data = await state.get_data()
     assignment_id = data.get('answer_assignment_id')
     question_id = data.get('answer_question_id')
@@ -2480,7 +2450,7 @@ async def homework_open_attachments(message: Message, state: FSMContext) -> None
         )
         return
 
-    new_attachments = _extract_attachments(message, MAX_STUDENT_ATTACHMENTS)
+    new_attachments = _extract_album_attachments(messages, MAX_STUDENT_ATTACHMENTS)
     if not new_attachments:
         if not attachments:
             prompt = 'Отправьте вложение или нажмите "Пропустить".'
@@ -2531,10 +2501,11 @@ async def homework_open_attachments(message: Message, state: FSMContext) -> None
         )
         return
 
+    added = 'Вложения добавлены' if len(new_attachments) > 1 else 'Вложение добавлено'
     await _send_tracked(
         message,
         state,
-        'Вложение добавлено. Можно отправить еще или нажмите "Готово".',
+        f'{added}. Можно отправить еще или нажмите "Готово".',
         reply_markup=_attachments_keyboard('open', attachments),
     )
 
@@ -2555,14 +2526,14 @@ async def homework_text_answer(message: Message, state: FSMContext) -> None:
         await state.clear()
         return
 
-    assignment = await get_assignment_view(assignment_id, message.from_user.id)
-    if not assignment:
+    screen = await get_assignment_screen(assignment_id, message.from_user.id, question_id)
+    if not screen:
         await _clear_tracked_messages(message, state)
         await _send_tracked(message, state, 'Задание не найдено.')
         await state.clear()
         return
 
-    attempt_count = await get_attempt_count(assignment_id, question_id, message.from_user.id)
+    assignment, question, attempt_count = screen.assignment, screen.question, screen.attempt_count
     if assignment.max_attempts is not None and attempt_count >= assignment.max_attempts:
         await _clear_tracked_messages(message, state)
         await _send_tracked(
@@ -2588,7 +2559,6 @@ async def homework_text_answer(message: Message, state: FSMContext) -> None:
         await _send_tracked(message, state, 'Отправьте текст ответа или вложение.')
         return
 
-    question = await get_homework_question(question_id)
     is_correct: int | None = None
     score: float | None = None
     if question and question.question_type == 'short':
@@ -2631,11 +2601,9 @@ async def _post_answer_flow(
     if clear_previous:
         await _clear_tracked_messages(message, state)
     if answering_mode == 'FIXED':
-        next_question = await get_next_unanswered_question(assignment_id, student_tg_id)
-        if next_question:
-            assignment = await get_assignment_view(assignment_id, student_tg_id)
-            if assignment:
-                await _present_question(message, state, assignment, next_question, student_tg_id)
+        screen = await get_assignment_screen(assignment_id, student_tg_id)
+        if screen and screen.question:
+            await _present_question(message, state, screen, student_tg_id)
             return
         await state.set_state(StudentAnswerStates.in_assignment)
         await _send_tracked(
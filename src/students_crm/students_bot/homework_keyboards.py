@@ -1,4 +1,4 @@
-from aiogram.types import InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from students_crm.students_bot.homework_formatting import STATUS_OPTIONS
@@ -80,28 +80,57 @@ def _build_submit_keyboard(assignment_id: int) -> InlineKeyboardBuilder:
     return builder
 
 
-def _build_mcq_keyboard(
-    assignment_id: int,
-    question_id: int,
-    options,
-    selected_ids: set[int],
-    include_back: bool = False,
-) -> InlineKeyboardBuilder:
-    builder = InlineKeyboardBuilder()
-    for option in options:
-        prefix = '✅ ' if option.id in selected_ids else '☐ '
-        builder.button(
-            text=f'{prefix}{option.option_text}',
-            callback_data=f'hw_mcq_toggle:{assignment_id}:{question_id}:{option.id}',
-        )
-    builder.button(text='✅ Ответить', callback_data=f'hw_mcq_submit:{assignment_id}:{question_id}')
-    if include_back:
-        builder.button(
-            text='⬅️ К списку вопросов (без сохранения)',
-            callback_data=f'hw_question_back:{assignment_id}',
+class McqKeyboardLayout:
+    """Student MCQ keyboard of one question, built once from its options.
+
+    A selection is a bitmask over option positions: bit `i` set means the `i`-th option is
+    checked. Variants differ only in the check-mark prefixes; the first `MAX_VARIANTS`
+    distinct selections are kept, so toggling back and forth reuses the same markup.
+    """
+
+    MAX_VARIANTS = 64
+
+    def __init__(self, assignment_id: int, question_id: int, options, include_back: bool = False) -> None:
+        self.option_ids = tuple(option.id for option in options)
+        self._positions = {option_id: position for position, option_id in enumerate(self.option_ids)}
+        self._buttons = tuple(
+            (option.option_text, f'hw_mcq_toggle:{assignment_id}:{question_id}:{option.id}') for option in options
         )
-    builder.adjust(1)
-    return builder
+        self._tail = [
+            [InlineKeyboardButton(text='✅ Ответить', callback_data=f'hw_mcq_submit:{assignment_id}:{question_id}')]
+        ]
+        if include_back:
+            self._tail.append(
+                [
+                    InlineKeyboardButton(
+                        text='⬅️ К списку вопросов (без сохранения)',
+                        callback_data=f'hw_question_back:{assignment_id}',
+                    )
+                ]
+            )
+        self._variants: dict[int, InlineKeyboardMarkup] = {}
+
+    def mask(self, selected_ids) -> int:
+        """Return the bitmask of `selected_ids`; ids not among the options are ignored."""
+        mask = 0
+        for option_id in selected_ids:
+            position = self._positions.get(option_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def markup(self, mask: int = 0) -> InlineKeyboardMarkup:
+        markup = self._variants.get(mask)
+        if markup is not None:
+            return markup
+        rows = [
+            [InlineKeyboardButton(text=f'{"✅ " if mask >> position & 1 else "☐ "}{text}', callback_data=data)]
+            for position, (text, data) in enumerate(self._buttons)
+        ]
+        markup = InlineKeyboardMarkup(inline_keyboard=rows + self._tail)
+        if len(self._variants) < self.MAX_VARIANTS:
+            self._variants[mask] = markup
+        return markup
 
 
 def _build_admin_mcq_keyboard(options, selected_ids: set[int]) -> InlineKeyboardBuilder:
@@ -0,0 +1,91 @@
+from typing import Awaitable, Callable, NamedTuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from students_crm.db.cache import MISSING, CacheStats, VersionedLRUCache
+from students_crm.db.models import HomeworkOption
+from students_crm.db.routines import (
+    list_homework_question_options,
+    poll_cache_invalidation,
+    subscribe_cache_invalidation,
+)
+from students_crm.students_bot.homework_keyboards import McqKeyboardLayout
+
+ASSIGNMENT_PAGE_CACHE_SIZE = 1024
+MCQ_LAYOUT_CACHE_SIZE = 1024
+
+
+class AssignmentListPage(NamedTuple):
+    text: str
+    reply_markup: InlineKeyboardMarkup | None = None
+
+
+# Rendered /homework list pages keyed by (student, status set, page) and tagged with the student,
+# so any change to that student's assignments or attempts drops all of their pages at once.
+_PAGES = VersionedLRUCache(maxsize=ASSIGNMENT_PAGE_CACHE_SIZE)
+# Student MCQ keyboards keyed by (assignment, question, back button) and tagged with the question.
+_MCQ_LAYOUTS = VersionedLRUCache(maxsize=MCQ_LAYOUT_CACHE_SIZE)
+
+
+async def get_assignment_list_page(
+    student_tg_id: int,
+    statuses: list[str],
+    page: int,
+    render: Callable[[int, list[str], int], Awaitable[AssignmentListPage]],
+) -> AssignmentListPage:
+    """Return a rendered assignment list page, calling `render(student_tg_id, statuses, page)` on a miss."""
+    await poll_cache_invalidation()
+    key = (student_tg_id, frozenset(statuses), page)
+    rendered = _PAGES.get(key)
+    if rendered is not MISSING:
+        return rendered
+    generation = _PAGES.generation
+    rendered = await render(student_tg_id, statuses, page)
+    _PAGES.put(key, student_tg_id, rendered, generation)
+    return rendered
+
+
+async def get_mcq_keyboard_layout(
+    assignment_id: int,
+    question_id: int,
+    include_back: bool = False,
+    options: list[HomeworkOption] | None = None,
+) -> McqKeyboardLayout:
+    """Return the keyboard layout of an MCQ question, building it from `options` (or loading them) on a miss."""
+    await poll_cache_invalidation()
+    key = (assignment_id, question_id, include_back)
+    layout = _MCQ_LAYOUTS.get(key)
+    if layout is not MISSING:
+        return layout
+    generation = _MCQ_LAYOUTS.generation
+    if options is None:
+        options = await list_homework_question_options(question_id)
+    layout = McqKeyboardLayout(assignment_id, question_id, options, include_back)
+    _MCQ_LAYOUTS.put(key, question_id, layout, generation)
+    return layout
+
+
+def get_assignment_page_cache_stats() -> CacheStats:
+    return _PAGES.stats()
+
+
+def get_mcq_layout_cache_stats() -> CacheStats:
+    return _MCQ_LAYOUTS.stats()
+
+
+def _invalidate_student(student_tg_id: int | None) -> None:
+    if student_tg_id is None:
+        _PAGES.clear()
+    else:
+        _PAGES.bump(student_tg_id)
+
+
+def _invalidate_all(_template_id: int | None) -> None:
+    # Titles, attempt limits and deleted templates show up on every student's pages;
+    # option edits are rare enough to drop every keyboard instead of mapping questions to templates.
+    _PAGES.clear()
+    _MCQ_LAYOUTS.clear()
+
+
+subscribe_cache_invalidation('student', _invalidate_student)
+subscribe_cache_invalidation('template', _invalidate_all)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import logging
 import sys
@@ -8,24 +9,48 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand, BotCommandScopeChat, BotCommandScopeDefault
 
-from students_crm.utils.constants import ADMIN_ID, API_KEY
-from students_crm.db.routines import init_db
+from students_crm.utils.constants import ADMIN_ID, API_KEY, BOT_MODE
+from students_crm.db.routines import close_db, init_db, open_db
+from students_crm.students_bot.broadcasts import resume_broadcasts
+from students_crm.students_bot.broadcasts import router as broadcasts_router
+from students_crm.students_bot.chat_workers import CHAT_WORKERS
+from students_crm.students_bot.diagnostics import router as diagnostics_router
+from students_crm.students_bot.fsm_storage import FSMFlushMiddleware, FSMSnapshotMiddleware, SQLiteStorage
 from students_crm.students_bot.homework import router as homework_router
+from students_crm.students_bot.media_groups import AlbumMiddleware
+from students_crm.students_bot.message_cleanup import MessageCleanupMiddleware, wait_for_cleanup
+from students_crm.students_bot.message_registry import MESSAGE_REGISTRY
 from students_crm.students_bot.registration import router as registration_router
+from students_crm.students_bot.send_scheduler import SEND_SCHEDULER, RateLimitMiddleware
+from students_crm.students_bot.template_purge import resume_template_purges
+from students_crm.students_bot.webhook import run_webhook
 
-dp = Dispatcher()
+storage = SQLiteStorage()
+dp = Dispatcher(storage=storage, events_isolation=CHAT_WORKERS)
+dp.update.outer_middleware(MessageCleanupMiddleware())
+dp.update.outer_middleware(FSMFlushMiddleware(storage))
+dp.update.outer_middleware(FSMSnapshotMiddleware())
+homework_router.message.middleware(AlbumMiddleware(CHAT_WORKERS))
 dp.include_router(registration_router)
 dp.include_router(homework_router)
+dp.include_router(diagnostics_router)
+dp.include_router(broadcasts_router)
 
 
-async def main():
-    """Start the bot and begin polling.
+async def main(mode: str = BOT_MODE):
+    """Start the bot and receive updates by long polling or, with `mode='webhook'`, on a webhook.
 
     Returns:
         None
     """
     bot = Bot(token=API_KEY, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(RateLimitMiddleware(SEND_SCHEDULER))
     await init_db()
+    await open_db()
+    storage.start()
+    MESSAGE_REGISTRY.start()
+    await resume_template_purges(bot)
+    await resume_broadcasts(bot)
     await bot.set_my_commands(
         [
             BotCommand(command='homework', description='Домашние задания'),
@@ -35,15 +60,31 @@ async def main():
     )
     await bot.set_my_commands(
         [
+            BotCommand(command='announce', description='Объявление студентам'),
             BotCommand(command='assignments', description='Управление заданиями'),
+            BotCommand(command='db_stats', description='Статистика БД'),
             BotCommand(command='homework', description='Домашние задания'),
             BotCommand(command='register', description='Регистрация'),
         ],
         scope=BotCommandScopeChat(chat_id=ADMIN_ID),
     )
-    await dp.start_polling(bot)
+    try:
+        if mode == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            # getUpdates is refused while a webhook from an earlier webhook run is set.
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await wait_for_cleanup()
+        await storage.close()
+        await MESSAGE_REGISTRY.close()
+        await close_db()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the students bot.')
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default=BOT_MODE)
+    args = parser.parse_args()
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    asyncio.run(main(args.mode))
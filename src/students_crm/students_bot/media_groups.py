@@ -0,0 +1,75 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, TelegramObject, Update
+
+from students_crm.students_bot.chat_workers import ChatWorkersIsolation
+
+# Telegram delivers the items of an album within a fraction of a second of each other.
+ALBUM_LATENCY = 0.5
+
+_TASKS: set[asyncio.Task] = set()
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Buffer the messages of one album and hand them to a single call of a handler flagged `album`.
+
+    Register it as an inner message middleware. For a handler declared with `flags={'album': True}`,
+    the first item of a media group waits until no new item arrived for `latency` seconds; the handler
+    then gets the whole album, ordered by message id, as `album`, and the other items are consumed
+    without calling it. Other handlers get every item as usual. With `isolation`, the chat's lane is
+    let go while waiting, since the other items queue behind it. If the chat's state changed in the
+    meantime, the handler no longer matches: the items are fed to the dispatcher again instead.
+    """
+
+    def __init__(self, isolation: ChatWorkersIsolation | None = None, latency: float = ALBUM_LATENCY) -> None:
+        self.isolation = isolation
+        self.latency = latency
+        self._albums: dict[tuple[int, str], list[Update]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or event.media_group_id is None or not get_flag(data, 'album'):
+            return await handler(event, data)
+        key = (event.chat.id, event.media_group_id)
+        updates = self._albums.get(key)
+        if updates is not None:
+            updates.append(data['event_update'])
+            return None
+        updates = self._albums[key] = [data['event_update']]
+        state = data.get('state')
+        matched_state = data.get('raw_state')
+        try:
+            if self.isolation is not None and state is not None:
+                async with self.isolation.released(state.key):
+                    await self._wait_for_items(updates)
+            else:
+                await self._wait_for_items(updates)
+        finally:
+            del self._albums[key]
+        if state is not None and await state.get_state() != matched_state:
+            # Routed on a state another update of the chat has replaced meanwhile.
+            for update in sorted(updates, key=lambda item: item.message.message_id):
+                _refeed(data['dispatcher'], data['bot'], update)
+            return None
+        data['album'] = sorted((update.message for update in updates), key=lambda item: item.message_id)
+        return await handler(event, data)
+
+    async def _wait_for_items(self, updates: list[Update]) -> None:
+        size = 0
+        while size != len(updates):
+            size = len(updates)
+            await asyncio.sleep(self.latency)
+
+
+def _refeed(dispatcher: Dispatcher, bot: Bot, update: Update) -> None:
+    # Queued on the chat's lane behind the current update, in album order.
+    task = asyncio.create_task(dispatcher.feed_update(bot, update), name=f'album-refeed-{update.update_id}')
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
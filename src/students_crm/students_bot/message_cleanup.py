@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject
+
+# deleteMessages accepts at most 100 ids per call.
+DELETE_BATCH_SIZE = 100
+SINGLE_DELETE_CONCURRENCY = 4
+
+_DEFERRED: ContextVar[dict[tuple[Bot, int], dict[int, None]] | None] = ContextVar(
+    'deferred_message_cleanup',
+    default=None,
+)
+_TASKS: set[asyncio.Task] = set()
+
+
+async def _delete_one_by_one(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    semaphore = asyncio.Semaphore(SINGLE_DELETE_CONCURRENCY)
+
+    async def delete(message_id: int) -> None:
+        async with semaphore:
+            try:
+                await bot.delete_message(chat_id, message_id)
+            except Exception:
+                pass
+
+    await asyncio.gather(*(delete(message_id) for message_id in message_ids))
+
+
+async def delete_messages(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """Delete messages with bulk `deleteMessages` calls, deleting one by one when a batch is rejected.
+
+    Messages that are already gone or too old are skipped either way.
+    """
+    for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        batch = message_ids[start : start + DELETE_BATCH_SIZE]
+        try:
+            await bot.delete_messages(chat_id, batch)
+        except TelegramAPIError as exc:
+            logging.log(level=logging.WARNING, msg=exc)
+            await _delete_one_by_one(bot, chat_id, batch)
+
+
+def _start(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    task = asyncio.create_task(delete_messages(bot, chat_id, message_ids), name=f'message-cleanup-{chat_id}')
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+
+
+def schedule_deletion(bot: Bot, chat_id: int, message_ids: list[int]) -> None:
+    """Delete messages in the background once the current update has been handled.
+
+    Outside of `MessageCleanupMiddleware` the deletion starts right away, still in the background.
+    """
+    if not message_ids:
+        return
+    deferred = _DEFERRED.get()
+    if deferred is None:
+        _start(bot, chat_id, list(message_ids))
+        return
+    deferred.setdefault((bot, chat_id), {}).update(dict.fromkeys(message_ids))
+
+
+async def wait_for_cleanup() -> None:
+    """Wait for deletions already started; used on shutdown."""
+    if _TASKS:
+        await asyncio.gather(*_TASKS, return_exceptions=True)
+
+
+class MessageCleanupMiddleware(BaseMiddleware):
+    """Collect deletions scheduled by a handler and start them after it returns, so the new screen goes first."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        deferred: dict[tuple[Bot, int], dict[int, None]] = {}
+        token = _DEFERRED.set(deferred)
+        try:
+            return await handler(event, data)
+        finally:
+            _DEFERRED.reset(token)
+            for (bot, chat_id), message_ids in deferred.items():
+                _start(bot, chat_id, list(message_ids))
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from students_crm.db.routines import list_tracked_messages, save_tracked_messages
+
+MAX_TRACKED_MESSAGES = 200
+MAX_REGISTRY_IDS = 50_000
+FLUSH_INTERVAL = 1.0
+
+
+@dataclass
+class _Chat:
+    # dict keys keep insertion order and give O(1) membership.
+    ids: dict[int, None] = field(default_factory=dict)
+    # True once the persisted ids of this chat are known to be in `ids` as well.
+    complete: bool = False
+
+
+@dataclass(frozen=True)
+class MessageRegistryStats:
+    chats: int
+    tracked_ids: int
+    evicted_chats: int
+    evicted_ids: int
+    pending: int
+
+
+class MessageRegistry:
+    """Ids of bot messages to delete on the next screen change, per chat.
+
+    Each chat keeps at most `max_per_chat` ids. Chats are kept in LRU order, and the least
+    recently used ones are evicted once all chats together hold more than `max_ids` ids.
+    With `persistent`, changes are written to `tracked_messages` in the background every
+    `flush_interval` seconds. Evicted chats and chats seen before a restart are then read
+    back by `take`, so their messages still get cleaned up.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_per_chat: int = MAX_TRACKED_MESSAGES,
+        max_ids: int = MAX_REGISTRY_IDS,
+        persistent: bool = True,
+        flush_interval: float = FLUSH_INTERVAL,
+    ) -> None:
+        self.max_per_chat = max_per_chat
+        self.max_ids = max_ids
+        self.persistent = persistent
+        self.flush_interval = flush_interval
+        self._chats: OrderedDict[int, _Chat] = OrderedDict()
+        self._size = 0
+        self._pending: dict[int, dict[int, None]] = {}
+        self._cleared: set[int] = set()
+        self._task: asyncio.Task | None = None
+        self._evicted_chats = 0
+        self._evicted_ids = 0
+
+    @staticmethod
+    def _weight(chat: _Chat) -> int:
+        # An empty chat still costs an entry.
+        return max(len(chat.ids), 1)
+
+    def _chat(self, chat_id: int) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(complete=not self.persistent)
+            self._size += 1
+        else:
+            self._chats.move_to_end(chat_id)
+        return chat
+
+    def track(self, chat_id: int, message_id: int) -> None:
+        chat = self._chat(chat_id)
+        if message_id in chat.ids:
+            return
+        before = self._weight(chat)
+        chat.ids[message_id] = None
+        if len(chat.ids) > self.max_per_chat:
+            del chat.ids[next(iter(chat.ids))]
+        self._size += self._weight(chat) - before
+        if self.persistent:
+            self._pending.setdefault(chat_id, {})[message_id] = None
+        self._evict()
+
+    def is_tracked(self, chat_id: int, message_id: int) -> bool:
+        chat = self._chats.get(chat_id)
+        return chat is not None and message_id in chat.ids
+
+    async def take(self, chat_id: int) -> list[int]:
+        """Return every tracked id of the chat, oldest first, and forget them."""
+        chat = self._chat(chat_id)
+        ids = dict(chat.ids)
+        if not chat.complete:
+            ids = dict.fromkeys(await list_tracked_messages(chat_id)) | ids
+        ids |= self._pending.pop(chat_id, {})
+        if self.persistent and (ids or not chat.complete):
+            self._cleared.add(chat_id)
+        self._size -= self._weight(chat) - 1
+        chat.ids.clear()
+        chat.complete = True
+        return list(ids)
+
+    def _evict(self) -> None:
+        while self._size > self.max_ids and len(self._chats) > 1:
+            _, chat = self._chats.popitem(last=False)
+            self._size -= self._weight(chat)
+            self._evicted_chats += 1
+            self._evicted_ids += len(chat.ids)
+
+    async def flush(self) -> None:
+        if not self._pending and not self._cleared:
+            return
+        pending, self._pending = self._pending, {}
+        cleared, self._cleared = self._cleared, set()
+        added = [(chat_id, message_id) for chat_id, ids in pending.items() for message_id in ids]
+        result = await save_tracked_messages(added, sorted(cleared), self.max_per_chat)
+        if not result:
+            # Retry with the next flush. A chat taken meanwhile drops the failed additions.
+            for chat_id, ids in pending.items():
+                if chat_id not in self._cleared:
+                    self._pending[chat_id] = ids | self._pending.get(chat_id, {})
+            self._cleared |= cleared
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                logging.log(level=logging.ERROR, msg=exc)
+
+    def start(self) -> None:
+        if self.persistent and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name='message-registry-flush')
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def stats(self) -> MessageRegistryStats:
+        return MessageRegistryStats(
+            chats=len(self._chats),
+            tracked_ids=sum(len(chat.ids) for chat in self._chats.values()),
+            evicted_chats=self._evicted_chats,
+            evicted_ids=self._evicted_ids,
+            pending=sum(len(ids) for ids in self._pending.values()),
+        )
+
+
+MESSAGE_REGISTRY = MessageRegistry()
@@ -9,6 +9,7 @@ from students_crm.db.routines import (
     insert_registration_token,
     validate_token_request,
 )
+from students_crm.students_bot.broadcasts import create_broadcast
 from students_crm.students_bot.sync_utils import generate_invite_code, generate_token_fixed
 from students_crm.utils.constants import (
     ADMIN_ID,
@@ -51,20 +52,31 @@ async def command_whitelist_handler(message: Message) -> None:
 
 @router.message(Command('list_invited'), F.from_user.id == ADMIN_ID)
 async def command_list_invited_handler(message: Message) -> None:
-    """Send reminders to invited users who still need to register."""
+    """Send reminders to invited users who still need to register.
+
+    The reminders go to the admin chat as a resumable broadcast, one message per user.
+    """
     if not _is_private_chat(message):
         await _answer_private_only(message)
         return
 
     users = await get_invited_users()
-    for user in users:
-        await message.answer(
-            text=f"""
+    if not users:
+        await message.answer('Нет приглашенных пользователей без регистрации.')
+        return
+    reminders = [
+        (
+            message.chat.id,
+            f"""
 @{user.tg_username}, пожалуйста, зарегистрируйся с помощью команды <code>/register</code> в @drn_students_bot.
 
 Твой инвайт-код: <code>{user.invite_code}</code>
-"""
+""",
         )
+        for user in users
+    ]
+    if await create_broadcast(message.bot, 'invites', message.chat.id, reminders) is None:
+        await message.answer('Не удалось создать рассылку.')
 
 
 @router.message(Command('register'))
@@ -0,0 +1,99 @@
+import logging
+from dataclasses import dataclass
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from students_crm.students_bot.message_cleanup import schedule_deletion
+from students_crm.students_bot.message_registry import MESSAGE_REGISTRY
+
+SCREEN_MESSAGE_KEY = 'screen_message_id'
+# FSM key under which tracked message ids were kept before `MESSAGE_REGISTRY`.
+LEGACY_TRACKED_KEY = 'ui_message_ids'
+
+
+@dataclass
+class ScreenStats:
+    edits: int = 0
+    unchanged: int = 0
+    sends: int = 0
+    failed_edits: int = 0
+
+
+_STATS = ScreenStats()
+
+
+async def _edit_screen(
+    message: Message,
+    screen_id: int,
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None,
+    **kwargs,
+) -> bool:
+    try:
+        await message.bot.edit_message_text(
+            text=text,
+            chat_id=message.chat.id,
+            message_id=screen_id,
+            reply_markup=reply_markup,
+            **kwargs,
+        )
+    except TelegramBadRequest as exc:
+        if 'message is not modified' in exc.message:
+            _STATS.unchanged += 1
+            return True
+        # Deleted, too old or not a text message: send a fresh screen instead.
+        logging.log(level=logging.WARNING, msg=exc)
+        _STATS.failed_edits += 1
+        return False
+    _STATS.edits += 1
+    return True
+
+
+async def take_tracked_messages(chat_id: int, data: dict) -> list[int]:
+    """Return and forget the chat's tracked message ids, oldest first.
+
+    Ids an older FSM record still keeps under `LEGACY_TRACKED_KEY` are merged in and popped from
+    `data`, so they are read once; the caller writes `data` back.
+    """
+    legacy = data.pop(LEGACY_TRACKED_KEY, None) or []
+    return list(dict.fromkeys(legacy + await MESSAGE_REGISTRY.take(chat_id)))
+
+
+async def show_screen(
+    message: Message,
+    state: FSMContext,
+    text: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+    *,
+    replace: bool = True,
+    **kwargs,
+) -> int:
+    """Show `text` on the chat's screen message, editing it in place when the chat has one.
+
+    With `replace`, every other tracked message of the chat is deleted, so the screen is all
+    that is left. Without it, the screen is sent as a new message below the tracked ones, which
+    stay until the next screen change. Extra keyword arguments (e.g. `parse_mode`) go to
+    `edit_message_text` or `answer`.
+
+    Returns:
+        int: Id of the screen message.
+    """
+    chat_id = message.chat.id
+    data = await state.get_data()
+    screen_id = data.get(SCREEN_MESSAGE_KEY)
+    stale = await take_tracked_messages(chat_id, data) if replace else []
+    if not replace or screen_id is None or not await _edit_screen(message, screen_id, text, reply_markup, **kwargs):
+        sent = await message.answer(text, reply_markup=reply_markup, **kwargs)
+        screen_id = sent.message_id
+        _STATS.sends += 1
+    schedule_deletion(message.bot, chat_id, [message_id for message_id in stale if message_id != screen_id])
+    data[SCREEN_MESSAGE_KEY] = screen_id
+    await state.set_data(data)
+    MESSAGE_REGISTRY.track(chat_id, screen_id)
+    return screen_id
+
+
+def get_screen_stats() -> ScreenStats:
+    return ScreenStats(**vars(_STATS))
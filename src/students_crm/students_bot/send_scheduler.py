@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+# Telegram allows about 30 messages per second overall, about one per second in a private
+# chat (with short bursts) and 20 per minute in a group.
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 10_000
+# Outgoing traffic: sends, edits, copies and forwards. Deletes, answers to callbacks and reads are not limited.
+LIMITED_METHOD_PREFIXES = ('send', 'edit', 'copy', 'forward')
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BULK = 1
+
+
+_PRIORITY: ContextVar[Priority] = ContextVar('send_priority', default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def send_priority(priority: Priority) -> Iterator[None]:
+    """Send every request made inside the block with `priority`, e.g. `Priority.BULK` for broadcasts."""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class _TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available; refills the bucket on the way."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+    def idle(self, now: float) -> bool:
+        return self.delay(now) == 0.0 and self.tokens >= self.burst
+
+
+@dataclass(eq=False)
+class _Waiter:
+    chat_id: int | str | None
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass(frozen=True)
+class SendSchedulerStats:
+    queued: int
+    max_queued: int
+    acquired: int
+    sent: int
+    failed: int
+    delayed: int
+    avg_wait: float
+    max_wait: float
+    retries: int
+
+
+class SendScheduler:
+    """Pace outgoing requests with token buckets, one for the bot and one per chat.
+
+    A request that finds both buckets ready goes out right away. Otherwise it waits in the
+    queue of its priority; interactive requests get free tokens before bulk ones, while a
+    request held back by its own chat does not block requests to other chats. `pause()`
+    stops a chat (or the whole bot) for the `retry_after` of a flood control error.
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = GLOBAL_RATE,
+        global_burst: int = GLOBAL_BURST,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        group_rate: float = GROUP_RATE,
+        group_burst: int = GROUP_BURST,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self._global = _TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats: dict[int | str, _TokenBucket] = {}
+        self._prune_at = MAX_CHAT_BUCKETS
+        self._queues: dict[Priority, deque[_Waiter]] = {priority: deque() for priority in sorted(Priority)}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._max_queued = 0
+        self._acquired = 0
+        self._sent = 0
+        self._failed = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._retries = 0
+
+    def _bucket(self, chat_id: int | str | None, now: float) -> _TokenBucket | None:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._chats = {key: chat for key, chat in self._chats.items() if not chat.idle(now)}
+                self._prune_at = max(MAX_CHAT_BUCKETS, 2 * len(self._chats))
+            # Group and channel ids are negative; usernames only name public groups and channels.
+            private = isinstance(chat_id, int) and chat_id > 0
+            rate, burst = (self.chat_rate, self.chat_burst) if private else (self.group_rate, self.group_burst)
+            bucket = self._chats[chat_id] = _TokenBucket(rate, burst, now)
+        return bucket
+
+    def _try_take(self, chat_id: int | str | None, now: float) -> float:
+        """Take a token from both buckets if they have one; otherwise return how long to wait."""
+        delay = self._global.delay(now)
+        if delay > 0:
+            return delay
+        bucket = self._bucket(chat_id, now)
+        if bucket is not None:
+            delay = bucket.delay(now)
+            if delay > 0:
+                return delay
+            bucket.take()
+        self._global.take()
+        return 0.0
+
+    def _queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, chat_id: int | str | None, priority: Priority = Priority.INTERACTIVE) -> float:
+        """Wait until a request to `chat_id` may go out.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        self._acquired += 1
+        if not self._queued() and self._try_take(chat_id, time.monotonic()) == 0.0:
+            return 0.0
+        started = time.monotonic()
+        waiter = _Waiter(chat_id, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+        self._max_queued = max(self._max_queued, self._queued())
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='send-scheduler')
+        else:
+            self._wakeup.set()
+        try:
+            await waiter.future
+        finally:
+            if not waiter.future.done():
+                waiter.future.cancel()
+        waited = time.monotonic() - started
+        self._delayed += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        return waited
+
+    def _grant(self, now: float) -> float:
+        """Release every waiter the buckets allow, best priority first; return the time to the next try."""
+        wait = math.inf
+        for queue in self._queues.values():
+            for waiter in list(queue):
+                if waiter.future.done():
+                    queue.remove(waiter)
+                    continue
+                delay = self._try_take(waiter.chat_id, now)
+                if delay == 0.0:
+                    queue.remove(waiter)
+                    waiter.future.set_result(None)
+                elif self._global.delay(now) > 0:
+                    # The bot as a whole is out of tokens: nobody else can go either.
+                    return min(wait, delay)
+                else:
+                    wait = min(wait, delay)
+        return wait
+
+    async def _run(self) -> None:
+        try:
+            while self._queued():
+                self._wakeup.clear()
+                wait = self._grant(time.monotonic())
+                if not self._queued():
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=None if math.isinf(wait) else wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._task = None
+
+    def pause(self, chat_id: int | str | None, seconds: float) -> None:
+        """Hold back requests to `chat_id` (all requests if None) for `seconds`."""
+        now = time.monotonic()
+        bucket = self._bucket(chat_id, now) or self._global
+        bucket.pause(now, seconds)
+        self._retries += 1
+
+    def record(self, ok: bool) -> None:
+        """Count an outgoing message Telegram accepted, or one that failed for good."""
+        if ok:
+            self._sent += 1
+        else:
+            self._failed += 1
+
+    def stats(self) -> SendSchedulerStats:
+        return SendSchedulerStats(
+            queued=self._queued(),
+            max_queued=self._max_queued,
+            acquired=self._acquired,
+            sent=self._sent,
+            failed=self._failed,
+            delayed=self._delayed,
+            avg_wait=self._total_wait / self._delayed if self._delayed else 0.0,
+            max_wait=self._max_wait,
+            retries=self._retries,
+        )
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that sends outgoing messages through a `SendScheduler`.
+
+    On a flood control error the chat is paused for `retry_after` and the request is repeated,
+    at most `max_retries` times.
+    """
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = MAX_RETRIES) -> None:
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        limited = method.__api_method__.startswith(LIMITED_METHOD_PREFIXES)
+        chat_id = getattr(method, 'chat_id', None)
+        priority = _PRIORITY.get()
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                await self.scheduler.acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as exc:
+                if attempt == self.max_retries:
+                    if limited:
+                        self.scheduler.record(False)
+                    raise
+                logging.log(level=logging.WARNING, msg=exc)
+                self.scheduler.pause(chat_id, exc.retry_after)
+                if not limited:
+                    await asyncio.sleep(exc.retry_after)
+            except Exception:
+                if limited:
+                    self.scheduler.record(False)
+                raise
+            else:
+                if limited:
+                    self.scheduler.record(True)
+                return response
+
+
+SEND_SCHEDULER = SendScheduler()
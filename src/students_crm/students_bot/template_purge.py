@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from students_crm.db.models import TemplatePurgeProgress
+from students_crm.db.routines import list_pending_template_purges, purge_homework_template
+from students_crm.utils.constants import ADMIN_ID
+
+PROGRESS_INTERVAL = 2.0
+STAGE_LABELS = {
+    'attempts': 'попыток',
+    'assignments': 'выданных заданий',
+    'questions': 'вопросов',
+}
+
+_TASKS: set[asyncio.Task] = set()
+
+
+def _format_progress(template_id: int, deleted: dict[str, int], done: bool) -> str:
+    counts = ', '.join(f'{deleted.get(stage, 0)} {label}' for stage, label in STAGE_LABELS.items())
+    if done:
+        return f'Шаблон #{template_id} очищен: удалено {counts}.'
+    return f'Очистка шаблона #{template_id}: удалено {counts}…'
+
+
+async def _run_purge(bot: Bot, template_id: int, chat_id: int) -> None:
+    deleted: dict[str, int] = {}
+    status = await bot.send_message(chat_id, _format_progress(template_id, deleted, False))
+    last_update = time.monotonic()
+
+    async def report(progress: TemplatePurgeProgress) -> None:
+        nonlocal last_update
+        deleted[progress.stage] = deleted.get(progress.stage, 0) + progress.deleted
+        if progress.done or time.monotonic() - last_update < PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        try:
+            await bot.edit_message_text(
+                _format_progress(template_id, deleted, False),
+                chat_id=chat_id,
+                message_id=status.message_id,
+            )
+        except TelegramAPIError as exc:
+            logging.log(level=logging.WARNING, msg=exc)
+
+    result = await purge_homework_template(template_id, on_progress=report)
+    text = _format_progress(template_id, deleted, True)
+    if not result:
+        text = f'Очистка шаблона #{template_id} прервана: {result.message}'
+    await bot.edit_message_text(text, chat_id=chat_id, message_id=status.message_id)
+
+
+def start_template_purge(bot: Bot, template_id: int, chat_id: int = ADMIN_ID) -> asyncio.Task:
+    """Purge a soft-deleted template in the background, reporting progress to `chat_id`."""
+    task = asyncio.create_task(_run_purge(bot, template_id, chat_id), name=f'template-purge-{template_id}')
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+    return task
+
+
+async def resume_template_purges(bot: Bot) -> None:
+    """Restart purges interrupted by a restart; their templates are still marked deleted."""
+    for template_id in await list_pending_template_purges():
+        start_template_purge(bot, template_id)
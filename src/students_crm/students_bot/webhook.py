@@ -0,0 +1,136 @@
+"""Webhook transport for the bot, plus a fake Telegram update poster for local testing.
+
+Post a message update to a bot running with `--mode webhook` on this machine:
+
+    python -m students_crm.students_bot.webhook --text /homework --user-id 123
+"""
+
+import argparse
+import asyncio
+import logging
+import secrets
+import signal
+import time
+from typing import Any
+
+from aiohttp import ClientSession, web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from students_crm.utils.constants import WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def build_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    handle_in_background: bool = True,
+) -> web.Application:
+    """Return an aiohttp app feeding updates posted to `path` into `dp`.
+
+    Requests without the matching secret token header are answered with 401. The app emits the
+    dispatcher's startup and shutdown hooks as polling does; on shutdown it first waits for the
+    updates still being handled in the background, so storage and DB outlive them.
+    """
+    app = web.Application()
+    handler = SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=handle_in_background,
+    )
+
+    async def finish_updates(_: web.Application) -> None:
+        tasks = set(handler._background_feed_update_tasks)
+        if tasks:
+            logging.log(level=logging.INFO, msg=f'Waiting for {len(tasks)} updates in flight')
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Shutdown callbacks run in this order: in-flight updates, dispatcher hooks, bot session.
+    app.on_shutdown.append(finish_updates)
+    setup_application(app, dp, bot=bot)
+    handler.register(app, path=path)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    base_url: str = WEBHOOK_URL,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    host: str = WEBHOOK_HOST,
+    port: int = WEBHOOK_PORT,
+) -> None:
+    """Serve updates on `host:port` until SIGINT or SIGTERM.
+
+    The webhook is registered at `base_url + path` with only the update types the routers handle.
+    Without `base_url` nothing is registered, so the server only gets what is posted to it locally.
+    Without `secret` a random one is used for this run.
+    """
+    secret = secret or secrets.token_urlsafe(32)
+    app = build_webhook_app(dp, bot, path=path, secret=secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await web.TCPSite(runner, host, port).start()
+        if base_url:
+            await bot.set_webhook(
+                base_url.rstrip('/') + path,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        else:
+            logging.log(level=logging.WARNING, msg='WEBHOOK_URL is empty, the webhook is not registered')
+        logging.log(level=logging.INFO, msg=f'Serving webhook on {host}:{port}{path}')
+        await stop.wait()
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        await runner.cleanup()
+        await bot.session.close()
+
+
+def fake_message_update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    """Build a private chat message update as Telegram would post it."""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': text,
+        },
+    }
+
+
+async def post_fake_update(url: str, update: dict[str, Any], secret: str = WEBHOOK_SECRET) -> int:
+    """Post `update` to a webhook the way Telegram does; returns the HTTP status."""
+    async with ClientSession() as session:
+        async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as response:
+            return response.status
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Post a fake Telegram message update to a local webhook.')
+    parser.add_argument('--text', required=True)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--url', default=f'http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}')
+    parser.add_argument('--secret', default=WEBHOOK_SECRET)
+    args = parser.parse_args(argv)
+    update = fake_message_update(time.time_ns() % 2**31, args.user_id, args.text)
+    print(asyncio.run(post_fake_update(args.url, update, args.secret)))
+
+
+if __name__ == '__main__':
+    main()
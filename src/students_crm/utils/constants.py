@@ -46,6 +46,24 @@ REGISTRATION_RATE_LIMIT_WINDOW = _parse_int(environ.get('REGISTRATION_RATE_LIMIT
 BOT_TOKEN_RATE_LIMIT_COUNT = _parse_int(environ.get('BOT_TOKEN_RATE_LIMIT_COUNT'), 3)
 BOT_TOKEN_RATE_LIMIT_WINDOW = _parse_int(environ.get('BOT_TOKEN_RATE_LIMIT_WINDOW'), 300)
 TRUST_PROXY_HEADERS = _parse_bool(environ.get('TRUST_PROXY_HEADERS'), False)
+DB_POOL_SIZE = _parse_int(environ.get('DB_POOL_SIZE'), 4)
+DB_POOL_HEALTH_CHECK_INTERVAL = _parse_int(environ.get('DB_POOL_HEALTH_CHECK_INTERVAL'), 30)
+DB_READ_POOL_SIZE = _parse_int(environ.get('DB_READ_POOL_SIZE'), 4)
+DB_SLOW_QUERY_MS = _parse_int(environ.get('DB_SLOW_QUERY_MS'), 100)
+DB_WRITE_QUEUE_SIZE = _parse_int(environ.get('DB_WRITE_QUEUE_SIZE'), 256)
+DB_WRITE_BATCH_SIZE = _parse_int(environ.get('DB_WRITE_BATCH_SIZE'), 32)
+DB_PURGE_BATCH_SIZE = _parse_int(environ.get('DB_PURGE_BATCH_SIZE'), 500)
+DB_CACHE_SIZE = _parse_int(environ.get('DB_CACHE_SIZE'), 2048)
+DB_CACHE_POLL_MS = _parse_int(environ.get('DB_CACHE_POLL_MS'), 1000)
+FSM_STATE_TTL_HOURS = _parse_int(environ.get('FSM_STATE_TTL_HOURS'), 168)
+FSM_IDLE_SECONDS = _parse_int(environ.get('FSM_IDLE_SECONDS'), 900)
+BOT_MODE = environ.get('BOT_MODE', 'polling')
+BOT_WORKERS = _parse_int(environ.get('BOT_WORKERS'), 8)
+WEBHOOK_URL = environ.get('WEBHOOK_URL', '')
+WEBHOOK_PATH = environ.get('WEBHOOK_PATH', '/telegram/webhook')
+WEBHOOK_SECRET = environ.get('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = _parse_int(environ.get('WEBHOOK_PORT'), 8080)
 PROVISIONING_STATUS_QUEUED = 'queued'
 PROVISIONING_STATUS_PROCESSING = 'processing'
 PROVISIONING_STATUS_COMPLETED = 'completed'
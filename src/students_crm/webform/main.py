@@ -1,7 +1,9 @@
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 from typing import Any
 from pathlib import Path
 
-from fastapi import FastAPI, Form, Request
+from fastapi import FastAPI, Form, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from asyncio import to_thread
@@ -9,7 +11,20 @@ import logging
 
 from students_crm.utils.security import hash_password
 from students_crm.utils.validate import validate_password, validate_username
-from students_crm.db.routines import register_user, upsert_account_provisioning, validate_token
+from students_crm.db.routines import (
+    close_db,
+    get_cache_invalidation_stats,
+    get_db_cache_stats,
+    get_db_pool_stats,
+    get_db_read_pool_stats,
+    get_db_stats,
+    get_db_writer_stats,
+    init_db,
+    open_db,
+    register_user,
+    upsert_account_provisioning,
+    validate_token,
+)
 from students_crm.provisioner import enqueue_account_request
 from students_crm.utils.constants import (
     DEBUG,
@@ -21,7 +36,19 @@ from students_crm.utils.constants import (
 )
 from students_crm.utils.rate_limit import RateLimiter
 
-app = FastAPI(debug=DEBUG)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # The bot may still be migrating; migrations are versioned, so running them here as well is harmless.
+    await init_db()
+    await open_db()
+    try:
+        yield
+    finally:
+        await close_db()
+
+
+app = FastAPI(debug=DEBUG, lifespan=lifespan)
 templates = Jinja2Templates(directory=str(Path(__file__).with_name('templates')))
 registration_limiter = RateLimiter(REGISTRATION_RATE_LIMIT_COUNT, REGISTRATION_RATE_LIMIT_WINDOW)
 
@@ -48,6 +75,28 @@ def _client_ip(request: Request) -> str:
     return 'unknown'
 
 
+@app.get('/debug/db-stats')
+async def db_stats() -> dict[str, Any]:
+    """Expose database instrumentation counters when running with DEBUG enabled.
+
+    Returns:
+        dict[str, Any]: Routine counters, connection lane and cache stats and recent slow queries.
+    """
+    if not DEBUG:
+        raise HTTPException(status_code=404)
+    pools = {
+        'pool': get_db_pool_stats(),
+        'read_pool': get_db_read_pool_stats(),
+        'writer': get_db_writer_stats(),
+        'cache': get_db_cache_stats(),
+        'invalidation': get_cache_invalidation_stats(),
+    }
+    return {
+        **asdict(get_db_stats()),
+        **{name: asdict(stats) if stats is not None else None for name, stats in pools.items()},
+    }
+
+
 def _render_registration(
     request: Request,
     *,
@@ -1,9 +1,51 @@
+import asyncio
+import sqlite3
+from datetime import datetime
+from types import SimpleNamespace
 import aiosqlite as sql
 import pytest
 import pytest_asyncio
 
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import StateFilter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import DeleteMessage, SendMessage
+from aiogram.types import Chat, Message, Update, User
+from aiohttp import test_utils
+
 import students_crm.db.routines as r
+from students_crm.db.cache import MISSING, CacheStats, VersionedLRUCache
+from students_crm.db.consistency import (
+    check_assignment_counters,
+    check_latest_attempts,
+    rebuild_latest_attempts,
+    refresh_assignment_counters,
+)
+from students_crm.db.migrate import HOT_PATH_INDEXES, run_migrations
+from students_crm.db.models import FsmRecord
+from students_crm.db.pool import ConnectionPool
+from students_crm.db.query_plan import explain
 from students_crm.db.schemas import db_schemas
+from students_crm.db.writer import WriteQueue
+from students_crm.students_bot.broadcasts import start_broadcast
+from students_crm.students_bot.chat_workers import ChatWorkersIsolation
+from students_crm.students_bot.fsm_storage import SnapshotFSMContext, SQLiteStorage
+from students_crm.students_bot.homework import _send_attachments
+import students_crm.students_bot.media_groups as media_groups
+from students_crm.students_bot.media_groups import AlbumMiddleware
+from students_crm.students_bot.message_cleanup import (
+    MessageCleanupMiddleware,
+    delete_messages,
+    schedule_deletion,
+    wait_for_cleanup,
+)
+from students_crm.students_bot.message_registry import MessageRegistry
+import students_crm.students_bot.screens as screens
+from students_crm.students_bot.webhook import build_webhook_app, fake_message_update, post_fake_update
+from students_crm.students_bot.send_scheduler import Priority, RateLimitMiddleware, SendScheduler, send_priority
 
 
 async def _ensure_username_column(db_conn: sql.Connection):
@@ -71,6 +113,35 @@ async def _insert_user(
     await db_conn.commit()
 
 
+async def _insert_assignment(
+    db_conn: sql.Connection,
+    student_tg_id: int = 555,
+    questions: int = 2,
+) -> tuple[int, list[int]]:
+    await _insert_user(db_conn, f'student{student_tg_id}', student_tg_id, f'tg_student{student_tg_id}')
+    cursor = await db_conn.execute("INSERT INTO homework_templates (title, is_published) VALUES ('Template', 1)")
+    template_id = cursor.lastrowid
+    question_ids = []
+    for order_index in range(questions):
+        cursor = await db_conn.execute(
+            """
+            INSERT INTO homework_questions (assignment_id, question_type, text, correct_answer, order_index)
+            VALUES (?, 'short', ?, '42', ?)
+            """,
+            (template_id, f'Question {order_index}', order_index),
+        )
+        question_ids.append(cursor.lastrowid)
+    cursor = await db_conn.execute(
+        """
+        INSERT INTO homework_assignments (template_id, student_tg_id, title, text, soft_deadline, hard_deadline)
+        VALUES (?, ?, 'Template', '', '2030-01-01', '2030-01-02')
+        """,
+        (template_id, student_tg_id),
+    )
+    await db_conn.commit()
+    return cursor.lastrowid, question_ids
+
+
 @pytest_asyncio.fixture
 async def db(tmp_path, monkeypatch):
     db_file = tmp_path / 'mock_students.db'
@@ -80,6 +151,7 @@ async def db(tmp_path, monkeypatch):
         await _ensure_username_column(db_conn)
         await db_conn.commit()
         monkeypatch.setattr(r, 'DB_PATH', db_file.as_posix())
+        monkeypatch.setattr(r, '_CACHE', VersionedLRUCache())
         yield db_conn
 
 
@@ -99,6 +171,453 @@ async def test__with_db_runs_callable(db: sql.Connection):
     assert rows == [('tg_user', 'CODE-1')]
 
 
+@pytest.mark.asyncio
+async def test_open_db_pool_reuses_connections(db: sql.Connection):
+    await _insert_whitelist_entry(db, 'pooled_user', 'POOL-1', used=0)
+    await r.open_db_pool(size=2, db_path=r.DB_PATH)
+    try:
+        first = await r.get_invited_users()
+        second = await r.get_invited_users()
+        stats = r.get_db_pool_stats()
+    finally:
+        await r.close_db_pool()
+
+    assert first == second == [r.Invite(tg_username='pooled_user', invite_code='POOL-1')]
+    assert stats.size == 2
+    assert stats.acquisitions == 2
+    assert r.get_db_pool_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_connection_pool_replaces_unhealthy_connection(db: sql.Connection):
+    pool = ConnectionPool(r.DB_PATH, size=1, health_check_interval=0)
+    await pool.open()
+    try:
+        async with pool.connection() as conn:
+            broken = conn
+        await broken.close()
+        async with pool.connection() as conn:
+            rows = await conn.execute_fetchall('SELECT 1')
+            replacement = conn
+        stats = pool.stats()
+    finally:
+        await pool.close()
+
+    assert replacement is not broken
+    assert list(rows) == [(1,)]
+    assert stats.replaced == 1
+
+
+@pytest.mark.asyncio
+async def test_db_writer_group_commits_concurrent_writes(db: sql.Connection):
+    await r.open_db(db_path=r.DB_PATH)
+    try:
+        results = await asyncio.gather(
+            *(r.add_to_whitelist(f'writer_{idx}', f'CODE-{idx}') for idx in range(10)),
+            r.add_to_whitelist('writer_0', 'CODE-DUP'),
+        )
+        stats = r.get_db_writer_stats()
+    finally:
+        await r.close_db()
+
+    assert all(result.ok for result in results[:10])
+    assert not results[10].ok
+    rows = await db.execute_fetchall('SELECT tg_username, invite_code FROM whitelist ORDER BY tg_username')
+    assert rows == [(f'writer_{idx}', f'CODE-{idx}') for idx in range(10)]
+    assert stats.submitted == 11
+    assert stats.batches < stats.submitted
+    assert stats.rolled_back == 1
+    assert r.get_db_writer_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_db_writer_survives_a_failed_batch_and_fails_fast_once_stopped(db: sql.Connection, monkeypatch):
+    queue = WriteQueue(r.DB_PATH)
+    await queue.start()
+    commit_batch = queue._commit_batch
+
+    async def broken_commit_batch(batch):
+        monkeypatch.setattr(queue, '_commit_batch', commit_batch)
+        raise sqlite3.OperationalError('disk I/O error')
+
+    async def insert(conn, username):
+        await conn.execute('INSERT INTO whitelist (tg_username, invite_code) VALUES (?, ?)', (username, username))
+        return username
+
+    monkeypatch.setattr(queue, '_commit_batch', broken_commit_batch)
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            await asyncio.wait_for(queue.submit(insert, 'lost'), timeout=1)
+        assert await asyncio.wait_for(queue.submit(insert, 'kept'), timeout=1) == 'kept'
+    finally:
+        await queue.stop()
+
+    with pytest.raises(RuntimeError):
+        await queue.submit(insert, 'late')
+    rows = await db.execute_fetchall('SELECT tg_username FROM whitelist')
+    assert list(rows) == [('kept',)]
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_by_query_only_lane(db: sql.Connection):
+    await _insert_whitelist_entry(db, 'reader_user', 'READ-1', used=0)
+    await r.open_db(db_path=r.DB_PATH)
+    try:
+        invited = await r.get_invited_users()
+        read_stats = r.get_db_read_pool_stats()
+        pool_stats = r.get_db_pool_stats()
+        async with r._READ_POOL.connection() as reader:
+            with pytest.raises(sqlite3.OperationalError):
+                await reader.execute("INSERT INTO whitelist (tg_username, invite_code) VALUES ('x', 'y')")
+    finally:
+        await r.close_db()
+
+    assert invited == [r.Invite(tg_username='reader_user', invite_code='READ-1')]
+    assert read_stats.acquisitions == 1
+    assert pool_stats.acquisitions == 0
+    assert r.get_db_read_pool_stats() is None
+
+
+@pytest.mark.asyncio
+async def test_db_stats_track_routines_and_slow_queries(db: sql.Connection, monkeypatch):
+    await _insert_whitelist_entry(db, 'stats_user', 'STATS-1', used=0)
+    r.reset_db_stats()
+    monkeypatch.setattr(r._METRICS, 'slow_query_threshold', 1e-9)
+
+    await r.get_invited_users()
+    await r.get_invited_users()
+    await r.add_to_whitelist('stats_other', 'STATS-2')
+    snapshot = r.get_db_stats()
+    r.reset_db_stats()
+
+    reads = snapshot.routines['get_invited_users']
+    assert reads.calls == 2
+    assert reads.statements == 2
+    assert reads.rows == 2
+    assert snapshot.routines['add_to_whitelist'].calls == 1
+    slow = snapshot.slow_queries[-1]
+    assert slow.routine == 'add_to_whitelist'
+    assert slow.params == '(str, str)'
+    assert slow.sql.startswith('INSERT INTO whitelist')
+
+
+def test_query_plan_explain_flags_scans_through_aliases():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, owner INTEGER, position INTEGER)')
+    conn.execute('CREATE INDEX idx_items_owner ON items(owner)')
+    tables = {'items'}
+
+    scan = explain(conn, 'demo', 'SELECT i.id FROM items i WHERE i.position = ?', (1,), tables)
+    search = explain(conn, 'demo', 'SELECT id FROM items WHERE owner = ? ORDER BY position', (1,), tables)
+
+    assert scan.scans == ['items']
+    assert search.scans == []
+    assert search.temp_btrees == ['USE TEMP B-TREE FOR ORDER BY']
+
+
+@pytest.mark.asyncio
+async def test_record_assignment_attempt_maintains_latest_attempts(db: sql.Connection):
+    assignment_id, (first, second) = await _insert_assignment(db)
+    await refresh_assignment_counters(db)
+    await db.commit()
+
+    assert (await r.get_next_unanswered_question(assignment_id, 555)).id == first
+    await r.record_assignment_attempt(assignment_id, first, 555, 1, 'wrong', 0, 0.0)
+    await r.record_assignment_attempt(assignment_id, first, 555, 2, '42', 1, 1.0)
+    progress = await r.list_assignment_question_progress(assignment_id, 555)
+    latest = await r.get_latest_attempt_for_question(assignment_id, first, 555)
+
+    assert [(item.question_id, item.attempted, item.is_correct) for item in progress] == [
+        (first, 1, 1),
+        (second, 0, None),
+    ]
+    assert (latest.answer_text, latest.attempt_index) == ('42', 2)
+    assert await r.get_attempt_count(assignment_id, first, 555) == 2
+    assert await r.get_assignment_question_counts(assignment_id, 555) == (2, 1)
+    assert (await r.get_next_unanswered_question(assignment_id, 555)).id == second
+    assert (await check_latest_attempts(db)).ok
+
+
+@pytest.mark.asyncio
+async def test_check_latest_attempts_detects_and_repairs_drift(db: sql.Connection):
+    assignment_id, (first, second) = await _insert_assignment(db)
+    await r.record_assignment_attempt(assignment_id, first, 555, 1, '42', 1, 1.0)
+    await db.execute(
+        """
+        INSERT INTO homework_assignment_attempts (assignment_id, question_id, student_tg_id, attempt_index, answer_text)
+        VALUES (?, ?, 555, 1, 'bypassed')
+        """,
+        (assignment_id, second),
+    )
+    await db.execute('UPDATE homework_latest_attempts SET score = 0.5')
+    await db.commit()
+
+    report = await check_latest_attempts(db)
+    assert report.missing == [(assignment_id, 555, second)]
+    assert report.stale == [(assignment_id, 555, first)]
+
+    await rebuild_latest_attempts(db)
+    await db.commit()
+    assert (await check_latest_attempts(db)).ok
+
+
+@pytest.mark.asyncio
+async def test_latest_attempts_migration_backfills_existing_attempts(tmp_path):
+    async with sql.connect(tmp_path / 'backfill.db') as conn:
+        await run_migrations(conn, target_version=9)
+        assignment_id, (question_id, _) = await _insert_assignment(conn)
+        await conn.executemany(
+            """
+            INSERT INTO homework_assignment_attempts (assignment_id, question_id, student_tg_id, attempt_index, answer_text)
+            VALUES (?, ?, 555, ?, ?)
+            """,
+            [(assignment_id, question_id, 1, 'first'), (assignment_id, question_id, 2, 'second')],
+        )
+        await conn.commit()
+        assert await run_migrations(conn, target_version=10) == [10]
+        rows = await conn.execute_fetchall(
+            'SELECT question_id, attempt_index, attempt_count, answer_text FROM homework_latest_attempts'
+        )
+
+    assert list(rows) == [(question_id, 2, 2, 'second')]
+
+
+@pytest.mark.asyncio
+async def test_assignment_counters_follow_attempts_and_questions(db: sql.Connection):
+    _, (first, second) = await _insert_assignment(db, questions=2)
+    rows = await db.execute_fetchall('SELECT assignment_id FROM homework_questions WHERE id = ?', (first,))
+    template_id = rows[0][0]
+    result = await r.assign_template_to_student(template_id, 555, 'Counters', '2030-01-01', '2030-01-02')
+    assignment_id = result.data
+
+    await r.record_assignment_attempt(assignment_id, first, 555, 1, 'wrong', 0, 0.0)
+    await r.record_assignment_attempt(assignment_id, first, 555, 2, '42', 1, 1.0)
+    await r.record_assignment_attempt(assignment_id, second, 555, 1, '42', 1, 2.0)
+    view = await r.get_assignment_view(assignment_id, 555)
+
+    assert (view.question_total, view.answered_count, view.max_attempt_index, view.total_score) == (2, 2, 2, 3.0)
+    assert await r.get_assignment_question_counts(assignment_id, 555) == (2, 2)
+    assert await r.list_assignment_max_attempts(555, [assignment_id]) == {assignment_id: 2}
+
+    await r.add_homework_question(template_id, 'short', 'Question 3', '42')
+    await r.delete_homework_question(second)
+    view = await r.get_assignment_view(assignment_id, 555)
+
+    assert (view.question_total, view.answered_count, view.total_score) == (2, 1, 1.0)
+    assert (await check_assignment_counters(db)).ok
+
+
+@pytest.mark.asyncio
+async def test_get_assignment_screen_bundles_question_data(db: sql.Connection):
+    assignment_id, (first, second) = await _insert_assignment(db)
+    await db.execute("UPDATE homework_questions SET question_type = 'mcq' WHERE id = ?", (second,))
+    await db.execute(
+        "INSERT INTO homework_question_options (question_id, option_text, is_correct, position) VALUES (?, 'a', 1, 0)",
+        (second,),
+    )
+    await db.execute(
+        """
+        INSERT INTO homework_question_attachments (question_id, file_id, file_type, position)
+        VALUES (?, 'f', 'photo', 0)
+        """,
+        (second,),
+    )
+    await db.commit()
+    await r.record_assignment_attempt(assignment_id, first, 555, 1, '42', 1, 1.0)
+
+    screen = await r.get_assignment_screen(assignment_id, 555)
+    chosen = await r.get_assignment_screen(assignment_id, 555, first)
+
+    assert screen.assignment.id == assignment_id
+    assert screen.question.id == second
+    assert [option.option_text for option in screen.options] == ['a']
+    assert [attachment.file_id for attachment in screen.attachments] == ['f']
+    assert screen.attempt_count == 0
+    assert (chosen.question.id, chosen.options, chosen.attempt_count) == (first, [], 1)
+    assert (await r.get_assignment_screen(assignment_id, 555, 10_000)).question is None
+    assert await r.get_assignment_screen(assignment_id, 777) is None
+
+
+@pytest.mark.asyncio
+async def test_check_assignment_counters_detects_drift(db: sql.Connection):
+    assignment_id, (question_id, _) = await _insert_assignment(db)
+    await r.record_assignment_attempt(assignment_id, question_id, 555, 1, '42', 1, 1.0)
+    await db.execute('UPDATE homework_assignments SET answered_count = 5 WHERE id = ?', (assignment_id,))
+    await db.commit()
+
+    report = await check_assignment_counters(db)
+    await refresh_assignment_counters(db)
+
+    assert report.stale == [(assignment_id,)]
+    assert (await check_assignment_counters(db)).ok
+
+
+@pytest.mark.asyncio
+async def test_assignment_counters_migration_backfills_existing_rows(tmp_path):
+    async with sql.connect(tmp_path / 'counters.db') as conn:
+        await run_migrations(conn, target_version=10)
+        assignment_id, (question_id, _) = await _insert_assignment(conn)
+        await conn.execute(
+            """
+            INSERT INTO homework_latest_attempts (
+                assignment_id, student_tg_id, question_id, attempt_id, attempt_index, attempt_count, score
+            ) VALUES (?, 555, ?, 1, 3, 3, 0.5)
+            """,
+            (assignment_id, question_id),
+        )
+        await conn.commit()
+        assert await run_migrations(conn, target_version=11) == [11]
+        rows = await conn.execute_fetchall(
+            'SELECT question_total, answered_count, max_attempt_index, total_score FROM homework_assignments'
+        )
+
+    assert list(rows) == [(2, 1, 3, 0.5)]
+
+
+@pytest.mark.asyncio
+async def test_delete_homework_template_hides_then_purges_in_batches(db: sql.Connection):
+    assignment_id, (first, second) = await _insert_assignment(db)
+    template_id = (await r.get_assignment_view(assignment_id, 555)).template_id
+    await r.record_assignment_attempt(assignment_id, first, 555, 1, 'a', 0, 0.0, attachments=[('f', 'photo')])
+    await r.record_assignment_attempt(assignment_id, first, 555, 2, 'b', 0, 0.0)
+    await r.record_assignment_attempt(assignment_id, second, 555, 1, 'c', 0, 0.0)
+
+    assert not await r.purge_homework_template(template_id)
+    assert await r.delete_homework_template(template_id)
+    assert await r.get_assignment_view(assignment_id, 555) is None
+    assert await r.get_homework_template(template_id) is None
+    assert await r.list_pending_template_purges() == [template_id]
+
+    stages = []
+
+    async def on_progress(progress):
+        stages.append((progress.stage, progress.deleted))
+
+    result = await r.purge_homework_template(template_id, batch_size=2, on_progress=on_progress)
+
+    assert result.data == {'attempts': 3, 'assignments': 1, 'questions': 2, 'template': 1}
+    assert stages == [('attempts', 2), ('attempts', 1), ('assignments', 1), ('questions', 2), ('template', 1)]
+    for table in ('homework_templates', 'homework_latest_attempts', 'homework_attempt_attachments'):
+        assert (await db.execute_fetchall(f'SELECT COUNT(*) FROM {table}'))[0][0] == 0
+    assert await r.list_pending_template_purges() == []
+
+
+def test_versioned_lru_cache_evicts_and_invalidates_by_template():
+    cache = VersionedLRUCache(maxsize=2)
+    cache.put('a', 1, 'A')
+    cache.put('b', 2, 'B')
+    assert cache.get('a') == 'A'
+    cache.put('c', 1, 'C')
+
+    assert cache.get('b') is MISSING
+    cache.bump(1)
+    assert cache.get('a') is MISSING
+    assert cache.get('c') is MISSING
+
+    generation = cache.generation
+    cache.bump(2)
+    cache.put('d', 2, 'D', generation)
+    assert cache.get('d') is MISSING
+    assert cache.stats() == CacheStats(size=0, maxsize=2, hits=1, misses=4, evictions=1, invalidations=2)
+
+
+def test_versioned_lru_cache_forgets_versions_of_tags_without_entries():
+    cache = VersionedLRUCache(maxsize=4)
+    cache.put('live', 'kept', 'value')
+    cache.bump('kept')
+    cache.put('live', 'kept', 'fresh')
+    for tag in range(1000):
+        cache.bump(tag)
+
+    assert len(cache._versions) <= 8
+    assert cache.get('live') == 'fresh'
+    cache.bump('kept')
+    assert cache.get('live') is MISSING
+
+
+@pytest.mark.asyncio
+async def test_homework_content_cache_serves_hits_until_admin_edit(db: sql.Connection):
+    _, (question_id, _) = await _insert_assignment(db)
+    await r.replace_homework_question_options(question_id, ['a', 'b'])
+
+    first = await r.list_homework_question_options(question_id)
+    calls = r.get_db_stats().routines['list_homework_question_options'].calls
+    again = await r.list_homework_question_options(question_id)
+
+    assert again == first
+    assert r.get_db_stats().routines['list_homework_question_options'].calls == calls
+    assert r.get_db_cache_stats().hits >= 2
+
+    await r.replace_homework_question_options(question_id, ['c'])
+    assert [option.option_text for option in await r.list_homework_question_options(question_id)] == ['c']
+    await r.update_homework_question_text(question_id, 'Edited')
+    assert (await r.get_homework_question(question_id)).text == 'Edited'
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_bus_applies_changes_from_other_processes(db: sql.Connection):
+    _, (question_id, _) = await _insert_assignment(db)
+    bus = await r.start_cache_invalidation(interval=0)
+    try:
+        assert (await r.get_homework_question(question_id)).text == 'Question 0'
+        template_id = (await r.get_homework_question(question_id)).assignment_id
+        await db.execute("UPDATE homework_questions SET text = 'Elsewhere' WHERE id = ?", (question_id,))
+        await db.commit()
+        assert (await r.get_homework_question(question_id)).text == 'Question 0'
+
+        await db.execute("INSERT INTO cache_change_log (namespace, key) VALUES ('template', ?)", (template_id,))
+        await db.commit()
+        assert (await r.get_homework_question(question_id)).text == 'Elsewhere'
+        assert bus.stats().changes_seen == 1
+    finally:
+        await r.stop_cache_invalidation()
+
+
+@pytest.mark.asyncio
+async def test_open_db_requires_migrated_database(tmp_path, monkeypatch):
+    db_path = (tmp_path / 'unmigrated.db').as_posix()
+    monkeypatch.setattr(r, 'DB_PATH', db_path)
+    with pytest.raises(RuntimeError):
+        await r.open_db()
+
+    assert r._POOL is None and r._WRITER is None and r._BUS is None
+
+    await r.init_db()
+    await r.open_db()
+    try:
+        assert r.get_cache_invalidation_stats() is not None
+    finally:
+        await r.close_db()
+
+
+@pytest.mark.asyncio
+async def test_student_changes_notify_subscribers_and_log(db: sql.Connection, monkeypatch):
+    assignment_id, question_ids = await _insert_assignment(db, student_tg_id=777)
+    monkeypatch.setattr(r, '_SUBSCRIBERS', list(r._SUBSCRIBERS))
+    changed: list[int | None] = []
+    r.subscribe_cache_invalidation('student', changed.append)
+
+    await r.record_assignment_attempt(assignment_id, question_ids[0], 777, 1, '42', 1, 1.0)
+    await r.set_assignment_status(assignment_id, 'На проверке')
+
+    assert changed == [777, 777]
+    rows = await db.execute_fetchall("SELECT key FROM cache_change_log WHERE namespace = 'student'")
+    assert [row[0] for row in rows] == [777, 777]
+
+
+@pytest.mark.asyncio
+async def test_rejected_writes_neither_log_nor_notify_changes(db: sql.Connection, monkeypatch):
+    monkeypatch.setattr(r, '_SUBSCRIBERS', list(r._SUBSCRIBERS))
+    changed: list[int | None] = []
+    r.subscribe_cache_invalidation('template', changed.append)
+
+    result = await r.delete_homework_template(12345)
+
+    assert not result.ok
+    assert changed == []
+    assert await db.execute_fetchall('SELECT COUNT(*) FROM cache_change_log') == [(0,)]
+
+
 @pytest.mark.asyncio
 async def test__init_db_creates_missing_tables(db: sql.Connection):
     for table in (
@@ -132,6 +651,21 @@ async def test__init_db_creates_missing_tables(db: sql.Connection):
     }.issubset(tables)
 
 
+@pytest.mark.asyncio
+async def test_run_migrations_creates_hot_path_indexes(tmp_path):
+    async with sql.connect(tmp_path / 'migrated.db') as conn:
+        assert await run_migrations(conn, target_version=8) == list(range(1, 9))
+        before = {row[0] for row in await conn.execute_fetchall("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert await run_migrations(conn, target_version=9) == [9]
+        after = {row[0] for row in await conn.execute_fetchall("SELECT name FROM sqlite_master WHERE type='index'")}
+
+    assert 'idx_attempts_assignment_student' in before
+    assert 'idx_attempts_assignment_student' not in after
+    assert {
+        name for indexes in HOT_PATH_INDEXES.values() for name, _ in indexes
+    }.issubset(after)
+
+
 @pytest.mark.asyncio
 async def test_init_db_wrapper_uses_helper(db: sql.Connection):
     for table in (
@@ -426,3 +960,475 @@ async def test_get_tg_user_id_helpers_return_result(db: sql.Connection):
     assert by_tg.data == 9001
     assert by_username.ok is True
     assert by_username.data == 9001
+
+
+@pytest.mark.asyncio
+async def test_fsm_records_round_trip_and_expire(db: sql.Connection):
+    result = await r.save_fsm_records(
+        [FsmRecord('fsm:1:2:2', 'StudentAnswerStates:in_assignment', '{"a": 1}'), FsmRecord('fsm:1:3:3', None, '{}')]
+    )
+    assert result.ok is True
+    record = await r.get_fsm_record('fsm:1:2:2')
+    assert record == FsmRecord('fsm:1:2:2', 'StudentAnswerStates:in_assignment', '{"a": 1}')
+    assert await r.get_fsm_record('fsm:1:3:3') is None
+
+    await r.save_fsm_records([FsmRecord('fsm:1:2:2', None, '{}')])
+    assert await r.get_fsm_record('fsm:1:2:2') is None
+
+    await r.save_fsm_records([FsmRecord('fsm:1:4:4', 'S:s', '{}')])
+    await db.execute("UPDATE fsm_storage SET updated_at = datetime('now', '-8 days')")
+    await db.commit()
+    assert (await r.delete_stale_fsm_records(168)).data == 1
+
+
+@pytest.mark.asyncio
+async def test_sqlite_fsm_storage_coalesces_writes_and_survives_restart(db: sql.Connection):
+    key = StorageKey(bot_id=1, chat_id=2, user_id=2)
+    storage = SQLiteStorage()
+    await storage.set_state(key, 'StudentAnswerStates:in_assignment')
+    await storage.update_data(key, {'active_assignment_id': 5})
+    await storage.update_data(key, {'current_question_id': 7})
+    assert await db.execute_fetchall('SELECT COUNT(*) FROM fsm_storage') == [(0,)]
+
+    await storage.flush(key)
+    assert storage.stats().flushes == 1
+    assert storage.stats().records_written == 1
+
+    restarted = SQLiteStorage(idle_seconds=0)
+    assert await restarted.get_state(key) == 'StudentAnswerStates:in_assignment'
+    assert await restarted.get_data(key) == {'active_assignment_id': 5, 'current_question_id': 7}
+    await restarted.cleanup()
+    assert restarted.stats().cached == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_fsm_storage_refuses_data_it_cannot_persist(db: sql.Connection):
+    key = StorageKey(bot_id=1, chat_id=4, user_id=4)
+    storage = SQLiteStorage()
+    await storage.update_data(key, {'page': 1})
+    with pytest.raises(ValueError):
+        await storage.update_data(key, {'deadline': datetime(2025, 1, 1)})
+    assert await storage.get_data(key) == {'page': 1}
+
+    await storage.flush(key)
+    assert await db.execute_fetchall('SELECT data FROM fsm_storage') == [('{"page": 1}',)]
+
+    other = StorageKey(bot_id=1, chat_id=5, user_id=5)
+    (await storage._entry(other)).data['deadline'] = datetime(2025, 1, 1)
+    await storage.set_state(other, 'StudentAnswerStates:in_assignment')
+    await storage.flush(other)
+    assert storage.stats().dirty == 1
+    assert await db.execute_fetchall('SELECT COUNT(*) FROM fsm_storage') == [(1,)]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_fsm_context_writes_back_once_and_only_on_change(db: sql.Connection):
+    key = StorageKey(bot_id=1, chat_id=3, user_id=3)
+    storage = SQLiteStorage()
+    snapshot = SnapshotFSMContext(storage, key)
+    await snapshot.update_data(selected_ids=[10])
+    await snapshot.update_data(selected_ids=[10, 11], page=1)
+    assert await snapshot.get_value('page') == 1
+    assert storage.stats().dirty == 0
+
+    assert await snapshot.commit() is True
+    assert await storage.get_data(key) == {'selected_ids': [10, 11], 'page': 1}
+
+    unchanged = SnapshotFSMContext(storage, key)
+    await unchanged.update_data(page=1)
+    assert await unchanged.commit() is False
+
+
+@pytest.mark.asyncio
+async def test_message_registry_persists_and_evicts_idle_chats(db: sql.Connection):
+    registry = MessageRegistry(max_per_chat=3, max_ids=3)
+    for message_id in range(1, 5):
+        registry.track(100, message_id)
+    assert registry.is_tracked(100, 4) and not registry.is_tracked(100, 1)
+    registry.track(200, 1)
+    assert registry.stats().evicted_chats == 1
+    await registry.flush()
+
+    restarted = MessageRegistry(max_per_chat=3)
+    assert await restarted.take(100) == [2, 3, 4]
+    await restarted.flush()
+    assert await restarted.take(100) == []
+    assert await db.execute_fetchall('SELECT chat_id, message_id FROM tracked_messages') == [(200, 1)]
+
+
+class _FakeDeletingBot:
+    def __init__(self, reject_bulk: bool = False):
+        self.reject_bulk = reject_bulk
+        self.bulk_calls: list[list[int]] = []
+        self.single_calls: list[int] = []
+
+    async def delete_messages(self, chat_id: int, message_ids: list[int]) -> bool:
+        self.bulk_calls.append(message_ids)
+        if self.reject_bulk:
+            raise TelegramBadRequest(method=None, message='method not found')
+        return True
+
+    async def delete_message(self, chat_id: int, message_id: int) -> bool:
+        self.single_calls.append(message_id)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_message_cleanup_batches_falls_back_and_waits_for_handler():
+    bot = _FakeDeletingBot()
+    await delete_messages(bot, 1, list(range(250)))
+    assert [len(batch) for batch in bot.bulk_calls] == [100, 100, 50]
+
+    rejecting = _FakeDeletingBot(reject_bulk=True)
+    await delete_messages(rejecting, 1, [1, 2, 3])
+    assert sorted(rejecting.single_calls) == [1, 2, 3]
+
+    deferred = _FakeDeletingBot()
+
+    async def handler(event, data):
+        schedule_deletion(deferred, 1, [5, 6])
+        schedule_deletion(deferred, 1, [6, 7])
+        await asyncio.sleep(0)
+        assert deferred.bulk_calls == []
+
+    await MessageCleanupMiddleware()(handler, None, {})
+    await wait_for_cleanup()
+    assert deferred.bulk_calls == [[5, 6, 7]]
+
+
+class _FakeScreenBot(_FakeDeletingBot):
+    def __init__(self):
+        super().__init__()
+        self.edits: list[tuple[int, str]] = []
+        self.sent: list[str] = []
+        self.gone: set[int] = set()
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int, **kwargs) -> bool:
+        if message_id in self.gone:
+            raise TelegramBadRequest(method=None, message='Bad Request: message to edit not found')
+        if self.edits and self.edits[-1] == (message_id, text):
+            raise TelegramBadRequest(method=None, message='Bad Request: message is not modified')
+        self.edits.append((message_id, text))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_show_screen_edits_in_place_and_falls_back_to_sending(monkeypatch):
+    monkeypatch.setattr(screens, 'MESSAGE_REGISTRY', MessageRegistry(persistent=False))
+    bot = _FakeScreenBot()
+    next_id = iter(range(100, 200))
+
+    async def answer(text, **kwargs):
+        bot.sent.append(text)
+        return SimpleNamespace(message_id=next(next_id))
+
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), bot=bot, answer=answer)
+    state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+    # A record from before the registry: its ids are read once and dropped from the FSM data.
+    await state.update_data(ui_message_ids=[7])
+    screens.MESSAGE_REGISTRY.track(1, 8)
+
+    first = await screens.show_screen(message, state, 'list')
+    second = await screens.show_screen(message, state, 'report')
+    await screens.show_screen(message, state, 'report')
+    await wait_for_cleanup()
+    assert first == second == 100
+    assert bot.sent == ['list'] and bot.edits == [(100, 'report')]
+    assert bot.bulk_calls == [[7, 8]]
+    assert await state.get_data() == {screens.SCREEN_MESSAGE_KEY: 100}
+
+    bot.gone.add(100)
+    third = await screens.show_screen(message, state, 'panel')
+    await screens.show_screen(message, state, 'below', replace=False)
+    await wait_for_cleanup()
+    assert third == 101 and bot.sent == ['list', 'panel', 'below']
+    assert bot.bulk_calls == [[7, 8], [100]]
+    assert (await state.get_value(screens.SCREEN_MESSAGE_KEY)) == 102
+    assert await screens.MESSAGE_REGISTRY.take(1) == [101, 102]
+
+
+@pytest.mark.asyncio
+async def test_send_scheduler_orders_by_priority_and_retries_after_flood():
+    scheduler = SendScheduler(global_rate=50, global_burst=1, chat_rate=50, chat_burst=1)
+    order: list[str] = []
+
+    async def send(name: str, chat_id: int, priority: Priority) -> None:
+        await scheduler.acquire(chat_id, priority)
+        order.append(name)
+
+    await scheduler.acquire(1)
+    await asyncio.gather(
+        send('bulk-1', 2, Priority.BULK),
+        send('bulk-2', 3, Priority.BULK),
+        send('reply', 4, Priority.INTERACTIVE),
+    )
+    assert order == ['reply', 'bulk-1', 'bulk-2']
+    stats = scheduler.stats()
+    assert stats.acquired == 4 and stats.delayed == 3 and stats.max_queued == 3 and stats.queued == 0
+
+    calls: list[str] = []
+
+    async def make_request(bot, method):
+        calls.append(method.__api_method__)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=method, message='Too Many Requests', retry_after=0)
+        return True
+
+    middleware = RateLimitMiddleware(scheduler)
+    with send_priority(Priority.BULK):
+        assert await middleware(make_request, None, SendMessage(chat_id=5, text='hi')) is True
+    assert await middleware(make_request, None, DeleteMessage(chat_id=5, message_id=1)) is True
+    assert calls == ['sendMessage', 'sendMessage', 'deleteMessage']
+
+    async def rejected_request(bot, method):
+        raise TelegramBadRequest(method=method, message='Bad Request: chat not found')
+
+    with pytest.raises(TelegramBadRequest):
+        await middleware(rejected_request, None, SendMessage(chat_id=6, text='hi'))
+    stats = scheduler.stats()
+    assert stats.retries == 1 and stats.acquired == 7
+    assert stats.sent == 1 and stats.failed == 1
+
+
+@pytest.mark.asyncio
+async def test_send_attachments_groups_files_into_albums(monkeypatch):
+    registry = MessageRegistry(persistent=False)
+    monkeypatch.setattr('students_crm.students_bot.homework.MESSAGE_REGISTRY', registry)
+    chat = SimpleNamespace(id=1)
+    next_id = iter(range(100, 200))
+    calls: list[tuple[str, int]] = []
+
+    def sent_message():
+        return SimpleNamespace(message_id=next(next_id), chat=chat)
+
+    async def answer_media_group(media):
+        calls.append(('album', len(media)))
+        return [sent_message() for _ in media]
+
+    async def answer_document(file_id):
+        calls.append(('document', 1))
+        return sent_message()
+
+    message = SimpleNamespace(chat=chat, answer_media_group=answer_media_group, answer_document=answer_document)
+    state = FSMContext(MemoryStorage(), StorageKey(bot_id=1, chat_id=1, user_id=1))
+    attachments = [SimpleNamespace(file_id=f'p{index}', file_type='photo') for index in range(12)]
+    attachments.append(SimpleNamespace(file_id='d0', file_type='document'))
+
+    await _send_attachments(message, attachments, state=state)
+    assert calls == [('album', 10), ('album', 2), ('document', 1)]
+    assert await registry.take(1) == list(range(100, 113))
+
+
+@pytest.mark.asyncio
+async def test_album_middleware_batches_only_for_handlers_flagged_album():
+    isolation = ChatWorkersIsolation(workers=1)
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    router = Router()
+    router.message.middleware(AlbumMiddleware(isolation, latency=0.05))
+    calls: list[list[int]] = []
+
+    @router.message(F.caption == 'batched', flags={'album': True})
+    async def on_album(message: Message, album: list[Message] | None = None) -> None:
+        calls.append([item.message_id for item in album or [message]])
+
+    @router.message()
+    async def on_message(message: Message) -> None:
+        calls.append([message.message_id])
+
+    dp.include_router(router)
+    chat = Chat(id=1, type='private')
+    user = User(id=1, is_bot=False, first_name='Test')
+
+    def update(message_id: int, media_group_id: str | None, caption: str | None = None) -> Update:
+        message = Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=chat,
+            from_user=user,
+            media_group_id=media_group_id,
+            caption=caption,
+        )
+        return Update(update_id=message_id, message=message)
+
+    bot = Bot(token='42:TEST')
+    await asyncio.gather(
+        dp.feed_update(bot, update(12, 'g', 'batched')),
+        dp.feed_update(bot, update(11, 'g', 'batched')),
+        dp.feed_update(bot, update(13, 'g', 'batched')),
+        dp.feed_update(bot, update(21, 'h')),
+        dp.feed_update(bot, update(22, 'h')),
+    )
+    await bot.session.close()
+    assert sorted(calls) == [[11, 12, 13], [21], [22]]
+    assert all(lane.depth == 0 for lane in isolation.stats())
+
+
+@pytest.mark.asyncio
+async def test_album_middleware_reroutes_an_album_whose_state_changed_while_waiting():
+    isolation = ChatWorkersIsolation(workers=1)
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    router = Router()
+    router.message.middleware(AlbumMiddleware(isolation, latency=0.05))
+    calls: list[tuple[str, list[int]]] = []
+
+    @router.message(StateFilter('collecting'), F.media_group_id, flags={'album': True})
+    async def on_album(message: Message, album: list[Message] | None = None) -> None:
+        calls.append(('collecting', [item.message_id for item in album or [message]]))
+
+    @router.message(F.text == 'cancel')
+    async def on_cancel(message: Message, state: FSMContext) -> None:
+        await state.set_state('idle')
+
+    @router.message(StateFilter('idle'))
+    async def on_idle(message: Message) -> None:
+        calls.append(('idle', [message.message_id]))
+
+    dp.include_router(router)
+    chat = Chat(id=1, type='private')
+    user = User(id=1, is_bot=False, first_name='Test')
+
+    def update(message_id: int, media_group_id: str | None = None, text: str | None = None) -> Update:
+        message = Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=chat,
+            from_user=user,
+            media_group_id=media_group_id,
+            text=text,
+        )
+        return Update(update_id=message_id, message=message)
+
+    bot = Bot(token='42:TEST')
+    await dp.fsm.get_context(bot, chat_id=1, user_id=1).set_state('collecting')
+    await asyncio.gather(
+        dp.feed_update(bot, update(11, 'g')),
+        dp.feed_update(bot, update(12, 'g')),
+        dp.feed_update(bot, update(20, text='cancel')),
+    )
+    while media_groups._TASKS:
+        await asyncio.sleep(0.01)
+    await bot.session.close()
+    assert calls == [('idle', [11]), ('idle', [12])]
+
+
+@pytest.mark.asyncio
+async def test_webhook_app_checks_secret_and_feeds_updates():
+    dp = Dispatcher()
+    events: list[str] = []
+
+    @dp.message()
+    async def on_message(message: Message) -> None:
+        await asyncio.sleep(0.05)
+        events.append(message.text)
+
+    @dp.startup()
+    async def on_startup() -> None:
+        events.append('startup')
+
+    @dp.shutdown()
+    async def on_shutdown() -> None:
+        events.append('shutdown')
+
+    bot = Bot(token='42:TEST')
+    app = build_webhook_app(dp, bot, path='/hook', secret='s3cret')
+    async with test_utils.TestServer(app) as server:
+        url = str(server.make_url('/hook'))
+        assert await post_fake_update(url, fake_message_update(1, 7, '/homework'), secret='wrong') == 401
+        assert await post_fake_update(url, fake_message_update(2, 7, '/homework'), secret='s3cret') == 200
+    await bot.session.close()
+    # The update was still being handled in the background when the server began to shut down.
+    assert events == ['startup', '/homework', 'shutdown']
+    assert dp.resolve_used_update_types() == ['message']
+
+
+@pytest.mark.asyncio
+async def test_chat_workers_keep_chat_order_and_run_lanes_in_parallel():
+    isolation = ChatWorkersIsolation(workers=2)
+    events: list[str] = []
+
+    async def handle(name: str, chat_id: int) -> None:
+        async with isolation.lock(StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)):
+            events.append(f'start {name}')
+            await asyncio.sleep(0.01)
+            events.append(f'end {name}')
+
+    # Chats 1 and 3 share a lane, chat 2 has the other one.
+    await asyncio.gather(handle('a1', 1), handle('b3', 3), handle('c2', 2), handle('d1', 1))
+    assert events[:2] == ['start a1', 'start c2']
+    assert events.index('end a1') < events.index('start b3') < events.index('end b3') < events.index('start d1')
+    stats = isolation.stats()
+    assert [lane.handled for lane in stats] == [1, 3]
+    assert stats[1].max_depth == 3 and all(lane.depth == 0 for lane in stats)
+
+
+@pytest.mark.asyncio
+async def test_chat_workers_let_the_next_update_see_the_state_just_written():
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=ChatWorkersIsolation(workers=2))
+    seen: list[str | None] = []
+
+    @dp.message()
+    async def on_message(message: Message, state: FSMContext, raw_state: str | None) -> None:
+        seen.append(raw_state)
+        await asyncio.sleep(0.01)
+        await state.set_state(message.text)
+
+    def update(update_id: int, text: str) -> Update:
+        user = User(id=5, is_bot=False, first_name='Test')
+        chat = Chat(id=5, type='private')
+        return Update(
+            update_id=update_id,
+            message=Message(message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text=text),
+        )
+
+    bot = Bot(token='42:TEST')
+    await asyncio.gather(dp.feed_update(bot, update(1, 'first')), dp.feed_update(bot, update(2, 'second')))
+    await bot.session.close()
+    assert seen == [None, 'first']
+
+
+class _FakeBroadcastBot:
+    def __init__(self, blocked: set[int]):
+        self.blocked = blocked
+        self.sent: list[tuple[int, str]] = []
+        self.edits: list[str] = []
+
+    async def send_message(self, chat_id: int, text: str):
+        if chat_id in self.blocked:
+            raise TelegramBadRequest(method=None, message='Forbidden: bot was blocked by the user')
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int):
+        self.edits.append(text)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_resumes_from_cursor_and_reports_counts(db: sql.Connection):
+    recipients = [(chat_id, None) for chat_id in range(10, 15)] + [(99, 'own text')]
+    created = await r.create_broadcast_job('announcement', 'hello', 1, recipients)
+    # Pretend the first two recipients were handled before a restart.
+    assert await r.advance_broadcast_job(created.data, 2, 2, 0)
+    assert await r.list_unfinished_broadcast_jobs() == [created.data]
+
+    bot = _FakeBroadcastBot(blocked={13})
+    await start_broadcast(bot, created.data)
+    assert bot.sent[1:] == [(12, 'hello'), (14, 'hello'), (99, 'own text')]
+    assert bot.edits[-1].endswith('доставлено 5, не доставлено 1 из 6.')
+    job = await r.get_broadcast_job(created.data)
+    assert (job.cursor, job.delivered, job.failed) == (6, 5, 1) and job.finished_at is not None
+    assert await r.list_unfinished_broadcast_jobs() == []
+    assert await db.execute_fetchall('SELECT * FROM broadcast_recipients') == []
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reports_a_stop_to_the_report_chat(db: sql.Connection, monkeypatch):
+    created = await r.create_broadcast_job('announcement', 'hello', 1, [(10, None), (11, None)])
+
+    async def broken_advance(*args, **kwargs):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr('students_crm.students_bot.broadcasts.advance_broadcast_job', broken_advance)
+    bot = _FakeBroadcastBot(blocked=set())
+    await start_broadcast(bot, created.data)
+    assert bot.sent[-1][0] == 1 and bot.sent[-1][1].startswith(f'Рассылка #{created.data} остановлена')
+    assert await r.list_unfinished_broadcast_jobs() == [created.data]